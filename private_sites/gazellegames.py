@@ -66,23 +66,29 @@ class gazellegames(object):
                 "desc_link": "https://gazellegames.net/user.php?action=edit"}
         prettyPrinter(line)
 
+    # authkey + torrent_pass, looked up once per instance (instances live
+    # across searches when served by the engine daemon)
+    user_result = None
+
     # DO NOT CHANGE the name and parameters of this function
     # This function will be the one called by nova2.py
     def search(self, what, cat="all"):
         # retrieve the authkey + torrent_pass
-        opener = request.build_opener()
-        opener.addheaders = [("X-API-Key", self.token)]
-        try:
-            with opener.open("%s/api.php?request=quick_user" % self.url) as f:
-                result_text = f.read().decode('utf-8')
-        except error.URLError as e:
-            result_text = e.read().decode('utf-8')
+        if self.user_result is None:
+            opener = request.build_opener()
+            opener.addheaders = [("X-API-Key", self.token)]
+            try:
+                with opener.open("%s/api.php?request=quick_user" % self.url) as f:
+                    result_text = f.read().decode('utf-8')
+            except error.URLError as e:
+                result_text = e.read().decode('utf-8')
 
-        user_result = loads(result_text)
-        if "error" in user_result.keys():
-            self.error_handler(parse.unquote(what), user_result["error"])
-            return
-        user_result = user_result["response"]
+            user_result = loads(result_text)
+            if "error" in user_result.keys():
+                self.error_handler(parse.unquote(what), user_result["error"])
+                return
+            self.user_result = user_result["response"]
+        user_result = self.user_result
         authkey = user_result["authkey"]
         torrent_pass = user_result["passkey"]
 
@@ -133,3 +139,11 @@ class gazellegames(object):
                             "engine_url": self.url,
                             "desc_link": "%s/torrents.php?id=%s&torrentid=%s" % (self.url, t["GroupID"], t["ID"])}
                     prettyPrinter(line)
+
+
+try:
+    # Forward to the warm engine daemon when it is running
+    from qbt_common.daemon import served
+    gazellegames = served(gazellegames)
+except ImportError:
+    pass
@@ -3,40 +3,229 @@
 
 # Kinozal.tv search engine plugin for qBittorrent
 
-import base64
-import gzip
-import json
-import logging
 import re
-import socket
 import sys
 import time
-from concurrent.futures.thread import ThreadPoolExecutor
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 from html import unescape
-from http.cookiejar import MozillaCookieJar
 from pathlib import Path
-from tempfile import NamedTemporaryFile
-from typing import Any, Callable, Optional, Union
-from urllib.error import HTTPError, URLError
-from urllib.parse import quote, unquote, urlencode, urlparse
-from urllib.request import HTTPCookieProcessor, ProxyHandler, build_opener
+from typing import Any, Callable, ClassVar, Iterable, Optional
+from urllib.parse import quote, unquote, urlencode
 
 try:
-    import socks
     from novaprinter import prettyPrinter
 except ImportError:
     sys.path.insert(0, str(Path(__file__).parent.parent.absolute()))
-    import socks
     from novaprinter import prettyPrinter
 
-FILE = Path(__file__)
-BASEDIR = FILE.parent.absolute()
+try:
+    from qbt_common.imdmg import Config as BaseConfig
+    from qbt_common.imdmg import Engine, EngineError
+except ImportError:
+    # a single-file install: the hooks of qbt_common.imdmg.Engine, one
+    # request at a time and no retries
+    import base64
+    import gzip
+    import json
+    import logging
+    import os
+    import socket
+    from dataclasses import field
+    from http.cookiejar import LoadError, MozillaCookieJar
+    from tempfile import NamedTemporaryFile
+    from urllib.error import URLError
+    from urllib.parse import urlparse
+    from urllib.request import HTTPCookieProcessor, ProxyHandler, build_opener
+
+    class EngineError(Exception): ...
+
+    @dataclass
+    class BaseConfig:
+        proxy: bool = False
+        proxies: dict = field(default_factory=lambda: {"http": "", "https": ""})
+        ua: str = "Mozilla/5.0 (X11; Linux i686; rv:38.0) Gecko/20100101 Firefox/38.0 "
+        workers: int = 4
+        page_budget: int = 0
+
+        def load(self, path: Path, icon: str) -> "BaseConfig":
+            keys = {
+                "".join(x.title() if i else x for i, x in enumerate(k.split("_"))): k
+                for k in vars(self)
+            }
+            try:
+                saved = json.loads(path.read_text())
+                for key, name in keys.items():
+                    if isinstance(saved.get(key), type(getattr(self, name))):
+                        setattr(self, name, saved[key])
+            except Exception:
+                path.write_text(json.dumps({k: getattr(self, n) for k, n in keys.items()}, indent=4))
+                try:
+                    path.with_suffix(".ico").write_bytes(base64.b64decode(icon))
+                except ValueError:
+                    pass
+            return self
+
+    class Engine:
+        url_dl = ""
+        supported_categories: dict = {"all": "-1"}
+        config_class = BaseConfig
+        icon = ""
+        patterns = ("%stracker.php?nm=%s&c=%s", "%s&start=%s")
+        page_size, page_offsets, encoding = 50, True, "utf-8"
+        session_cookie: Optional[str] = None
+        headers: dict = {}
+        file_j, file_c, file_l = (
+            Path(__file__).absolute().with_suffix(ext) for ext in (".json", ".cookie", ".log")
+        )
+        logger = logging.getLogger(__name__)
+        mcj = MozillaCookieJar()
+        session: Any = None
+        config: Any = None
+
+        def search(self, what: str, cat: str = "all") -> None:
+            self._catch_errors(self._search, what, cat)
+
+        def download_torrent(self, url: str) -> None:
+            self._catch_errors(self._download_torrent, url)
+
+        def has_session(self) -> bool:
+            return self.session_cookie in [cookie.name for cookie in self.mcj]
+
+        def save_cookies(self) -> None:
+            os.close(os.open(self.file_c, os.O_WRONLY | os.O_CREAT, 0o600))
+            self.mcj.save(str(self.file_c), ignore_discard=True, ignore_expires=True)
+
+        def check_session(self, page: str, query: str) -> str:
+            return page
+
+        def search_url(self, what: str, cat: str) -> str:
+            return self.patterns[0] % (self.url, quote(unquote(what)), self.supported_categories[cat])
+
+        def rng(self, total: int) -> range:
+            pages = -(-total // self.page_size)
+            if self.page_offsets:
+                return range(self.page_size, pages * self.page_size, self.page_size)
+            return range(1, pages)
+
+        def page_urls(self, query: str, total: int) -> list:
+            return [self.patterns[1] % (query, x) for x in self.rng(total)]
+
+        def count(self, page: str) -> int:
+            match = self.re_results.search(page)
+            if match is None:
+                raise EngineError("Unexpected page content")
+            return int(match[1] or 0)
+
+        def rows(self, tors: Iterable) -> list:
+            return [row for row in map(self.row, tors) if row is not None]
+
+        def pub_date(self, date_str: str) -> int:
+            return self.parse_date(date_str, time.time())
+
+        def parse_date(self, date_str: str, now: float) -> int:
+            return int(date_str)
+
+        def searching(self, query: str, first: bool = False) -> int:
+            page, total = self._request(query).decode(self.encoding, "ignore"), -1
+            if first:
+                page = self.check_session(page, query)
+                total = self.count(page)
+                if total == 0:
+                    return 0
+            for row in self.rows(self.re_torrents.finditer(page)):
+                prettyPrinter(row)
+            return total
+
+        def _catch_errors(self, handler: Callable, *args: str) -> None:
+            try:
+                self._init()
+                handler(*args)
+            except Exception as ex:
+                self.logger.exception(ex)
+                unexpected = not isinstance(ex, EngineError)
+                self.pretty_error(args[0], "Unexpected error, please check logs" if unexpected else str(ex))
+
+        def _init(self) -> None:
+            if self.session is None:
+                logging.basicConfig(filemode="w", filename=self.file_l, level=logging.DEBUG)
+                config = type(self).config = self.config_class().load(self.file_j, self.icon)
+                handlers: list = [HTTPCookieProcessor(self.mcj)]
+                if config.proxy:
+                    if not any(config.proxies.values()):
+                        raise EngineError("Proxy enabled, but not set!")
+                    socks_url = [x for x in config.proxies.values() if x.lower().startswith("socks")]
+                    if socks_url:
+                        import socks
+
+                        url = urlparse(socks_url[0])
+                        socks.set_default_proxy(socks.PROXY_TYPE_SOCKS5, url.hostname, url.port,
+                                                True, url.username, url.password)
+                        socket.socket = socks.socksocket
+                    else:
+                        handlers.append(ProxyHandler(config.proxies))
+                type(self).session = build_opener(*handlers)
+                self.session.addheaders = [("User-Agent", config.ua), *self.headers.items()]
+            if self.session_cookie is not None and not self.has_session():
+                try:
+                    self.mcj.load(str(self.file_c), ignore_discard=True)
+                except (OSError, LoadError):
+                    pass
+                if not self.has_session():
+                    self.login()
+
+        def _search(self, what: str, cat: str = "all") -> None:
+            query = self.search_url(what, cat)
+            total = self.searching(query, True)
+            if total > self.page_size:
+                for url in self.page_urls(query, total)[:self.config.page_budget or None]:
+                    try:
+                        self.searching(url)
+                    except EngineError as ex:
+                        self.logger.error(ex)
+
+        def _download_torrent(self, url: str) -> None:
+            response = self._request(url)
+            # a sign-in or error page instead of the torrent
+            if not response.startswith(b"d"):
+                raise EngineError(f"{url} is not a torrent file")
+            with NamedTemporaryFile(suffix=".torrent", delete=False) as fd:
+                fd.write(response)
+            print(fd.name + " " + url)
+
+        def _request(self, url: str, data: Optional[bytes] = None) -> bytes:
+            try:
+                with self.session.open(url, data, 5) as r:
+                    # checking that tracker isn't blocked
+                    if not r.geturl().startswith((self.url, self.url_dl)):
+                        raise EngineError(f"{url} is blocked. Try another proxy.")
+                    body = r.read()
+            except URLError as err:
+                raise EngineError(f"{url} is not response! Maybe it is blocked. ({err.reason})")
+            # some trackers gzip without saying so
+            return gzip.decompress(body) if body.startswith(b"\x1f\x8b") else body
+
+        def pretty_error(self, what: str, error: str) -> None:
+            prettyPrinter({
+                "engine_url": self.url,
+                "desc_link": f"file://{self.file_l}",
+                "name": f"[{unquote(what)}][Error]: {error}",
+                "link": self.url + "error",
+                "size": "1 TB",
+                "seeds": 100,
+                "leech": 100,
+                "pub_date": int(time.time()),
+            })
+
+
+try:
+    # a few workers per tracker, earliest pages first
+    from qbt_common.pages import fetch_pages
+except ImportError:
+    def fetch_pages(fetch: Callable, urls: list, tracker: str, workers: int = 4,
+                    budget: Optional[int] = None,
+                    timeout: Optional[float] = None) -> list:
+        return [fetch(url) for url in urls[:budget]]
 
-FILENAME = FILE.stem
-FILE_J, FILE_C, FILE_L = [
-    BASEDIR / (FILENAME + fl) for fl in (".json", ".cookie", ".log")
-]
 
 RE_TORRENTS = re.compile(
     r'nam"><a\s+?href="/(?P<desc_link>.+?)"\s+?class="r\d">(?P<name>.+?)'
@@ -49,6 +238,12 @@ PATTERNS = ("%sbrowse.php?s=%s&c=%s", "%s&page=%s")
 
 PAGES = 50
 
+RE_HASH = re.compile(r"[0-9A-Fa-f]{40}")
+# infohash lookups run inside page fetches, which hold kinozal.tv's slots
+DETAILS = "kinozal.tv details"
+
+SIZE_UNITS = str.maketrans({"Т": "T", "Г": "G", "М": "M", "К": "K", "Б": "B"})
+
 # base64 encoded image
 ICON = (
     "AAABAAEAEBAAAAEAIABoBAAAFgAAACgAAAAQAAAAIAAAAAEAIAAAAAAAQAQAAAAAAAAAAAAAA"
@@ -75,98 +270,34 @@ ICON = (
     "A=="
 )
 
-# setup logging
-logging.basicConfig(
-    filemode="w",
-    filename=FILE_L,
-    format="%(asctime)s %(name)-12s %(levelname)-8s %(message)s",
-    datefmt="%m-%d %H:%M",
-    level=logging.DEBUG,
-)
-
-logger = logging.getLogger(__name__)
-
-
-def rng(t: int) -> range:
-    return range(1, -(-t // PAGES))
 
-
-def date_normalize(date_str: str) -> int:
+def date_normalize(date_str: str, now: Optional[float] = None) -> int:
+    now = time.time() if now is None else now
     if "сейчас" in date_str:
-        return int(time.time())
+        return int(now)
 
     pub_date, _, pub_time = date_str.split()
     if "сегодня" in pub_date:
-        pub_date = time.strftime("%d.%m.%Y", time.localtime())
+        day = time.localtime(now)[:3]
     elif "вчера" in pub_date:
-        pub_date = time.strftime(
-            "%d.%m.%Y", time.localtime(time.time() - 86400)
-        )
-    return int(
-        time.mktime(time.strptime(f"{pub_date} {pub_time}", "%d.%m.%Y %H:%M"))
-    )
-
-
-class EngineError(Exception): ...
+        day = time.localtime(now - 86400)[:3]
+    else:
+        d, m, y = pub_date.split(".")
+        day = (int(y), int(m), int(d))
+    hour, minute = pub_time.split(":")
+    return int(time.mktime((*day, int(hour), int(minute), 0, 0, 0, -1)))
 
 
 @dataclass
-class Config:
+class Config(BaseConfig):
     username: str = "USERNAME"
     password: str = "PASSWORD"
     magnet: bool = False
-    proxy: bool = False
-    # dynamic_proxy: bool = True
-    proxies: dict[str, str] = field(
-        default_factory=lambda: {"http": "", "https": ""}
-    )
-    ua: str = (
-        "Mozilla/5.0 (X11; Linux i686; rv:38.0) Gecko/20100101 Firefox/38.0 "
-    )
-
-    def __post_init__(self) -> None:
-        try:
-            if not self._validate_json(json.loads(FILE_J.read_text())):
-                raise ValueError("Incorrect json scheme.")
-        except Exception as e:
-            logger.error(e)
-            FILE_J.write_text(self.to_str())
-            (BASEDIR / f"{FILENAME}.ico").write_bytes(base64.b64decode(ICON))
-
-    def to_str(self) -> str:
-        return json.dumps(self.to_dict(), indent=4, sort_keys=False)
-
-    def to_dict(self) -> dict[str, Any]:
-        return {self._to_camel(k): v for k, v in self.__dict__.items()}
-
-    def _validate_json(
-        self, obj: dict[str, Union[str, bool, dict[str, str]]]
-    ) -> bool:
-        is_valid = True
-        for k, v in self.__dict__.items():
-            _val = obj.get(self._to_camel(k))
-            if _val is None or not isinstance(_val, type(v)):
-                is_valid = False
-                continue
-            if isinstance(_val, dict):
-                for dk, dv in v.items():
-                    if not isinstance(_val.get(dk), type(dv)):
-                        _val[dk] = dv
-                        is_valid = False
-            setattr(self, k, _val)
-        return is_valid
-
-    @staticmethod
-    def _to_camel(s: str) -> str:
-        return "".join(
-            x.title() if i else x for i, x in enumerate(s.split("_"))
-        )
-
+    # resolve every result's infohash while searching and list magnets
+    magnet_links: bool = False
 
-config = Config()
 
-
-class Kinozal:
+class Kinozal(Engine):
     name = "Kinozal"
     url = "https://kinozal.tv/"
     url_dl = url.replace("//", "//dl.")
@@ -180,218 +311,102 @@ class Kinozal:
         "anime": "20",
         "software": "32",
     }
-
-    # cookies
-    mcj = MozillaCookieJar()
-    # establish connection
-    session = build_opener(HTTPCookieProcessor(mcj))
-
-    def search(self, what: str, cat: str = "all") -> None:
-        self._catch_errors(self._search, what, cat)
-
-    def download_torrent(self, url: str) -> None:
-        self._catch_errors(self._download_torrent, url)
+    config_class = Config
+    config: Config
+    icon = ICON
+    re_torrents, re_results = RE_TORRENTS, RE_RESULTS
+    patterns, page_size, page_offsets = PATTERNS, PAGES, False
+    encoding = "cp1251"
+    session_cookie = "uid"
+    # torrent id -> infohash, for every search in the process
+    infohashes: ClassVar[dict[str, str]] = {}
 
     def login(self) -> None:
         self.mcj.clear()
 
-        form_data = {"username": config.username, "password": config.password}
-        logger.debug(f"Login. Data before: {form_data}")
+        form_data = {
+            "username": self.config.username,
+            "password": self.config.password,
+        }
+        self.logger.debug(f"Login. Data before: {form_data}")
         # encoding to cp1251 then do default encode whole string
         data_encoded = urlencode(form_data, encoding="cp1251").encode()
-        logger.debug("Login. Data after: {data_encoded}")
+        self.logger.debug(f"Login. Data after: {data_encoded!r}")
 
         self._request(self.url_login, data_encoded)
-        logger.debug(f"That we have: {[cookie for cookie in self.mcj]}")
-        if "uid" not in [cookie.name for cookie in self.mcj]:
+        self.logger.debug(f"That we have: {[cookie for cookie in self.mcj]}")
+        if not self.has_session():
             raise EngineError(
                 "We not authorized, please check your credentials!"
             )
-        self.mcj.save(str(FILE_C), ignore_discard=True, ignore_expires=True)
-        logger.info("We successfully authorized")
-
-    def searching(self, query: str, first: bool = False) -> int:
-        response = self._request(query)
-        if response.startswith(b"\x1f\x8b\x08"):
-            response = gzip.decompress(response)
-        page, torrents_found = response.decode("cp1251"), -1
-        if first:
-            # check login status
-            if "Гость! ( Зарегистрируйтесь )" in page:
-                logger.debug("Looks like we lost session id, lets login")
-                self.login()
-            # firstly, we check if there is a result
-            match = RE_RESULTS.search(page)
-            if match is None:
-                logger.debug(f"Unexpected page content:\n {page}")
-                raise EngineError("Unexpected page content")
-            torrents_found = int(match[1])
-            if torrents_found <= 0:
-                return 0
-        self.draw(page)
-
-        return torrents_found
-
-    def draw(self, html: str) -> None:
-        table = str.maketrans(
-            {"Т": "T", "Г": "G", "М": "M", "К": "K", "Б": "B"}
-        )
-        for tor in RE_TORRENTS.finditer(html):
-            prettyPrinter(
-                {
-                    "link": "{}download.php?id={}".format(
-                        self.url_dl, tor.group("desc_link").split("=")[-1]
-                    ),
-                    "name": unescape(tor.group("name")),
-                    "size": tor.group("size").translate(table),
-                    "seeds": int(tor.group("seeds")),
-                    "leech": int(tor.group("leech")),
-                    "engine_url": self.url,
-                    "desc_link": self.url + tor.group("desc_link"),
-                    "pub_date": date_normalize(tor.group("pub_date")),
-                }
-            )
-
-    def _catch_errors(self, handler: Callable[..., None], *args: str):
-        try:
-            self._init()
-            handler(*args)
-        except EngineError as ex:
-            logger.exception(ex)
-            self.pretty_error(args[0], str(ex))
-        except Exception as ex:
-            self.pretty_error(args[0], "Unexpected error, please check logs")
-            logger.exception(ex)
-
-    def _init(self) -> None:
-        # add proxy handler if needed
-        if config.proxy:
-            if not any(config.proxies.values()):
-                raise EngineError("Proxy enabled, but not set!")
-            # socks5 support
-            for proxy_str in config.proxies.values():
-                if not proxy_str.lower().startswith("socks"):
-                    continue
-                url = urlparse(proxy_str)
-                socks.set_default_proxy(  # type: ignore[attr-defined]
-                    socks.PROXY_TYPE_SOCKS5,
-                    url.hostname,
-                    url.port,
-                    True,
-                    url.username,
-                    url.password,
-                )
-                socket.socket = socks.socksocket  # type: ignore
-                break
-            else:
-                self.session.add_handler(ProxyHandler(config.proxies))
-            logger.debug("Proxy is set!")
-
-        # change user-agent
-        self.session.addheaders = [("User-Agent", config.ua)]
-
-        # load local cookies
-        try:
-            self.mcj.load(str(FILE_C), ignore_discard=True)
-            if "uid" in [cookie.name for cookie in self.mcj]:
-                # if cookie.expires < int(time.time())
-                return logger.info("Local cookies is loaded")
-            logger.info("Local cookies expired or bad, try to login")
-            logger.debug(f"That we have: {[cookie for cookie in self.mcj]}")
-        except FileNotFoundError:
-            logger.info("Local cookies not exists, try to login")
-        self.login()
-
-    def _search(self, what: str, cat: str = "all") -> None:
-        query = PATTERNS[0] % (
-            self.url,
-            quote(unquote(what)),
-            self.supported_categories[cat],
-        )
-
-        # make first request (maybe it enough)
-        t0, total = time.time(), self.searching(query, True)
-        # do async requests
-        if total > PAGES:
-            qrs = [PATTERNS[1] % (query, x) for x in rng(total)]
-            with ThreadPoolExecutor(len(qrs)) as executor:
-                executor.map(self.searching, qrs, timeout=30)
-
-        logger.debug(f"--- {time.time() - t0} seconds ---")
-        logger.info(f"Found torrents: {total}")
+        self.save_cookies()
+
+    def check_session(self, page: str, query: str) -> str:
+        if "Гость! ( Зарегистрируйтесь )" in page:
+            self.logger.debug("Looks like we lost session id, lets login")
+            self.login()
+        return page
+
+    def row(self, tor: re.Match) -> dict[str, Any]:
+        return {
+            "link": "{}download.php?id={}".format(
+                self.url_dl, tor.group("desc_link").split("=")[-1]
+            ),
+            "name": unescape(tor.group("name")),
+            "size": tor.group("size").translate(SIZE_UNITS),
+            "seeds": int(tor.group("seeds")),
+            "leech": int(tor.group("leech")),
+            "engine_url": self.url,
+            "desc_link": self.url + tor.group("desc_link"),
+            "pub_date": self.pub_date(tor.group("pub_date")),
+        }
+
+    def rows(self, tors: Iterable[re.Match]) -> list[dict[str, Any]]:
+        rows = super().rows(tors)
+        if self.config.magnet_links:
+            self.resolve([row["link"].split("=")[-1] for row in rows])
+            for row in rows:
+                infohash = self.infohashes.get(row["link"].split("=")[-1])
+                if infohash is not None:
+                    row["link"] = "magnet:?xt=urn:btih:" + infohash
+        return rows
+
+    def resolve(self, ids: list[str]) -> None:
+        """Look up the infohashes of a page's torrents not seen before, a
+        few at a time; a failed lookup leaves its download link in place."""
+        todo = [x for x in dict.fromkeys(ids) if x not in self.infohashes]
+        fetch_pages(self.infohash, todo, DETAILS, self.config.workers, timeout=15)
+
+    def infohash(self, tor_id: str) -> str:
+        infohash = self.infohashes.get(tor_id)
+        if infohash is None:
+            url = "%sget_srv_details.php?action=2&id=%s" % (self.url, tor_id)
+            infohash = self._request(url).decode()[18:58]
+            if not RE_HASH.fullmatch(infohash):
+                raise EngineError(f"No infohash for torrent {tor_id}")
+            self.infohashes[tor_id] = infohash
+        return infohash
+
+    def parse_date(self, date_str: str, now: float) -> int:
+        return date_normalize(date_str, now)
 
     def _download_torrent(self, url: str) -> None:
-        # choose download method
-        if config.magnet:
-            url = "%sget_srv_details.php?action=2&id=%s" % (
-                self.url,
-                url.split("=")[1],
-            )
-
-        path = self._get_download_path(self._request(url))
+        if not self.config.magnet:
+            return super()._download_torrent(url)
+        path = "magnet:?xt=urn:btih:" + self.infohash(url.split("=")[1])
 
-        # return magnet link / file path
-        logger.debug(path + " " + url)
+        # return magnet link
+        self.logger.debug(path + " " + url)
         print(path + " " + url)
 
-    @staticmethod
-    def _get_download_path(response: bytes) -> str:
-        if config.magnet:
-            if response.startswith(b"\x1f\x8b\x08"):
-                response = gzip.decompress(response)
-            return "magnet:?xt=urn:btih:" + response.decode()[18:58]
-        # Create a torrent file
-        with NamedTemporaryFile(suffix=".torrent", delete=False) as fd:
-            fd.write(response)
-            return fd.name
-
-    def _request(
-        self,
-        url: str,
-        data: Optional[bytes] = None,
-        repeated: bool = False,
-    ) -> bytes:
-        try:
-            with self.session.open(url, data, 5) as r:
-                # checking that tracker isn't blocked
-                if r.geturl().startswith((self.url, self.url_dl)):
-                    return r.read()
-                raise EngineError(f"{url} is blocked. Try another proxy.")
-        except (URLError, HTTPError) as err:
-            error = str(err.reason)
-            reason = f"{url} is not response! Maybe it is blocked."
-            if "timed out" in error and not repeated:
-                logger.debug("Request timed out. Repeating...")
-                return self._request(url, data, True)
-            if "no host given" in error:
-                reason = "Proxy is bad, try another!"
-            elif isinstance(err, HTTPError):
-                reason = f"Request to {url} failed with status: {err.code}"
-
-            raise EngineError(reason)
-
-    def pretty_error(self, what: str, error: str) -> None:
-        prettyPrinter(
-            {
-                "engine_url": self.url,
-                "desc_link": f"file://{FILE_L}",
-                "name": f"[{unquote(what)}][Error]: {error}",
-                "link": self.url + "error",
-                "size": "1 TB",  # lol
-                "seeds": 100,
-                "leech": 100,
-                "pub_date": int(time.time()),
-            }
-        )
-
 
 # pep8
 kinozal = Kinozal
 
 if __name__ == "__main__":
-    if BASEDIR.parent.joinpath("settings_gui.py").exists():
+    if Path(__file__).parent.parent.joinpath("settings_gui.py").exists():
         from settings_gui import EngineSettingsGUI
 
-        EngineSettingsGUI(FILENAME)
+        EngineSettingsGUI(Path(__file__).stem)
     engine = kinozal()
     engine.search("doctor")
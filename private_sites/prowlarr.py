@@ -15,6 +15,11 @@ from http.cookiejar import CookieJar
 from novaprinter import prettyPrinter
 from helpers import download_file
 
+try:
+    from qbt_common.transport import build_opener
+except ImportError:
+    build_opener = urllib_request.build_opener
+
 
 ###############################################################################
 # load configuration from file
@@ -64,6 +69,7 @@ class prowlarr(object):
         'software': 4000,
         'tv': 5000,
     }
+    opener = None
 
 
     def download_torrent(self, download_url):
@@ -151,11 +157,12 @@ class prowlarr(object):
 
     def get_response(self, query):
         response = None
-        try:
+        if self.opener is None:
             # we can't use helpers.retrieve_url because of redirects
             # we need the cookie processor to handle redirects
-            opener = urllib_request.build_opener(urllib_request.HTTPCookieProcessor(CookieJar()))
-            response = opener.open(query).read().decode('utf-8')
+            self.opener = build_opener(urllib_request.HTTPCookieProcessor(CookieJar()))
+        try:
+            response = self.opener.open(query).read().decode('utf-8')
         except urllib_request.HTTPError as e:
             # if the page returns a magnet redirect, used in download_torrent
             if e.code == 302:
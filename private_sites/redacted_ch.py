@@ -28,6 +28,11 @@ import gzip
 import io
 from novaprinter import prettyPrinter
 
+try:
+    from qbt_common.transport import urlopen
+except ImportError:
+    from urllib.request import urlopen
+
 
 class redacted_ch(object):
     url = 'https://redacted.ch'
@@ -105,7 +110,7 @@ class redacted_ch(object):
     def retrieve_url(self, url):
         req = urllib.request.Request(url, headers={'Authorization': self.api_token})
         try:
-            response = urllib.request.urlopen(req)
+            response = urlopen(req)
         except urllib.error.URLError as errno:
             print(" ".join(("Connection error:", str(errno.reason))))
             return ""
@@ -119,7 +124,7 @@ class redacted_ch(object):
         req = urllib.request.Request(url, headers={'Authorization': self.api_token})
         if referer is not None:
             req.add_header('referer', referer)
-        response = urllib.request.urlopen(req)
+        response = urlopen(req)
         dat = response.read()
         # Check if it is gzipped
         if dat[:2] == b'\x1f\x8b':
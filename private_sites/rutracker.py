@@ -16,6 +16,18 @@ class Config(object):
         "https://rutracker.net",
         "https://rutracker.nl",
     ]
+    # Mirrors are probed all at once for at most this many seconds, and the
+    # fastest one is remembered for `mirror_ttl` seconds
+    mirror_timeout = 5
+    mirror_ttl = 6 * 3600
+
+    # Number of result pages downloaded at the same time
+    max_workers = 4
+    # Stop searching once this many results have been printed (0: no limit)
+    max_results = 0
+    # Print only this many best-seeded results (0: all results); pages
+    # past them are not downloaded
+    top_k = 0
 
 
 CONFIG = Config()
@@ -28,34 +40,146 @@ DEFAULT_ENGINE_URL = CONFIG.mirrors[0]
 # details and discussion.
 
 
+import codecs
 import concurrent.futures
+import contextlib
 import html
 import http.cookiejar as cookielib
-import gzip
+import json
 import logging
+import os
 import re
+import sys
 import tempfile
+import threading
+import time
+import zlib
 from urllib.error import URLError, HTTPError
-from urllib.parse import unquote, urlencode
-from urllib.request import build_opener, HTTPCookieProcessor
+from urllib.parse import unquote, urlencode, urlsplit
+from typing import Iterator
+from urllib.request import HTTPCookieProcessor
 
 try:
     import novaprinter
 except ImportError:
-    # When novaprinter is not immediately known as a local module, dynamically
-    # import novaprinter from current or parent directory, allowing to run both
-    # `python engines/rutracker.py` from `nova3` or `python rutracker.py` from
-    # `nova3/engines` without issue
-    import importlib.util
-
-    try:
-        spec = importlib.util.spec_from_file_location("novaprinter", "nova2.py")
-        novaprinter = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(novaprinter)
-    except FileNotFoundError:
-        spec = importlib.util.spec_from_file_location("novaprinter", "../nova2.py")
-        novaprinter = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(novaprinter)
+    # Loaded from nova2.py on first print by _novaprinter(), not at import
+    novaprinter = None
+
+
+def _novaprinter():
+    """Return novaprinter, loading it from nova2.py if needed.
+
+    When novaprinter is not immediately known as a local module, dynamically
+    import novaprinter from current or parent directory, allowing to run both
+    `python engines/rutracker.py` from `nova3` or `python rutracker.py` from
+    `nova3/engines` without issue
+    """
+    global novaprinter
+    if novaprinter is None:
+        import importlib.util
+
+        try:
+            spec = importlib.util.spec_from_file_location("novaprinter", "nova2.py")
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        except FileNotFoundError:
+            spec = importlib.util.spec_from_file_location("novaprinter", "../nova2.py")
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        novaprinter = module
+    return novaprinter
+
+
+try:
+    # Reuse keep-alive connections across result pages when available
+    from qbt_common.transport import build_opener
+except ImportError:
+    from urllib.request import build_opener
+
+try:
+    from qbt_common.trace import traced
+except ImportError:
+    def traced(name: str, **attrs):
+        return lambda func: func
+
+try:
+    from qbt_common.decoding import ACCEPT_ENCODING, StreamDecoder
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+    class StreamDecoder(object):
+        """Incremental gzip/deflate decoder for a Content-Encoding."""
+
+        def __init__(self, encoding: str):
+            if encoding not in ("gzip", "x-gzip", "deflate"):
+                raise ValueError("Unsupported content encoding: {}".format(encoding))
+            # zlib detects gzip and zlib-wrapped deflate headers itself
+            self._obj = zlib.decompressobj(zlib.MAX_WBITS | 32)
+
+        def decompress(self, data: bytes) -> bytes:
+            return self._obj.decompress(data)
+
+        def flush(self) -> bytes:
+            return self._obj.flush()
+
+CHUNK_SIZE = 64 * 1024
+# The signed-in session and the last chosen mirror are kept here between runs
+COOKIE_FILE = os.path.splitext(os.path.abspath(__file__))[0] + ".cookie"
+MIRROR_FILE = os.path.splitext(os.path.abspath(__file__))[0] + ".mirror.json"
+
+
+class SessionExpired(Exception):
+    """The tracker answered with its sign-in form."""
+
+
+class RowScanner(object):
+    """Incremental scanner for search result pages.
+
+    Fed the decoded page text as it arrives, yields the torrent data of each
+    `<tr id="trs-tr-…">` row as soon as the row is closed, and collects links
+    to the other result pages. Rows are matched in place within the buffer
+    (`pattern.search(buffer, pos, endpos)`) instead of being copied out.
+    """
+
+    re_row = re.compile(r'<tr id="trs-tr-\d+"')
+
+    def __init__(self, re_torrent_data: re.Pattern, re_search_queries: re.Pattern):
+        self.re_torrent_data = re_torrent_data
+        self.re_search_queries = re_search_queries
+        self.pages = {}  # links to other result pages, in page order
+        self._buffer = ""
+
+    def feed(self, text: str) -> Iterator[dict]:
+        """Scan more text, yielding torrent data for every completed row."""
+        buffer, pos = self._buffer + text, 0
+        while True:
+            row = self.re_row.search(buffer, pos)
+            if row is None:
+                # keep a tag that may be cut in half for the next chunk
+                cut = buffer.rfind("<", pos)
+                cut = len(buffer) if cut == -1 else cut
+                self._scan_pages(buffer, pos, cut)
+                pos = cut
+                break
+            end = buffer.find("</tr>", row.end())
+            self._scan_pages(buffer, pos, row.start())
+            if end == -1:
+                pos = row.start()
+                break
+            match = self.re_torrent_data.search(buffer, row.end(), end)
+            if match:
+                yield match.groupdict()
+            pos = end + len("</tr>")
+        self._buffer = buffer[pos:]
+
+    def close(self) -> None:
+        """Scan what is left once the page is complete."""
+        self._scan_pages(self._buffer, 0, len(self._buffer))
+        self._buffer = ""
+
+    def _scan_pages(self, buffer: str, pos: int, endpos: int) -> None:
+        for match in self.re_search_queries.finditer(buffer, pos, endpos):
+            self.pages.setdefault(match.group(1))
 
 
 # Setup logging
@@ -71,7 +195,8 @@ class RuTracker(object):
     encoding = "cp1251"
 
     re_search_queries = re.compile(r'<a.+?href="tracker\.php\?(.*?start=\d+)"')
-    re_threads = re.compile(r'<tr id="trs-tr-\d+".*?</tr>', re.S)
+    re_start = re.compile(r"start=(\d+)")
+    login_form_marker = 'name="login_username"'
     re_torrent_data = re.compile(
         r'a data-topic_id="(?P<id>\d+?)".*?>(?P<title>.+?)<'
         r".+?"
@@ -103,17 +228,54 @@ class RuTracker(object):
         return self.forum_url + "viewtopic.php?" + query
 
     def __init__(self):
-        """[Called by qBittorrent from `nova2.py` and `nova2dl.py`] Initialize RuTracker search engine, signing in using given credentials."""
-        self.cj = cookielib.CookieJar()
+        """[Called by qBittorrent from `nova2.py` and `nova2dl.py`] Initialize RuTracker search engine.
+
+        Signing in is left to the first request that needs it, reusing the session saved by a previous run if any.
+        """
+        self.cj = cookielib.MozillaCookieJar(COOKIE_FILE)
+        try:
+            self.cj.load(ignore_discard=True)
+        except (OSError, cookielib.LoadError):
+            pass  # No saved session yet
+        self._mirror_expires = 0.0
         self.opener = build_opener(HTTPCookieProcessor(self.cj))
+        # Let pages be parsed while they download (shared transport only)
+        self.opener.stream = True
         self.opener.addheaders = [
             ("User-Agent", ""),
-            ("Accept-Encoding", "gzip, deflate"),
+            ("Accept-Encoding", ACCEPT_ENCODING),
         ]
-        self.__login()
+
+    def _has_session(self) -> bool:
+        host = urlsplit(self.url).hostname or ""
+        return any(
+            cookie.name == "bb_session" and host.endswith(cookie.domain.lstrip("."))
+            for cookie in self.cj
+        )
+
+    def __session(self, request, can_retry=lambda: True):
+        """Run request (a callable) signed in.
+
+        A session saved by a previous run is tried first. If the tracker rejects it, or cannot be reached (so that
+        signing in checks the mirrors), sign in again and retry if can_retry() allows it.
+        """
+        if time.time() >= self._mirror_expires:
+            self.__pick_mirror()
+        if not self._has_session():
+            self.__login()
+            return request()
+        try:
+            return request()
+        except (SessionExpired, URLError) as e:
+            if not can_retry():
+                raise
+            logger.info("Saved session failed ({}), signing in again...".format(e))
+            self.__login()
+            return request()
 
     def __login(self) -> None:
         """Set up credentials and try to sign in."""
+        self.cj.clear()
         self.credentials = {
             "login_username": CONFIG.username,
             "login_password": CONFIG.password,
@@ -127,6 +289,7 @@ class RuTracker(object):
             # If a reachable mirror is found, update engine URL and retry request with new base URL
             logging.info("Checking for RuTracker mirrors...")
             self.url = self._check_mirrors(CONFIG.mirrors)
+            self._mirror_expires = time.time() + CONFIG.mirror_ttl
             self._open_url(self.login_url, self.credentials)
 
         # Check if login was successful using cookies
@@ -137,51 +300,109 @@ class RuTracker(object):
             raise e
         else:
             logger.info("Login successful.")
+            self.__save_session()
+
+    def __save_session(self) -> None:
+        try:
+            # The session is as good as the password: keep the file private before anything is written to it
+            os.close(os.open(COOKIE_FILE, os.O_WRONLY | os.O_CREAT, 0o600))
+            os.chmod(COOKIE_FILE, 0o600)  # A file saved by an older version may be readable by others
+            self.cj.save(ignore_discard=True)
+        except OSError as e:
+            logger.warning("Unable to save session: {}".format(e))
 
     def search(self, what: str, cat: str = "all") -> None:
         """[Called by qBittorrent from `nova2.py`] Search for what on the search engine.
 
         As expected by qBittorrent API: should print to `stdout` using `prettyPrinter` for each result.
         """
-        self.results = {}
+        self.found = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
         what = unquote(what)
         logger.info("Searching for {}...".format(what))
 
         # Execute first search pass
-        url = self.search_url(urlencode({"nm": what}))
-        other_pages = self.__execute_search(url, is_first=True)
+        query = {"nm": what}
+        if CONFIG.top_k:
+            # Sort by seeds, descending, so the best seeded come first
+            query.update(o=10, s=2)
+        # The URL is built per attempt, signing in may switch mirrors
+        other_pages = self.__session(
+            lambda: self.__execute_search(self.search_url(urlencode(query)), is_first=True),
+            can_retry=lambda: not self.found,  # Results were printed already
+        )
         logger.info("{} pages of results found.".format(len(other_pages) + 1))
 
         # If others pages of results have been found, repeat search for each page
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            urls = [self.search_url(html.unescape(page)) for page in other_pages]
-            executor.map(self.__execute_search, urls)
-        logger.info("{} torrents found.".format(len(self.results)))
-
-    def __execute_search(self, url: str, is_first: bool = False) -> list:
-        """Execute search query."""
-        # Execute search query at URL and decode response bytes
-        data = self._open_url(url).decode(self.encoding)
-
-        # Look for threads/torrent_data
-        for thread in self.re_threads.findall(data):
-            match = self.re_torrent_data.search(thread)
-            if match:
-                torrent_data = match.groupdict()
-                logger.debug("Torrent data: {}".format(torrent_data))
-                result = self.__build_result(torrent_data)
-                self.results[result["id"]] = result
-                if __name__ != "__main__":
-                    novaprinter.prettyPrinter(result)
-
-        # If doing first search pass, look for other pages
+        pages = [(int(self.re_start.search(page).group(1)), page) for page in other_pages]
+        if CONFIG.top_k:
+            pages = [(start, page) for start, page in pages if start < CONFIG.top_k]
+        with concurrent.futures.ThreadPoolExecutor(CONFIG.max_workers) as executor:
+            futures = [
+                executor.submit(self.__execute_search, self.search_url(html.unescape(page)), start=start)
+                for start, page in pages
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                if not future.cancelled() and future.exception() is not None:
+                    logger.error(future.exception())
+                if self._stop.is_set():
+                    # Enough results, drop the pages not started yet
+                    for pending in futures:
+                        pending.cancel()
+        logger.info("{} torrents found.".format(self.found))
+
+    @traced("page")
+    def __execute_search(self, url: str, is_first: bool = False, start: int = 0) -> list:
+        """Execute search query, printing each result as soon as its row is read.
+
+        `start` is the position of the page's first row in the whole result list.
+        """
+        if self._stop.is_set():
+            return []
+        scanner = RowScanner(self.re_torrent_data, self.re_search_queries)
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        index, tail, signed_out = start, "", False
+        with contextlib.closing(self._iter_url(url)) as chunks:
+            for chunk in chunks:
+                text = decoder.decode(chunk)
+                if is_first and not signed_out:
+                    signed_out = self.login_form_marker in tail + text
+                    tail = text[-len(self.login_form_marker):]
+                for torrent_data in scanner.feed(text):
+                    self.__emit(torrent_data, index)
+                    index += 1
+                if self._stop.is_set():
+                    # Enough results, stop downloading this page
+                    return []
+        for torrent_data in scanner.feed(decoder.decode(b"", final=True)):
+            self.__emit(torrent_data, index)
+            index += 1
+        scanner.close()
+        if signed_out and index == start:
+            raise SessionExpired("Search page asks to sign in")
+
+        # If doing first search pass, return other pages
         if is_first:
-            matches = self.re_search_queries.findall(data)
-            other_pages = list(dict.fromkeys(matches))
-            return other_pages
+            return list(scanner.pages)
 
         return []
 
+    def __emit(self, torrent_data: dict, index: int) -> None:
+        """Print a result unless it is past the configured limits."""
+        if CONFIG.top_k and index >= CONFIG.top_k:
+            return
+        with self._lock:
+            if self._stop.is_set():
+                return
+            self.found += 1
+            if CONFIG.max_results and self.found >= CONFIG.max_results:
+                self._stop.set()
+        logger.debug("Torrent data: {}".format(torrent_data))
+        result = self.__build_result(torrent_data)
+        if __name__ != "__main__":
+            _novaprinter().prettyPrinter(result)
+
     def __build_result(self, torrent_data: dict) -> dict:
         """Map torrent data to result dict as expected by prettyPrinter."""
         query = urlencode({"t": torrent_data["id"]})
@@ -203,6 +424,12 @@ class RuTracker(object):
         self, url: str, post_params: dict[str, str] = None, log_errors: bool = True
     ) -> bytes:
         """URL request open wrapper returning response bytes if successful."""
+        return b"".join(self._iter_url(url, post_params, log_errors))
+
+    def _iter_url(
+        self, url: str, post_params: dict[str, str] = None, log_errors: bool = True
+    ) -> Iterator[bytes]:
+        """URL request open wrapper yielding decoded response bytes as they arrive."""
         encoded_params = (
             urlencode(post_params, encoding=self.encoding).encode()
             if post_params
@@ -223,41 +450,96 @@ class RuTracker(object):
                         response.info(),
                         None,
                     )
-                if response.info().get("Content-Encoding") is not None:
-                    return gzip.decompress(response.read())
-                else:
-                    return response.read()
+                encoding = response.info().get("Content-Encoding")
+                decoder = StreamDecoder(encoding) if encoding else None
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield decoder.decompress(chunk) if decoder else chunk
+                if decoder:
+                    yield decoder.flush()
         except (URLError, HTTPError) as e:
             if log_errors:
                 logger.error(e)
             raise e
 
+    def __pick_mirror(self) -> None:
+        """Use the mirror chosen by a recent run, or race the mirrors for a new one."""
+        try:
+            with open(MIRROR_FILE, encoding="utf-8") as f:
+                cached = json.load(f)
+            expires = cached["checked"] + CONFIG.mirror_ttl
+            if cached["url"] in CONFIG.mirrors and time.time() < expires:
+                logger.info("Using mirror {} ({:.0f} ms)".format(cached["url"], cached["latency"] * 1000))
+                self.url, self._mirror_expires = cached["url"], expires
+                return
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # No recent choice
+        self.url = self._check_mirrors(CONFIG.mirrors)
+        self._mirror_expires = time.time() + CONFIG.mirror_ttl
+
     def _check_mirrors(self, mirrors: list) -> str:
-        """Try to find a reachable mirror in given list and return its URL."""
+        """Probe all mirrors in given list at once and return the URL of the first to answer."""
+        def probe(mirror: str) -> float:
+            started = time.monotonic()
+            with self.opener.open(mirror, None, CONFIG.mirror_timeout):
+                return time.monotonic() - started
+
         errors = []
-        for mirror in mirrors:
-            try:
-                self.opener.open(mirror)
-                logger.info("Found reachable mirror: {}".format(mirror))
-                return mirror
-            except URLError as e:
+        executor = concurrent.futures.ThreadPoolExecutor(len(mirrors))
+        futures = {executor.submit(probe, mirror): mirror for mirror in mirrors}
+        try:
+            for future in concurrent.futures.as_completed(futures, CONFIG.mirror_timeout):
+                mirror = futures[future]
+                if future.exception() is None:
+                    logger.info("Found reachable mirror: {} ({:.0f} ms)".format(mirror, future.result() * 1000))
+                    self.__save_mirror(mirror, future.result())
+                    return mirror
                 logger.warning("Could not resolve mirror: {}".format(mirror))
-                errors.append(e)
+                errors.append(future.exception())
+        except concurrent.futures.TimeoutError as e:
+            errors.append(e)
+        finally:
+            # Slower probes are left to finish in the background
+            executor.shutdown(wait=False)
         logger.error("Unable to resolve any mirror")
         raise RuntimeError("\n{}".format("\n".join([str(error) for error in errors])))
 
+    def __save_mirror(self, mirror: str, latency: float) -> None:
+        try:
+            with open(MIRROR_FILE + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"url": mirror, "latency": latency, "checked": time.time()}, f)
+            os.replace(MIRROR_FILE + ".tmp", MIRROR_FILE)
+        except OSError as e:
+            logger.warning("Unable to save mirror: {}".format(e))
+
     def download_torrent(self, url: str) -> None:
         """[Called by qBittorrent from `nova2dl.py`] Download torrent file and print filename + URL as required by API"""
         logger.info("Downloading {}...".format(url))
-        data = self._open_url(url)
+        data = self.__session(lambda: self.__download(url))
         with tempfile.NamedTemporaryFile(suffix=".torrent", delete=False) as f:
             f.write(data)
             print(f.name + " " + url)
 
+    def __download(self, url: str) -> bytes:
+        data = self._open_url(url)
+        # Torrent files are bencoded dictionaries, anything else is a page asking to sign in
+        if not data.startswith(b"d"):
+            raise SessionExpired("Download asks to sign in")
+        return data
+
 
 # Register rutracker engine with nova2 (needs to match filename)
 rutracker = RuTracker
 
+try:
+    # Forward to the warm engine daemon when it is running
+    from qbt_common.daemon import served
+    rutracker = served(rutracker)
+except ImportError:
+    pass
+
 # For testing purposes.
 if __name__ == "__main__":
     from timeit import timeit
@@ -277,3 +559,263 @@ if __name__ == "__main__":
             number=1,
         ),
     )
+
+
+if "pytest" in sys.modules:
+    import io
+    import types
+
+    import pytest
+
+    module = sys.modules[__name__]
+    MIRROR = CONFIG.mirrors[0]
+
+    def row(topic: int, seeds: int = 5) -> str:
+        return (
+            '<tr id="trs-tr-{0}" class="tCenter"><td><a data-topic_id="{0}" href="#">Title {0}</a></td>'
+            '<td data-ts_text="{1}">1 MB</td><td data-ts_text="{2}"><b class="seedmed">{2}</b></td>'
+            '<td><b class="leechmed">3</b></td><td data-ts_text="1700000000">1-Jan-24</td></tr>\n'
+        ).format(topic, topic * 1000, seeds)
+
+    def page(topics, starts=()) -> str:
+        links = "".join(
+            '<a class="pg" href="tracker.php?search_id=abc&amp;start={0}">{0}</a>\n'.format(start)
+            for start in starts
+        )
+        return "<table>\n" + "".join(map(row, topics)) + "</table>\n" + links
+
+    class Response(object):
+        def __init__(self, url: str, body: bytes):
+            self.url, self.body = url, io.BytesIO(body)
+
+        def __enter__(self) -> "Response":
+            return self
+
+        def __exit__(self, *exc) -> None:
+            pass
+
+        def getcode(self) -> int:
+            return 200
+
+        def geturl(self) -> str:
+            return self.url
+
+        def info(self) -> dict:
+            return {}
+
+        def read(self, size: int = -1) -> bytes:
+            return self.body.read(size)
+
+    class Opener(object):
+        """Stand-in for the engine's opener, serving pages by URL."""
+
+        def __init__(self, engine: RuTracker, pages: dict):
+            self.engine, self.pages, self.requests = engine, pages, []
+            self._lock = threading.Lock()
+
+        def open(self, url: str, data: bytes = None, timeout: float = None) -> Response:
+            with self._lock:
+                self.requests.append(url)
+            body = self.pages.get(url)
+            if callable(body):
+                body = body()
+            if isinstance(body, Exception):
+                raise body
+            if body is None:
+                raise URLError("no such page: " + url)
+            if url.endswith("/forum/login.php"):
+                self.engine.cj.set_cookie(session_cookie("fresh"))
+            return Response(url, body.encode(RuTracker.encoding) if isinstance(body, str) else body)
+
+    def session_cookie(value: str) -> cookielib.Cookie:
+        return cookielib.Cookie(
+            0, "bb_session", value, None, False, ".rutracker.org", True, True,
+            "/forum/", True, False, None, False, None, None, {},
+        )
+
+    @pytest.fixture
+    def files(tmp_path, monkeypatch):
+        """The cookie and mirror files in a temporary directory, the mirror fresh."""
+        monkeypatch.setattr(module, "COOKIE_FILE", str(tmp_path / "rutracker.cookie"))
+        monkeypatch.setattr(module, "MIRROR_FILE", str(tmp_path / "rutracker.mirror.json"))
+        with open(module.MIRROR_FILE, "w", encoding="utf-8") as f:
+            json.dump({"url": MIRROR, "latency": 0.05, "checked": time.time()}, f)
+        return tmp_path
+
+    @pytest.fixture
+    def rows(monkeypatch):
+        printed = []
+        monkeypatch.setattr(module, "novaprinter", types.SimpleNamespace(prettyPrinter=printed.append))
+        return printed
+
+    def engine_with(pages: dict) -> RuTracker:
+        engine = RuTracker()
+        engine.opener = Opener(engine, pages)
+        return engine
+
+    def signed_in() -> None:
+        """A session saved by a previous run."""
+        jar = cookielib.MozillaCookieJar(module.COOKIE_FILE)
+        jar.set_cookie(session_cookie("saved"))
+        jar.save(ignore_discard=True)
+
+    # RowScanner
+
+    def scan(chunks) -> tuple:
+        scanner = RowScanner(RuTracker.re_torrent_data, RuTracker.re_search_queries)
+        found = [data for chunk in chunks for data in scanner.feed(chunk)]
+        scanner.close()
+        return [data["id"] for data in found], list(scanner.pages), found
+
+    def test_row_scanner_split_at_every_boundary():
+        text = page([1, 2, 3], starts=(50, 100))
+        expected = scan([text])
+        assert expected[:2] == (["1", "2", "3"], ["search_id=abc&amp;start=50", "search_id=abc&amp;start=100"])
+        assert expected[2][0] == {
+            "id": "1", "title": "Title 1", "size": "1000", "seeds": "5", "leech": "3", "pub_date": "1700000000",
+        }
+        for cut in range(len(text) + 1):
+            assert scan([text[:cut], text[cut:]]) == expected, cut
+        assert scan(text) == expected  # a character at a time
+
+    def test_row_scanner_yields_rows_before_the_page_ends():
+        scanner = RowScanner(RuTracker.re_torrent_data, RuTracker.re_search_queries)
+        text = page([1, 2])
+        second = text.index('<tr id="trs-tr-2"')
+        assert [data["id"] for data in scanner.feed(text[:second])] == ["1"]
+        assert [data["id"] for data in scanner.feed(text[second:])] == ["2"]
+
+    # search limits
+
+    def search_pages() -> dict:
+        forum = MIRROR + "/forum/tracker.php?"
+        return {
+            forum + "nm=ubuntu": page([1, 2, 3], starts=(50, 100)),
+            forum + "nm=ubuntu&o=10&s=2": page([1, 2, 3], starts=(50, 100)),
+            forum + "search_id=abc&start=50": page([4, 5, 6]),
+            forum + "search_id=abc&start=100": page([7, 8, 9]),
+        }
+
+    def test_search_prints_every_page(files, rows):
+        signed_in()
+        engine_with(search_pages()).search("ubuntu")
+        assert sorted(int(r["id"]) for r in rows) == list(range(1, 10))
+        assert rows[0]["link"] == MIRROR + "/forum/dl.php?t=1"
+
+    def test_max_results_stops_the_search(files, rows, monkeypatch):
+        monkeypatch.setattr(CONFIG, "max_results", 2)
+        signed_in()
+        engine = engine_with(search_pages())
+        engine.search("ubuntu")
+        assert [r["id"] for r in rows] == ["1", "2"]
+        assert engine.found == 2 and engine._stop.is_set()
+        # the first page was enough, no other page was asked for
+        assert not any("start=" in url for url in engine.opener.requests)
+
+    def test_top_k_skips_rows_and_pages_past_it(files, rows, monkeypatch):
+        monkeypatch.setattr(CONFIG, "top_k", 50)
+        signed_in()
+        engine = engine_with(search_pages())
+        engine.search("ubuntu")
+        assert [r["id"] for r in rows] == ["1", "2", "3"]
+        assert engine.opener.requests == [MIRROR + "/forum/tracker.php?nm=ubuntu&o=10&s=2"]
+
+    def test_emit_honours_top_k(rows, monkeypatch):
+        monkeypatch.setattr(CONFIG, "top_k", 2)
+        engine = RuTracker.__new__(RuTracker)
+        engine.url, engine.found = MIRROR, 0
+        engine._lock, engine._stop = threading.Lock(), threading.Event()
+        _, _, found = scan([page([1, 2, 3])])
+        for index, data in enumerate(found):
+            engine._RuTracker__emit(data, index)
+        assert [r["id"] for r in rows] == ["1", "2"]
+
+    # sessions
+
+    def test_saved_session_is_reused(files, rows):
+        signed_in()
+        engine = engine_with(search_pages())
+        assert engine._has_session()
+        engine.search("ubuntu")
+        assert MIRROR + "/forum/login.php" not in engine.opener.requests
+        assert len(rows) == 9
+
+    def test_sign_in_page_forces_a_fresh_login(files, rows):
+        signed_in()
+        pages = search_pages()
+        answers = iter(['<form><input name="login_username"></form>', pages[MIRROR + "/forum/tracker.php?nm=ubuntu"]])
+        pages[MIRROR + "/forum/tracker.php?nm=ubuntu"] = lambda: next(answers)
+        pages[MIRROR + "/forum/login.php"] = "<html>welcome</html>"
+        engine = engine_with(pages)
+        engine.search("ubuntu")
+        assert engine.opener.requests.count(MIRROR + "/forum/login.php") == 1
+        assert len(rows) == 9
+        saved = cookielib.MozillaCookieJar(module.COOKIE_FILE)
+        saved.load(ignore_discard=True)
+        assert [cookie.value for cookie in saved] == ["fresh"]
+        assert os.stat(module.COOKIE_FILE).st_mode & 0o777 == 0o600
+
+    def test_no_saved_session_signs_in_first(files, rows):
+        pages = search_pages()
+        pages[MIRROR + "/forum/login.php"] = "<html>welcome</html>"
+        engine = engine_with(pages)
+        assert not engine._has_session()
+        engine.search("ubuntu")
+        assert engine.opener.requests[0] == MIRROR + "/forum/login.php"
+        assert len(rows) == 9
+
+    def test_failed_login_raises(files):
+        engine = engine_with({MIRROR + "/forum/login.php": "<html>wrong password</html>"})
+        engine.opener.engine = types.SimpleNamespace(cj=cookielib.CookieJar())  # the tracker sets no cookie
+        with pytest.raises(ValueError):
+            engine.search("ubuntu")
+
+    # mirrors
+
+    def slow(seconds: float, body: str = "<html></html>"):
+        def answer():
+            time.sleep(seconds)
+            return body
+        return answer
+
+    def test_mirror_race_picks_the_fastest(files):
+        mirrors = ["https://slow.test", "https://fast.test", "https://down.test"]
+        engine = engine_with({
+            "https://slow.test": slow(0.3),
+            "https://fast.test": slow(0.01),
+            "https://down.test": URLError("refused"),
+        })
+        assert engine._check_mirrors(mirrors) == "https://fast.test"
+        with open(module.MIRROR_FILE, encoding="utf-8") as f:
+            saved = json.load(f)
+        assert saved["url"] == "https://fast.test" and saved["latency"] < 0.3
+
+    def test_mirror_race_fails_when_all_are_down(files):
+        engine = engine_with({})
+        with pytest.raises(RuntimeError, match="no such page"):
+            engine._check_mirrors(["https://a.test", "https://b.test"])
+
+    def test_cached_mirror_is_used_within_its_ttl(files, monkeypatch):
+        monkeypatch.setattr(CONFIG, "mirror_ttl", 3600)
+        with open(module.MIRROR_FILE, "w", encoding="utf-8") as f:
+            json.dump({"url": CONFIG.mirrors[1], "latency": 0.05, "checked": time.time() - 600}, f)
+        engine = engine_with({})
+        engine._RuTracker__pick_mirror()
+        assert engine.url == CONFIG.mirrors[1] and engine.opener.requests == []
+        assert engine._mirror_expires == pytest.approx(time.time() + 3000, abs=5)
+
+    @pytest.mark.parametrize("cached", [
+        {"url": CONFIG.mirrors[1], "latency": 0.05, "checked": time.time() - 7200},
+        {"url": "https://gone.test", "latency": 0.05, "checked": time.time()},
+        "not json",
+    ])
+    def test_stale_cached_mirror_is_raced_again(files, monkeypatch, cached):
+        monkeypatch.setattr(CONFIG, "mirror_ttl", 3600)
+        with open(module.MIRROR_FILE, "w", encoding="utf-8") as f:
+            f.write(json.dumps(cached) if isinstance(cached, dict) else cached)
+        engine = engine_with({CONFIG.mirrors[2]: "<html></html>"})
+        engine._RuTracker__pick_mirror()
+        assert engine.url == CONFIG.mirrors[2]
+        assert sorted(engine.opener.requests) == sorted(CONFIG.mirrors)
+        with open(module.MIRROR_FILE, encoding="utf-8") as f:
+            assert json.load(f)["url"] == CONFIG.mirrors[2]
@@ -1,4 +1,4 @@
-# VERSION: 1.18
+# VERSION: 1.19
 # AUTHORS: PlayDay
 
 # MIT License
@@ -32,6 +32,7 @@
 # 1.16 - Refactored ConfigJson to reference Config class defaults instead of hardcoded values
 # 1.17 - Fixed size parsing: now returns bytes (int) instead of string for qBittorrent compatibility
 # 1.18 - Added FileHandler for logging to toloka_to.log file
+# 1.19 - Fetch the remaining result pages concurrently (bounded per tracker), printing them in page order
 
 # INSTALLATION:
 # 1. Install the plugin: https://github.com/qbittorrent/search-plugins/wiki/Install-search-plugins
@@ -75,7 +76,9 @@ import os
 import re
 import sys
 import tempfile
+import threading
 import zlib
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import asdict, dataclass
 from datetime import datetime
 from enum import IntEnum
@@ -90,6 +93,32 @@ from urllib.request import HTTPCookieProcessor, OpenerDirector, Request, build_o
 from nova2 import Category, Engine  # pyright: ignore[reportMissingModuleSource]
 from novaprinter import SearchResults, prettyPrinter  # pyright: ignore[reportMissingModuleSource]
 
+try:
+    from qbt_common.decoding import ACCEPT_ENCODING, decode_body
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+    def decode_body(body: bytes, encoding: Optional[str]) -> bytes:
+        """Undo a gzip or deflate Content-Encoding."""
+        match encoding:
+            case "gzip":
+                return gzip.decompress(body)
+            case "deflate":
+                return zlib.decompress(body)
+            case _:
+                return body
+
+try:
+    from qbt_common.pages import tracker_slots
+except ImportError:
+    _tracker_slots: dict[str, threading.BoundedSemaphore] = {}
+    _tracker_slots_lock = threading.Lock()
+
+    def tracker_slots(tracker: str, limit: int = 4) -> threading.BoundedSemaphore:
+        """Process-wide cap on requests in flight to a tracker."""
+        with _tracker_slots_lock:
+            return _tracker_slots.setdefault(tracker, threading.BoundedSemaphore(max(limit, 1)))
+
 logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
 logger = logging.getLogger(__name__)
 
@@ -879,6 +908,9 @@ class toloka_to(Engine):
     login_url: str = f"{url}login.php"
     search_url: str = f"{url}tracker.php"
 
+    page_workers: int = 4
+    """Result pages fetched at once (also the cap on requests in flight to the tracker)"""
+
     def __init__(self: Self) -> None:
         engine_dir = os.path.dirname(os.path.realpath(__file__))
         self.config_file_path: str = os.path.join(engine_dir, f"{self.__class__.__name__}.json")
@@ -886,6 +918,7 @@ class toloka_to(Engine):
         self.config: Config = self._load_config()
         self.cookie_jar: LWPCookieJar = LWPCookieJar(self.cookies_file_path)
         self.opener: OpenerDirector = build_opener(HTTPCookieProcessor(self.cookie_jar))
+        self.opener.addheaders.append(("Accept-Encoding", ACCEPT_ENCODING))
         self.logged_in: bool = False
 
         # Apply configured log level (default: WARNING)
@@ -1044,8 +1077,8 @@ class toloka_to(Engine):
             logger.error("Login network error: %s", e)
             raise Exception(f"Login failed: {e}") from e
 
-    def _parse_and_print_results(self, html_content: str) -> TolokaHTMLParser:
-        """Parse HTML content and print results. Returns the parser with pagination info."""
+    def _parse_results(self, html_content: str) -> TolokaHTMLParser:
+        """Parse HTML content into results with absolute URLs. Returns the parser with pagination info."""
         parser = TolokaHTMLParser()
         parser.feed(html_content)
 
@@ -1056,15 +1089,32 @@ class toloka_to(Engine):
             result["engine_url"] = toloka_to.url
             if result["desc_link"] and not result["desc_link"].startswith("http"):
                 result["desc_link"] = f"{toloka_to.url}{result['desc_link'].lstrip('/')}"
-            prettyPrinter(result)
 
         return parser
 
+    def _parse_and_print_results(self, html_content: str) -> TolokaHTMLParser:
+        """Parse HTML content and print results. Returns the parser with pagination info."""
+        parser = self._parse_results(html_content)
+        for result in parser.results:
+            prettyPrinter(result)
+        return parser
+
+    def _fetch_results(self, url: str) -> TolokaHTMLParser:
+        """Fetch and parse a result page, holding one of the tracker's request slots."""
+        with tracker_slots(toloka_to.url, toloka_to.page_workers):
+            html_content = self._fetch_page(url)
+        return self._parse_results(html_content)
+
     def _fetch_page(self, url: str) -> str:
         """Fetch a page and return decoded HTML content."""
         request = Request(url)
         response: HTTPResponse = self.opener.open(request, timeout=30)
-        return response.read().decode("utf-8")
+        return self._read(response).decode("utf-8")
+
+    @staticmethod
+    def _read(response: HTTPResponse) -> bytes:
+        """Read a response body, undoing its Content-Encoding."""
+        return decode_body(response.read(), response.getheader("Content-Encoding"))
 
     def download_torrent(self: Self, info: str) -> None:
         """Download torrent file and print path for qBittorrent."""
@@ -1074,16 +1124,7 @@ class toloka_to(Engine):
         try:
             request = Request(info)
             response: HTTPResponse = self.opener.open(request, timeout=30)
-            data: bytes = response.read()
-
-            # Handle compressed response
-            match response.getheader('Content-Encoding'):
-                case 'gzip':
-                    data = gzip.decompress(data)
-                case 'deflate':
-                    data = zlib.decompress(data)
-                case _:
-                    pass
+            data: bytes = self._read(response)
 
             # Write to temp file
             fd, path = tempfile.mkstemp(suffix=".torrent")
@@ -1139,31 +1180,34 @@ class toloka_to(Engine):
 
             response: HTTPResponse = self.opener.open(request, timeout=30)
             logger.debug("Search response status: %s", response.status)
-            html_content: str = response.read().decode("utf-8")
+            html_content: str = self._read(response).decode("utf-8")
             logger.debug("Received %d bytes of HTML content", len(html_content))
 
             parser = self._parse_and_print_results(html_content)
             total_results = len(parser.results)
             logger.info("Page 1: found %d results for query: %r", total_results, query.strip())
 
-            # Fetch remaining pages
-            fetched_urls: set[str] = set()
-            for page_url in parser.next_page_urls:
-                if page_url in fetched_urls:
-                    continue
-                fetched_urls.add(page_url)
-
-                full_url = f"{toloka_to.url}{page_url.lstrip('/')}"
-                logger.debug("Fetching next page: %s", full_url)
-
+            # Fetch remaining pages concurrently, printing them in page order
+            page_urls = [
+                f"{toloka_to.url}{page_url.lstrip('/')}"
+                for page_url in dict.fromkeys(parser.next_page_urls)
+            ]
+            if page_urls:
+                pool = ThreadPoolExecutor(max_workers=min(toloka_to.page_workers, len(page_urls)))
                 try:
-                    page_html = self._fetch_page(full_url)
-                    page_parser = self._parse_and_print_results(page_html)
-                    total_results += len(page_parser.results)
-                    logger.debug("Page fetched: %d results", len(page_parser.results))
-                except (HTTPError, URLError, TimeoutError, OSError) as e:
-                    logger.warning("Failed to fetch page %s: %s", page_url, e)
-                    continue
+                    futures = [pool.submit(self._fetch_results, page_url) for page_url in page_urls]
+                    for page_url, future in zip(page_urls, futures):
+                        try:
+                            page_parser = future.result()
+                        except (HTTPError, URLError, TimeoutError, OSError) as e:
+                            logger.warning("Failed to fetch page %s: %s", page_url, e)
+                            continue
+                        for result in page_parser.results:
+                            prettyPrinter(result)
+                        total_results += len(page_parser.results)
+                        logger.debug("Page %s: %d results", page_url, len(page_parser.results))
+                finally:
+                    pool.shutdown(cancel_futures=True)
 
             logger.info("Search completed, total %d results", total_results)
 
@@ -1824,6 +1868,42 @@ if "pytest" in sys.modules:
                 engine.opener.open.return_value = mock_response
                 assert engine._fetch_page("https://toloka.to/test") == "<html>Test</html>"  # pyright: ignore[reportPrivateUsage]  # nosec B101
 
+        def test_search_fetches_pages_concurrently_in_order(
+            self,
+            sample_html_with_pagination: str,
+            sample_html_single_result: str,
+            sample_html_multiple_results: str,
+        ) -> None:
+            last_page_fetched = threading.Event()
+
+            def fetch_page(url: str) -> str:
+                if url.endswith("start=0"):
+                    # only returns once a later page was fetched alongside it
+                    assert last_page_fetched.wait(5)  # nosec B101
+                    return sample_html_multiple_results
+                if url.endswith("start=50"):
+                    raise URLError("Network error")
+                last_page_fetched.set()
+                return sample_html_single_result
+
+            with patch.object(toloka_to, '__init__', _noop_init):
+                engine = toloka_to()
+                engine.logged_in = True
+                engine.opener = MagicMock(spec=OpenerDirector)
+                engine.supported_categories = toloka_to.supported_categories
+                mock_response = MagicMock()
+                mock_response.status = 200
+                mock_response.read.return_value = sample_html_with_pagination.encode("utf-8")
+                engine.opener.open.return_value = mock_response
+                with patch.object(engine, '_login', return_value=True):
+                    with patch.object(engine, '_fetch_page', side_effect=fetch_page):
+                        with patch('toloka_to.prettyPrinter') as mock_printer:
+                            engine.search("test")
+                names = [c[0][0]["name"] for c in mock_printer.call_args_list]
+                assert names == [  # nosec B101
+                    "Paginated Result", "First Torrent", "Second Torrent", "Third Torrent", "Test Torrent Name"
+                ]
+
     # -------------------------------------------------------------------------
     # Integration Tests
     # -------------------------------------------------------------------------
@@ -7,7 +7,10 @@ from urllib import request
 from urllib.error import URLError
 from urllib.parse import urlencode
 
-from helpers import retrieve_url
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter
 
 USER = "USUARIO"
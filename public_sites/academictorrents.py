@@ -8,7 +8,10 @@ from datetime import date, datetime
 from pathlib import Path
 from urllib import request
 
-from helpers import retrieve_url
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter, SearchResults
 
 DATABASE_URL = "https://academictorrents.com/database.xml"
@@ -24,7 +24,10 @@ except ModuleNotFoundError:
 # import qBT modules
 try:
     from novaprinter import prettyPrinter
-    from helpers import retrieve_url
+    try:
+        from qbt_common.transport import retrieve_url
+    except ImportError:
+        from helpers import retrieve_url
 except ModuleNotFoundError:
     pass
 
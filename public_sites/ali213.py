@@ -13,7 +13,10 @@ import threading
 import time
 # qBt
 from novaprinter import prettyPrinter
-from helpers import retrieve_url
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 
 
 # noinspection PyPep8Naming
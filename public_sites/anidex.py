@@ -13,7 +13,17 @@ except ImportError:
     # Python 2
     from HTMLParser import HTMLParser
 
-from helpers import retrieve_url
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
+try:
+    from qbt_common.ratelimit import default_limiter, pace
+    # no faster than the 2 seconds it used to sleep between requests
+    default_limiter().configure("anidex.info", rate=0.5, burst=1, concurrency=1)
+except ImportError:
+    def pace(url):
+        time.sleep(2)
 from novaprinter import prettyPrinter
 
 
@@ -103,7 +113,7 @@ class anidex(object):
         for offset in range(50, total_results, 50):
             this_url = search_url + '&offset=' + str(offset)
             t = threading.Thread(args=(this_url,), target=self.do_search)
-            time.sleep(2)
+            pace(this_url)
             t.start()
             threads.append(t)
             # self.do_search(this_url)
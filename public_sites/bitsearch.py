@@ -25,8 +25,24 @@ import re
 import time
 from html.parser import HTMLParser
 
-from helpers import download_file, retrieve_url
+from helpers import download_file
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter, anySizeToBytes
+try:
+    from qbt_common.ratelimit import default_limiter, paced_pages
+    # no faster than the 0.75 seconds it used to sleep between requests
+    default_limiter().configure("bitsearch.to", rate=1.3, burst=1, concurrency=2)
+except ImportError:
+    def paced_pages(fetch, urls):
+        for url in urls:
+            try:
+                yield fetch(url)
+            except Exception as ex:
+                yield ex
+            time.sleep(0.75)
 
 class bitsearch(object):
     url = 'https://bitsearch.to'
@@ -248,14 +264,13 @@ class bitsearch(object):
         if pages > 0:
             parser.feed(retrievedHtml)
 
-            while page <= min(pages, 10):
-                page_url = f'{self.url}/search?q={what}&page={page}'
-
+            page_urls = [f'{self.url}/search?q={what}&page={page}'
+                         for page in range(page, min(pages, 10) + 1)]
+            for retrievedHtml in paced_pages(retrieve_url, page_urls):
+                if isinstance(retrievedHtml, Exception):
+                    continue
                 try:
-                    retrievedHtml = retrieve_url(page_url)
                     parser.feed(retrievedHtml)
                 except:
                     pass
-                page += 1
-                time.sleep(0.75)
         parser.close()
@@ -3,7 +3,11 @@
 
 from html.parser import HTMLParser
 from urllib.parse import urljoin
-from helpers import retrieve_url, download_file
+from helpers import download_file
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter
 import re
 import json
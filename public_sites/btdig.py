@@ -27,10 +27,34 @@ import urllib.request
 import re
 import math
 import time
-import gzip
-from io import BytesIO
+import zlib
 from novaprinter import prettyPrinter
 import urllib.parse
+try:
+    from qbt_common.transport import urlopen
+except ImportError:
+    from urllib.request import urlopen
+try:
+    from qbt_common.decoding import ACCEPT_ENCODING, decode_body
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+    def decode_body(body, encoding):
+        if encoding in ('gzip', 'x-gzip', 'deflate'):
+            return zlib.decompress(body, zlib.MAX_WBITS | 32)
+        return body
+try:
+    from qbt_common.ratelimit import default_limiter, paced_pages
+    # no faster than the second it used to sleep between requests
+    default_limiter().configure("btdig.com", rate=1.0, burst=1, concurrency=1)
+except ImportError:
+    def paced_pages(fetch, urls):
+        for url in urls:
+            time.sleep(1)
+            try:
+                yield fetch(url)
+            except Exception as ex:
+                yield ex
 
 class btdig(object):
     url = 'https://www.btdig.com'
@@ -41,7 +65,7 @@ class btdig(object):
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:128.0) Gecko/20100101 Firefox/128.0',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/png,image/svg+xml,*/*;q=0.8',
             'Accept-Language': 'en-GB,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate, br, zstd',
+            'Accept-Encoding': ACCEPT_ENCODING,
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
             'Sec-Fetch-Dest': 'document',
@@ -67,19 +91,19 @@ class btdig(object):
 
         self.parse_page(response)
 
-        for page in range(1, total_pages):
-            time.sleep(1)  # Sleep for 1 second between requests
-            url = f"{self.url}/search?q={what.replace(' ', '+')}&p={page}&order=0"
-            response = self.get_response(urllib.request.Request(url, headers=headers))
-            self.parse_page(response)
+        page_urls = [f"{self.url}/search?q={what.replace(' ', '+')}&p={page}&order=0"
+                     for page in range(1, total_pages)]
+        fetch = lambda url: self.get_response(urllib.request.Request(url, headers=headers))
+        # paced per host by the shared limiter, or 1 second apart without it
+        for response in paced_pages(fetch, page_urls):
+            if not isinstance(response, Exception):
+                self.parse_page(response)
 
     def get_response(self, req):
         try:
-            with urllib.request.urlopen(req) as response:
-                if response.info().get('Content-Encoding') == 'gzip':
-                    gzip_file = gzip.GzipFile(fileobj=BytesIO(response.read()))
-                    return gzip_file.read().decode('utf-8', errors='ignore')
-                return response.read().decode('utf-8', errors='ignore')
+            with urlopen(req) as response:
+                body = decode_body(response.read(), response.info().get('Content-Encoding'))
+                return body.decode('utf-8', errors='ignore')
         except Exception as e:
             return ""
 
@@ -21,7 +21,10 @@
 # SOFTWARE.
 
 from datetime import datetime
-from helpers import retrieve_url
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 import json
 from novaprinter import prettyPrinter
 from urllib.parse import urlencode
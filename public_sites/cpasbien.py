@@ -16,7 +16,12 @@ logger = logging.getLogger()
 
 from html.parser import HTMLParser
 
-from helpers import retrieve_url, headers, download_file
+from helpers import headers, download_file
+try:
+    from qbt_common.transport import retrieve_url, urlopen
+except ImportError:
+    from helpers import retrieve_url
+    from urllib.request import urlopen
 from novaprinter import prettyPrinter
 
 
@@ -38,7 +43,7 @@ class cpasbien():
         link_github = "https://raw.githubusercontent.com/MarcBresson/cpasbien/master/cpasbien.url"
         try:
             req = urllib.request.Request(link_github, headers=headers)
-            response = urllib.request.urlopen(req)
+            response = urlopen(req)
             content: str = response.read().decode()
             cpasbien_url = content.strip()
             return cpasbien_url
@@ -62,7 +67,7 @@ class cpasbien():
         req = urllib.request.Request(desc_link, headers=headers)
 
         try:
-            response = urllib.request.urlopen(req)
+            response = urlopen(req)
         except urllib.error.URLError as errno:
             print(" ".join(("Connection error:", str(errno.reason))))
             return ""
@@ -171,3 +176,11 @@ def unit_fr2en(size):
         lambda match: match.group(1) + 'B',
         size, flags=re.IGNORECASE
     )
+
+
+try:
+    # Forward to the warm engine daemon when it is running
+    from qbt_common.daemon import served
+    cpasbien = served(cpasbien)
+except ImportError:
+    pass
@@ -15,7 +15,10 @@ from re import compile as re_compile
 from time import mktime
 from urllib import parse
 
-from helpers import retrieve_url
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter
 
 LOG_FORMAT = '[%(asctime)s] %(levelname)s:%(name)s:%(funcName)s - %(message)s'
@@ -49,20 +52,27 @@ class darklibria:
         data = self.request_get(url)
         if not data:
             return
-        parser = Parser(data)
-        serials = parser.find_all('tbody', {'style': 'vertical-align: center'})
+        results = None
         with ThreadPoolExecutor() as executor:
-            for serial in serials:
-                executor.submit(self.handle_serial, serial.a['href'])
-        return parser
+            for tag in select(data, 'tbody[style*="vertical-align: center"]',
+                              'span.text.text-light.mt-0'):
+                if tag.type == 'tbody':
+                    executor.submit(self.handle_serial, tag.a['href'])
+                elif results is None:
+                    results = tag
+        return results
 
     def handle_serial(self, url):
         data = self.request_get(url)
         if not data:
             return
-        parser = Parser(data)
-        name = parser.find(attrs={'id': 'russian_name'}).text
-        for torrent_row in parser.find_all('tr', {'class': 'torrent'}):
+        name, torrent_rows = None, []
+        for tag in select(data, '#russian_name', 'tr.torrent'):
+            if tag.attrs.get('id') == 'russian_name':
+                name = tag.text if name is None else name
+            else:
+                torrent_rows.append(tag)
+        for torrent_row in torrent_rows:
             self.handle_torrent_row(torrent_row, name, url)
 
     def handle_torrent_row(self, torrent_row, name, url):
@@ -119,8 +129,7 @@ class darklibria:
         if self.output:
             prettyPrinter(dictionary)
 
-    def set_search_data(self, parser):
-        results = parser.find('span', {'class': 'text text-light mt-0'})
+    def set_search_data(self, results):
         if results:
             parts = results.text.split()
             items_count = int(parts[4])
@@ -235,30 +244,73 @@ class Tag:
             return '<{}>{}</{}>\n'.format(starttag, nested, self.type)
 
 
-class Parser(HTMLParser):
-    def __init__(self, html_code, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+class Select(HTMLParser):
+    """Builds Tags only for the elements matching a selector (and what they
+    contain), skipping the rest of the page. Selectors are compound:
+    tag, .class, #id, [attr], [attr="value"] and [attr*="value"], e.g.
+    'tr.torrent'. Matches are outermost: no match is looked for inside
+    another."""
 
-        self._root = Tag('_root')
-        self._path = [self._root]
+    selector_regex = re_compile(
+        r'([\w-]+)|\.([\w-]+)|#([\w-]+)|\[([\w-]+)(?:(\*?=)"([^"]*)")?\]')
+    void_tags = frozenset(('area', 'base', 'br', 'col', 'embed', 'hr', 'img',
+                           'input', 'link', 'meta', 'source', 'track', 'wbr'))
 
-        self.feed(''.join(map(str.strip, html_code.splitlines())))
-        self.handle_endtag(self._root.type)
-        self.close()
+    def __init__(self, selectors):
+        super().__init__()
 
-        self.find = self._root.find
-        self.find_all = self._root.find_all
+        self.selectors = [self.compile(selector) for selector in selectors]
+        self.matches = []
+        self._path = []
 
-    @property
-    def attrs(self):
-        return self._root.attrs
+    @classmethod
+    def compile(cls, selector):
+        tag, classes, attrs, pos = None, set(), [], 0
+        for match in cls.selector_regex.finditer(selector):
+            if match.start() != pos:
+                break
+            pos = match.end()
+            name, class_, id_, attr, op, value = match.groups()
+            if name:
+                tag = name
+            elif class_:
+                classes.add(class_)
+            elif id_:
+                attrs.append(('id', '=', id_))
+            else:
+                attrs.append((attr, op, value))
+
+        if pos != len(selector) or not selector:
+            raise ValueError('Unsupported selector %r' % selector)
+
+        return tag, classes, attrs
+
+    def is_match(self, tag, attrs):
+        attrs = dict(attrs)
+        for type, classes, conditions in self.selectors:
+            if type and type != tag:
+                continue
+            if not classes.issubset((attrs.get('class') or '').split()):
+                continue
+            for attr, op, value in conditions:
+                actual = attrs.get(attr)
+                if actual is None or op == '=' and actual != value \
+                        or op == '*=' and value not in actual:
+                    break
+            else:
+                return True
 
-    @property
-    def text(self):
-        return self._root.text
+        return False
 
     def handle_starttag(self, tag, attrs):
-        self._path.append(Tag(tag=tag, attrs=attrs))
+        if self._path:
+            self._path.append(Tag(tag=tag, attrs=attrs))
+        elif self.is_match(tag, attrs):
+            if tag in self.void_tags:
+                self.matches.append(
+                    Tag(tag=tag, attrs=attrs, is_self_closing=True))
+            else:
+                self._path = [Tag(tag=tag, attrs=attrs)]
 
     def handle_endtag(self, tag_type):
         for pos, tag in tuple(enumerate(self._path))[::-1]:
@@ -273,26 +325,48 @@ class Parser(HTMLParser):
 
                 self._path = self._path[:pos + 1]
 
+                if not pos:
+                    self.matches.append(tag)
+                    self._path = []
+
                 break
 
     def handle_startendtag(self, tag, attrs):
-        self._path.append(Tag(tag=tag, attrs=attrs, is_self_closing=True))
-
-    def handle_decl(self, decl):
-        self._path.append(Tag(tag='!'+decl, is_self_closing=True))
+        if self._path:
+            self._path.append(Tag(tag=tag, attrs=attrs, is_self_closing=True))
+        elif self.is_match(tag, attrs):
+            self.matches.append(Tag(tag=tag, attrs=attrs, is_self_closing=True))
 
     def handle_data(self, text):
-        self._path.append(text)
+        if self._path:
+            self._path.append(text)
 
-    def __getitem__(self, key):
-        return self.attrs[key]
+    def close(self):
+        super().close()
+        # an element left open by the end of the page
+        if self._path:
+            self.handle_endtag(self._path[0].type)
 
-    def __getattr__(self, attr):
-        if not attr.startswith("__"):
-            return getattr(self._root, attr)
+    def pop_matches(self):
+        matches, self.matches = self.matches, []
+        return matches
 
-    def __repr__(self):
-        return ''.join(str(c) for c in self._root._content)
+
+def select(html, *selectors, chunk_size=1 << 16):
+    """Yields the Tags of html matching any of the selectors, in document
+    order, as soon as each one is complete"""
+    if not html:
+        return
+
+    parser = Select(selectors)
+    html = ''.join(map(str.strip, html.splitlines()))
+
+    for pos in range(0, len(html), chunk_size):
+        parser.feed(html[pos:pos + chunk_size])
+        yield from parser.pop_matches()
+
+    parser.close()
+    yield from parser.pop_matches()
 
 
 def utc2local(utc):
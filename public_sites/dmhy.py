@@ -15,9 +15,12 @@
 #  along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from html.parser import HTMLParser
-from helpers import download_file, retrieve_url
+from helpers import download_file
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter
-from lxml import etree
 
 
 # some other imports if necessary
@@ -80,6 +83,9 @@ class dmhy(object):
         `what` is a string with the search tokens, already escaped (e.g. "Ubuntu+Linux")
         `cat` is the name of a search category in ('all', 'anime', 'books', 'games', 'movies', 'music', 'pictures', 'software', 'tv')
         """
+        # lxml is imported here so that listing the engine stays cheap
+        from lxml import etree
+
         hits = []
         url = self.url
         page = 1
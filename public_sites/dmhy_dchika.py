@@ -3,10 +3,10 @@
 import re
 from enum import Enum
 from html.parser import HTMLParser
-from helpers import (
-    # download_file,
-    retrieve_url,
-)
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter
 
 ENGINE_BASEURL = 'http://dmhy.org'
@@ -27,7 +27,18 @@ import xml.etree.ElementTree as ET
 from html.parser import HTMLParser
 import time
 import threading
-from helpers import download_file, retrieve_url
+from helpers import download_file
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
+try:
+    from qbt_common.ratelimit import default_limiter, pace
+    # no faster than the half second it used to sleep between requests
+    default_limiter().configure("dontorrent.phd", rate=2.0, burst=1, concurrency=2)
+except ImportError:
+    def pace(url):
+        time.sleep(0.5)
 from novaprinter import prettyPrinter, anySizeToBytes
 
 class dontorrent(object):
@@ -213,7 +224,7 @@ class dontorrent(object):
             while page <= pages:
                 t = threading.Thread(args=(page, what), target=self.threaded_search)
                 t.start()
-                time.sleep(0.5)
+                pace(self.get_page_url())
                 threads.append(t)
 
                 page += 1
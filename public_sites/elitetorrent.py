@@ -7,7 +7,11 @@ from datetime import datetime
 from html.parser import HTMLParser
 
 from novaprinter import prettyPrinter
-from helpers import download_file, retrieve_url
+from helpers import download_file
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 
 MAX_DEPTH = 10
 
@@ -4,7 +4,10 @@
 import json
 from datetime import datetime, timezone
 from urllib.parse import unquote
-from helpers import retrieve_url
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter
 
 
@@ -4,8 +4,18 @@
 import re
 from time import sleep
 
-from helpers import retrieve_url
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter
+try:
+    from qbt_common.ratelimit import default_limiter, pace
+    # no faster than the 5 seconds it used to sleep between requests
+    default_limiter().configure("glodls.to", rate=0.2, burst=1, concurrency=1)
+except ImportError:
+    def pace(url):
+        sleep(5)
 
 
 class glotorrents(object):
@@ -71,4 +81,4 @@ class glotorrents(object):
             if parser.noTorrents:
                 break
             counter += 1
-            sleep(5)
+            pace(url)
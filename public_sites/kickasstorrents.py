@@ -4,8 +4,18 @@
 import re
 from time import sleep
 
-from helpers import retrieve_url
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter
+try:
+    from qbt_common.ratelimit import default_limiter, pace
+    # no faster than the second it used to sleep between requests
+    default_limiter().configure("katcr.to", rate=1.0, burst=1, concurrency=1)
+except ImportError:
+    def pace(url):
+        sleep(1)
 
 
 class kickasstorrents(object):
@@ -46,7 +56,7 @@ class kickasstorrents(object):
                         'desc_link': detail_link,
                     }
                     prettyPrinter(data)
-                    sleep(1)
+                    pace(detail_link)
             return trs
 
         def __retrieve_download_link(self, detail_link):
@@ -25,7 +25,10 @@ import re
 # import qBT modules
 try:
     from novaprinter import prettyPrinter
-    from helpers import retrieve_url
+    try:
+        from qbt_common.transport import retrieve_url
+    except ImportError:
+        from helpers import retrieve_url
 except:
     pass
 
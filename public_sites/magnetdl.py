@@ -6,7 +6,10 @@
 import re
 # qBt
 from novaprinter import prettyPrinter
-from helpers import retrieve_url
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 
 
 # noinspection PyPep8Naming
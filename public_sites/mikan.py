@@ -7,6 +7,11 @@ from xml.etree import ElementTree
 from helpers import headers
 from novaprinter import prettyPrinter
 
+try:
+    from qbt_common.transport import urlopen
+except ImportError:
+    from urllib.request import urlopen
+
 
 class mikan:
 
@@ -25,7 +30,7 @@ class mikan:
         req = urllib.request.Request(
             f"{cls.url}/RSS/Search?searchstr={target}", headers=headers
         )
-        res = urllib.request.urlopen(req)
+        res = urlopen(req)
         if res.status != 200: raise Exception(f"http status code {res.status}")
         return res.read().decode('utf-8')
 
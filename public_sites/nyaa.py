@@ -2,8 +2,11 @@
 #AUTHORS: Phuong Tran (phuongtm6994@gmail.com)
 # LICENSING INFORMATION
 from novaprinter import prettyPrinter
-from helpers import retrieve_url, download_file
-from bs4 import BeautifulSoup
+from helpers import download_file
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 import re
 import math
 
@@ -23,6 +26,8 @@ class nyaa(object):
   def search(self, what, cat='all'):
     # what is a string with the search tokens, already escaped (e.g. "Ubuntu+Linux")
     # cat is the name of a search category in ('all', 'movies', 'tv', 'music', 'games', 'anime', 'software', 'pictures', 'books')
+    # bs4 is imported here so that listing the engine stays cheap
+    from bs4 import BeautifulSoup
     # q - query, f - filter, c - category
     base_url = 'https://sukebei.nyaa.si/?q=%s&f=0&c=0_0'
     base_url_with_query = base_url % what
@@ -3,7 +3,10 @@
 
 import json
 from urllib.parse import unquote
-from helpers import retrieve_url
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter
 
 
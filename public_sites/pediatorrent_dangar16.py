@@ -2,7 +2,11 @@
 # AUTHORS: Daniel Naranjo (garcianaranjodaniel@gmail.com)
 # LICENSING INFORMATION
 
-from helpers import download_file, retrieve_url
+from helpers import download_file
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter
 # some other imports if necessary
 import re
@@ -12,7 +12,10 @@ import re
 import ssl
 import tempfile
 
-from urllib.request import urlopen
+try:
+    from qbt_common.transport import urlopen
+except ImportError:
+    from urllib.request import urlopen
 
 from helpers import retrieve_url
 # qBt
@@ -9,7 +9,10 @@ import random
 import re
 import string
 import time
-from helpers import retrieve_url
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter
 
 
@@ -62,7 +65,24 @@ class snowfl(object):
             else:
                 raise Exception('Error, please fill a bug report!')
 
+    # The token is kept for the instance's lifetime (long when served by the
+    # engine daemon) and only fetched again once the site rejects it
+    parser = None
+
     def search(self, what, cat='all'):
-        parser = self.Parser(self.url)
-        what = parser.generateQuery(what)
-        parser.feed(json.loads(retrieve_url(what)))
+        if self.parser is None:
+            self.parser = self.Parser(self.url)
+        try:
+            collection = json.loads(retrieve_url(self.parser.generateQuery(what)))
+        except ValueError:
+            self.parser = self.Parser(self.url)
+            collection = json.loads(retrieve_url(self.parser.generateQuery(what)))
+        self.parser.feed(collection)
+
+
+try:
+    # Forward to the warm engine daemon when it is running
+    from qbt_common.daemon import served
+    snowfl = served(snowfl)
+except ImportError:
+    pass
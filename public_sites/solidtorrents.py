@@ -24,7 +24,11 @@ import math
 import re
 from html.parser import HTMLParser
 
-from helpers import download_file, retrieve_url
+from helpers import download_file
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter, anySizeToBytes
 
 
@@ -7,7 +7,11 @@ from datetime import datetime
 from urllib.parse import parse_qs
 from urllib.parse import urlparse
 
-from helpers import download_file, retrieve_url
+from helpers import download_file
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter
 
 
@@ -24,7 +24,18 @@ import re
 from html.parser import HTMLParser
 import time
 import threading
-from helpers import download_file, retrieve_url
+from helpers import download_file
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
+try:
+    from qbt_common.ratelimit import default_limiter, pace
+    # no faster than the half second it used to sleep between requests
+    default_limiter().configure("therarbg.com", rate=2.0, burst=1, concurrency=2)
+except ImportError:
+    def pace(url):
+        time.sleep(0.5)
 from novaprinter import prettyPrinter, anySizeToBytes
 
 
@@ -183,7 +194,7 @@ class therarbg(object):
         while self.has_next_page:
             t = threading.Thread(args=(page, what, search_category), target=self.threaded_search)
             t.start()
-            time.sleep(0.5)
+            pace(self.url)
             threads.append(t)
     
             page += 1
@@ -13,7 +13,11 @@ from re import compile as re_compile
 
 #qBt
 from novaprinter import prettyPrinter
-from helpers import download_file, retrieve_url
+from helpers import download_file
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 
 class tokyotoshokan(object):
     url = 'http://tokyotosho.info'
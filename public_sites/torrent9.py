@@ -10,7 +10,12 @@ from __future__ import print_function
 import urllib
 import re
 from html.parser import HTMLParser
-from helpers import retrieve_url, headers, download_file
+from helpers import headers, download_file
+try:
+    from qbt_common.transport import retrieve_url, urlopen
+except ImportError:
+    from helpers import retrieve_url
+    from urllib.request import urlopen
 from novaprinter import prettyPrinter
 import tempfile
 import os
@@ -32,7 +37,7 @@ class torrent9(object):
         link_github = "https://raw.githubusercontent.com/menegop/qbfrench/master/urls.json"
         try:
             req = urllib.request.Request(link_github, headers=headers)
-            response = urllib.request.urlopen(req)
+            response = urlopen(req)
             content = response.read().decode()
             urls = json.loads(content)
             return urls['torrent9'][0]
@@ -48,7 +53,7 @@ class torrent9(object):
         # Download url
         req = urllib.request.Request(desc_link, headers=headers)
         try:
-            response = urllib.request.urlopen(req)
+            response = urlopen(req)
         except urllib.error.URLError as errno:
             print(" ".join(("Connection error:", str(errno.reason))))
             return ""
@@ -177,6 +182,14 @@ def unit_fr2en(size):
         size, flags=re.IGNORECASE
     )
 
+
+try:
+    # Forward to the warm engine daemon when it is running
+    from qbt_common.daemon import served
+    torrent9 = served(torrent9)
+except ImportError:
+    pass
+
 # For testing
 #if __name__ == "__main__":
 #    engine = torrent9()
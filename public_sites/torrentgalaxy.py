@@ -7,7 +7,10 @@ import re
 import math
 import time
 import threading
-from helpers import retrieve_url
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter
 # some other imports if necessary
 try:
@@ -2,7 +2,10 @@
 # AUTHOR: msagca
 # -*- coding: utf-8 -*-
 
-from helpers import retrieve_url
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from html.parser import HTMLParser
 from novaprinter import prettyPrinter
 from queue import Queue
@@ -6,7 +6,10 @@ import json
 from urllib.parse import urlencode, unquote
 
 from novaprinter import prettyPrinter
-from helpers import retrieve_url
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 
 class yggtracker(object):
 
@@ -4,7 +4,11 @@
 import re
 import urllib.parse
 
-from helpers import retrieve_url, download_file
+from helpers import download_file
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter
 
 
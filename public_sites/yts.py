@@ -2,7 +2,10 @@
 # AUTHORS: Lyra Aranha (lyra@lazulyra.com)
 
 import dataclasses
-from helpers import retrieve_url
+try:
+    from qbt_common.transport import retrieve_url
+except ImportError:
+    from helpers import retrieve_url
 from novaprinter import prettyPrinter
 from urllib.parse import urlencode, unquote
 import re
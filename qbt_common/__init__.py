@@ -0,0 +1,16 @@
+"""Shared runtime for the search engines in this collection.
+
+qBittorrent runs every engine from ``nova3/engines`` with ``nova3`` on
+``sys.path`` (that is how ``helpers`` and ``novaprinter`` are found). Copy this
+package next to ``helpers.py`` and the engines that know about it switch to it
+automatically; without it they fall back to their original code paths.
+"""
+
+import sys
+
+if sys.version_info < (3, 7):
+    # The engines import this package behind ``except ImportError``: on an
+    # older Python they keep their original code paths instead of failing
+    raise ImportError("qbt_common needs Python 3.7 or later")
+
+__version__ = "1.0"
@@ -0,0 +1,295 @@
+"""Offline benchmark and regression check for engines.
+
+Record a query once against the live site, then replay it as often as
+needed from a local stand-in with simulated latency and bandwidth::
+
+    python -m qbt_common.bench record public_sites/nyaasi.py -q "one piece"
+    python -m qbt_common.bench run public_sites/nyaasi.py -q "one piece" \\
+        --latency 0.08 --bandwidth 2000000
+
+``run`` measures every engine in its own subprocess (so peak RSS is the
+engine's own) and reports pages/s, results/s, time to first result and peak
+RSS, and compares the rows against the ones captured by ``record`` to catch
+parser regressions. Fixtures live in ``fixtures/<engine>/<query>-<cat>/`` and
+may hold session cookies of private trackers, keep them out of git.
+
+Engines import ``helpers``/``novaprinter``: run from qBittorrent's ``nova3``
+directory or point ``--nova3`` at it.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Optional
+from urllib.parse import quote
+
+from .replay import FixtureStore, StandIn, recording, replaying
+from .runner import DONE, Runner, engine_name, load_engine
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+DEFAULT_FIXTURES = Path("fixtures")
+ROWS_FILE = "rows.jsonl"
+
+
+def fixture_dir(root: Path, engine: str, query: str, cat: str) -> Path:
+    slug = re.sub(r"[^\w]+", "_", query, flags=re.UNICODE).strip("_").lower()
+    return root / Path(engine).stem / f"{slug or 'empty'}-{cat}"
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+
+
+def _search(engine: type, query: str, cat: str, deadline: float) -> tuple[list[dict], Optional[float], float, str]:
+    runner = Runner([engine], deadline=deadline, max_workers=1)
+    rows, first = [], None
+    started = time.monotonic()
+    for _, row in runner.run(quote(query), cat):
+        if first is None:
+            first = time.monotonic() - started
+        rows.append(row)
+    return rows, first, time.monotonic() - started, runner.reports[engine_name(engine)].state
+
+
+def record(args: argparse.Namespace) -> int:
+    for path in args.engines:
+        target = fixture_dir(args.fixtures, path, args.query, args.category)
+        store = FixtureStore(target)
+        with recording(store):
+            rows, _, elapsed, state = _search(
+                load_engine(path), args.query, args.category, args.deadline
+            )
+        with (target / ROWS_FILE).open("w", encoding="utf-8") as fd:
+            for row in rows:
+                fd.write(json.dumps(row, ensure_ascii=False) + "\n")
+        print(f"{Path(path).stem}: {len(rows)} rows in {elapsed:.2f}s ({state})"
+              f" -> {target}")
+    return 0
+
+
+def measure(args: argparse.Namespace) -> int:
+    """Replay one engine in this process and print its metrics as JSON."""
+    path = args.engines[0]
+    target = fixture_dir(args.fixtures, path, args.query, args.category)
+    store = FixtureStore(target)
+    engine = load_engine(path)
+    with StandIn(store, args.latency, args.bandwidth) as stand_in, replaying(stand_in):
+        rows, first, elapsed, state = _search(
+            engine, args.query, args.category, args.deadline
+        )
+    expected = _expected_rows(target)
+    result: dict[str, Any] = {
+        "engine": Path(path).stem,
+        "state": state,
+        "pages": stand_in.served,
+        "misses": len(stand_in.misses),
+        "bytes": stand_in.bytes_sent,
+        "results": len(rows),
+        "elapsed": elapsed,
+        "ttfr": first,
+        "pages_per_s": stand_in.served / elapsed if elapsed else 0.0,
+        "results_per_s": len(rows) / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "recorded": expected is not None,
+        "regression": _compare(expected, rows) if expected is not None else None,
+    }
+    print(json.dumps(result))
+    return 0
+
+
+def _expected_rows(target: Path) -> Optional[list[dict]]:
+    try:
+        with (target / ROWS_FILE).open(encoding="utf-8") as fd:
+            return [json.loads(line) for line in fd]
+    except FileNotFoundError:
+        return None
+
+
+def _compare(expected: list[dict], got: list[dict]) -> Optional[str]:
+    """Describe how replayed rows differ from the recorded ones, if they do."""
+    key = lambda row: (str(row.get("name")), str(row.get("link")))  # noqa: E731
+    want, have = sorted(map(key, expected)), sorted(map(key, got))
+    if want == have:
+        return None
+    missing, extra = len(set(want) - set(have)), len(set(have) - set(want))
+    return f"{len(have)}/{len(want)} rows, {missing} missing, {extra} unexpected"
+
+
+def run(args: argparse.Namespace) -> int:
+    env = dict(os.environ)
+    for var in ("http_proxy", "https_proxy", "HTTP_PROXY", "HTTPS_PROXY"):
+        env.pop(var, None)
+    package_root = str(Path(__file__).resolve().parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, (package_root, env.get("PYTHONPATH")))
+    )
+    failed = 0
+    header = f"{'engine':<20} {'pages':>5} {'pages/s':>8} {'results':>7} " \
+             f"{'res/s':>8} {'ttfr s':>7} {'rss MB':>7}  check"
+    print(header)
+    for path in args.engines:
+        cmd = [
+            sys.executable, "-m", "qbt_common.bench", "measure", path,
+            "-q", args.query, "-c", args.category, "-f", str(args.fixtures),
+            "-d", str(args.deadline), "--latency", str(args.latency),
+            "--bandwidth", str(args.bandwidth),
+        ] + (["--nova3", args.nova3] if args.nova3 else [])
+        proc = subprocess.run(cmd, capture_output=True, text=True, env=env)
+        try:
+            m = json.loads(proc.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            failed += 1
+            print(f"{Path(path).stem:<20} failed: {proc.stderr.strip()[-200:]}")
+            continue
+        check = "ok"
+        if m["regression"]:
+            check, failed = m["regression"], failed + 1
+        elif m["state"] != DONE or m["misses"]:
+            check = f"{m['state']}, {m['misses']} fixture misses"
+        elif not m["recorded"]:
+            check = "not recorded"
+        ttfr = "-" if m["ttfr"] is None else f"{m['ttfr']:.3f}"
+        rss = "-" if m["peak_rss_mb"] is None else f"{m['peak_rss_mb']:.1f}"
+        print(f"{m['engine']:<20} {m['pages']:>5} {m['pages_per_s']:>8.1f} "
+              f"{m['results']:>7} {m['results_per_s']:>8.1f} {ttfr:>7} "
+              f"{rss:>7}  {check}")
+    return 1 if failed else 0
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("mode", choices=("record", "run", "measure"))
+    parser.add_argument("engines", nargs="+", help="engine .py files")
+    parser.add_argument("-q", "--query", required=True)
+    parser.add_argument("-c", "--category", default="all")
+    parser.add_argument("-f", "--fixtures", type=Path, default=DEFAULT_FIXTURES)
+    parser.add_argument("-d", "--deadline", type=float, default=120.0)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added before every replayed response")
+    parser.add_argument("--bandwidth", type=int, default=0,
+                        help="replay bandwidth in bytes/s, 0 is unlimited")
+    parser.add_argument("--nova3", help="qBittorrent nova3 directory")
+    args = parser.parse_args(argv)
+    if args.nova3:
+        sys.path.insert(0, args.nova3)
+    return {"record": record, "run": run, "measure": measure}[args.mode](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+if "pytest" in sys.modules:
+    import pytest
+
+    from . import trace
+    from .replay import fixture_key
+    from .transport import default_transport
+
+    ENGINES = {
+        # helpers.retrieve_url style, on the shared keep-alive transport
+        "transported": """
+import re
+from qbt_common.transport import retrieve_url
+
+
+def prettyPrinter(row):
+    print(row)
+
+
+class transported:
+    url = "https://transported.test/"
+
+    def search(self, what, cat="all"):
+        for page in (1, 2):
+            html = retrieve_url(self.url + "search?q=%s&page=%d" % (what, page))
+            for name in re.findall(r"<li>(.+?)</li>", html):
+                prettyPrinter({"link": self.url + name, "name": name})
+""",
+        # urllib.request opener
+        "urllibbed": """
+import re
+from urllib.request import build_opener
+
+
+def prettyPrinter(row):
+    print(row)
+
+
+class urllibbed:
+    url = "https://urllibbed.test/"
+    opener = build_opener()
+
+    def search(self, what, cat="all"):
+        for page in (1, 2):
+            url = self.url + "search?q=%s&page=%d" % (what, page)
+            html = self.opener.open(url).read().decode()
+            for name in re.findall(r"<li>(.+?)</li>", html):
+                prettyPrinter({"link": self.url + name, "name": name})
+""",
+    }
+
+    def _page(items: list[str]) -> bytes:
+        return ("<ul>" + "".join(f"<li>{item}</li>" for item in items) + "</ul>").encode()
+
+    def _site(root: Path, engine: str) -> FixtureStore:
+        """What the tracker serves, as a fixture store."""
+        site = FixtureStore(root / "site")
+        if engine == "rutor":
+            from .runner import RUTOR_PAGE
+            pages = {"rutor.info/search/0/0/000/0/ubuntu": RUTOR_PAGE.encode()}
+        else:
+            pages = {
+                f"{engine}.test/search?q=ubuntu&page={page}": _page([f"ubuntu-{page}-{i}" for i in range(3)])
+                for page in (1, 2)
+            }
+        for where, body in pages.items():
+            host, _, target = where.partition("/")
+            site.save(fixture_key("GET", host, "/" + target, None), f"https://{where}",
+                      200, "OK", [("Content-Type", "text/html; charset=utf-8")], body)
+        return site
+
+    @pytest.mark.parametrize("engine", ["transported", "urllibbed", "rutor"])
+    def test_record_then_replay(tmp_path: Path, engine: str) -> None:
+        if engine == "rutor":
+            pytest.importorskip("novaprinter")
+            pytest.importorskip("socks")
+            source = (Path(__file__).parents[1] / "public_sites" / "rutor.py").read_text("utf-8")
+        else:
+            source = ENGINES[engine]
+        path = tmp_path / f"{engine}.py"
+        path.write_text(source, "utf-8")
+        store = FixtureStore(tmp_path / "fixtures")
+
+        # recording goes through whatever connection classes are in place,
+        # here the ones sending everything to the stand-in for the live site
+        with StandIn(_site(tmp_path, engine)) as site, replaying(site), recording(store):
+            recorded, _, _, state = _search(load_engine(path), "ubuntu", "all", 10)
+        assert state == DONE and recorded
+        # no pooled connection may still lead to the site
+        default_transport().close()
+
+        trace.configure(str(tmp_path / "trace.json"))
+        try:
+            with StandIn(store) as stand_in, replaying(stand_in):
+                replayed, _, _, state = _search(load_engine(path), "ubuntu", "all", 10)
+        finally:
+            trace.configure(None)
+        assert state == DONE
+        assert stand_in.misses == [] and stand_in.served == site.served
+        assert _compare(recorded, replayed) is None
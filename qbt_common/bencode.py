@@ -0,0 +1,283 @@
+"""One-pass bencode decoding for .torrent files and tracker responses.
+
+The engines that look inside torrents decoded them from a ``BytesIO`` one
+byte at a time and then bencoded the ``info`` dictionary again just to hash
+it. :func:`decode` walks the buffer once by offset, and
+:func:`decode_torrent` also records where the ``info`` value starts and ends,
+so the infohash is the SHA1 of those bytes as sent::
+
+    torrent = decode_torrent(data)
+    torrent.infohash, torrent.announce
+
+With ``lazy=True`` strings longer than :data:`LAZY_MIN` (the ``pieces``
+blob, mostly) are returned as memoryviews into ``data`` instead of copies.
+``python -m qbt_common.bencode [FILE ...]`` times it on the given torrents,
+or on generated multi-megabyte ones.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Optional, Union
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# strings from this many bytes on stay views in lazy mode
+LAZY_MIN = 1024
+
+_DICT, _LIST, _INT, _END = b"dlie"
+_DIGITS = frozenset(b"0123456789")
+
+
+class BencodeError(ValueError):
+    """The data is not valid bencode."""
+
+
+@dataclass
+class Torrent:
+    meta: dict[bytes, Any]
+    data: memoryview
+    # offsets of the raw ``info`` value in data
+    info_start: int
+    info_end: int
+
+    @property
+    def info(self) -> memoryview:
+        return self.data[self.info_start:self.info_end]
+
+    @property
+    def infohash(self) -> bytes:
+        """The v1 infohash, 20 bytes."""
+        return hashlib.sha1(self.info).digest()
+
+    @property
+    def announce(self) -> Optional[str]:
+        announce = self.meta.get(b"announce")
+        if not announce:
+            return None
+        return bytes(announce).decode("utf-8", "replace")
+
+
+class _Decoder:
+    def __init__(self, data: Buffer, lazy: bool) -> None:
+        self.view = memoryview(data).cast("B")
+        # bytes for find(): a copy only if data was not bytes already
+        self.data = data if isinstance(data, bytes) else self.view.tobytes()
+        self.lazy = lazy
+        self.info: Optional[tuple[int, int]] = None
+
+    def decode(self, pos: int, depth: int = 0) -> tuple[Any, int]:
+        try:
+            char = self.data[pos]
+        except IndexError:
+            raise BencodeError("EOF reached while parsing") from None
+        if char in _DIGITS:
+            return self.string(pos, self.lazy)
+        if char == _INT:
+            end = self.data.find(b"e", pos)
+            if end < 0:
+                raise BencodeError("EOF reached while parsing")
+            digits = self.data[pos + 1:end]
+            if not (digits[1:] if digits[:1] == b"-" else digits).isdigit():
+                raise BencodeError(f"Expected int at position {pos}")
+            return int(digits), end + 1
+        if char == _LIST:
+            items, pos = [], pos + 1
+            while self.peek(pos) != _END:
+                item, pos = self.decode(pos, depth + 1)
+                items.append(item)
+            return items, pos + 1
+        if char == _DICT:
+            obj, pos = {}, pos + 1
+            while self.peek(pos) != _END:
+                key, pos = self.string(pos, False)
+                start = pos
+                obj[key], pos = self.decode(pos, depth + 1)
+                if depth == 0 and key == b"info":
+                    self.info = start, pos
+            return obj, pos + 1
+        raise BencodeError(f"Unknown type {chr(char)!r} at position {pos}")
+
+    def string(self, pos: int, lazy: bool) -> tuple[Any, int]:
+        colon = self.data.find(b":", pos, pos + 21)
+        if colon < 0 or not self.data[pos:colon].isdigit():
+            raise BencodeError(f"Expected string at position {pos}")
+        start = colon + 1
+        end = start + int(self.data[pos:colon])
+        if end > len(self.data):
+            raise BencodeError("EOF reached while parsing")
+        if lazy and end - start >= LAZY_MIN:
+            return self.view[start:end], end
+        return self.data[start:end], end
+
+    def peek(self, pos: int) -> int:
+        try:
+            return self.data[pos]
+        except IndexError:
+            raise BencodeError("EOF reached while parsing") from None
+
+
+def decode(data: Buffer, lazy: bool = False) -> Any:
+    """The value ``data`` starts with: dicts, lists, ints and bytes
+    (memoryviews for long strings when lazy). Anything after it is ignored,
+    some trackers end their responses with a newline."""
+    return _Decoder(data, lazy).decode(0)[0]
+
+
+def decode_torrent(data: Buffer, lazy: bool = True) -> Torrent:
+    """A .torrent file's metainfo and where its ``info`` value lies."""
+    decoder = _Decoder(data, lazy)
+    meta = decoder.decode(0)[0]
+    if not isinstance(meta, dict):
+        raise BencodeError("Not a bencoded dict")
+    if decoder.info is None or not isinstance(meta[b"info"], dict):
+        raise BencodeError("No info dictionary")
+    return Torrent(meta, decoder.view, *decoder.info)
+
+
+def torrent_info(data: Buffer) -> tuple[bytes, Optional[str]]:
+    """(infohash, announce URL) of a .torrent file."""
+    torrent = decode_torrent(data)
+    return torrent.infohash, torrent.announce
+
+
+def _encode(value: Any, out: list[bytes]) -> None:
+    # only for the benchmark: sample torrents and the re-encoding it replaces
+    if isinstance(value, dict):
+        out.append(b"d")
+        for key in sorted(value):
+            _encode(key, out)
+            _encode(value[key], out)
+        out.append(b"e")
+    elif isinstance(value, list):
+        out.append(b"l")
+        for item in value:
+            _encode(item, out)
+        out.append(b"e")
+    elif isinstance(value, int):
+        out.append(b"i%de" % value)
+    else:
+        out.append(b"%d:%s" % (len(value), value))
+
+
+def sample(size: int, files: int) -> bytes:
+    """A torrent with about ``size`` bytes of pieces and ``files`` files."""
+    info = {
+        b"name": b"sample",
+        b"piece length": 262144,
+        b"pieces": bytes(size // 20 * 20),
+        b"files": [
+            {b"length": 1 << 20, b"path": [b"dir", b"file%05d.bin" % i]}
+            for i in range(files)
+        ],
+    }
+    out: list[bytes] = []
+    _encode({b"announce": b"http://tracker.test/announce", b"info": info}, out)
+    return b"".join(out)
+
+
+def _reencoded_infohash(data: bytes) -> bytes:
+    out: list[bytes] = []
+    _encode(decode(data)[b"info"], out)
+    return hashlib.sha1(b"".join(out)).digest()
+
+
+def bench(data: bytes, repeat: int) -> dict[str, float]:
+    """Milliseconds per call, best of ``repeat``."""
+    cases = {
+        "decode": lambda: decode(data),
+        "decode lazy": lambda: decode(data, lazy=True),
+        "infohash": lambda: decode_torrent(data).infohash,
+        "re-encoded infohash": lambda: _reencoded_infohash(data),
+    }
+    result = {}
+    for name, call in cases.items():
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            call()
+            best = min(best, time.perf_counter() - t0)
+        result[name] = best * 1000
+    return result
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("files", nargs="*", help=".torrent files (default: generated)")
+    parser.add_argument("-n", "--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.files:
+        inputs = []
+        for path in args.files:
+            with open(path, "rb") as file:
+                inputs.append((path, file.read()))
+    else:
+        inputs = [
+            (f"{mb} MiB, {files} files", sample(mb << 20, files))
+            for mb, files in ((2, 100), (8, 2000), (32, 10000))
+        ]
+
+    for name, data in inputs:
+        try:
+            timings = bench(data, args.repeat)
+        except BencodeError as e:
+            print(f"{name}: {e}", file=sys.stderr)
+            continue
+        mb = len(data) / (1 << 20)
+        cells = "  ".join(f"{k} {v:8.2f} ms" for k, v in timings.items())
+        print(f"{name:<24} {mb:7.2f} MiB  {cells}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+if "pytest" in sys.modules:
+    import pytest
+
+    def test_decode_values() -> None:
+        assert decode(b"d3:agei-42e4:listl1:ai0eee\n") == {b"age": -42, b"list": [b"a", 0]}
+        long = b"x" * LAZY_MIN
+        value = decode(b"%d:%s" % (len(long), long), lazy=True)
+        assert isinstance(value, memoryview) and value == long
+
+    def test_infohash_is_the_hash_of_the_raw_info_span() -> None:
+        data = sample(20 * 300, 5)
+        torrent = decode_torrent(data)
+        assert bytes(torrent.info) == data[torrent.info_start:torrent.info_end]
+        assert torrent.infohash == _reencoded_infohash(data)
+        assert torrent_info(data) == (torrent.infohash, "http://tracker.test/announce")
+
+    def test_infohash_of_unsorted_info_keys() -> None:
+        # re-encoding sorts the keys, the hash must not
+        info = b"d6:pieces0:4:name1:ae"
+        data = b"d4:info" + info + b"e"
+        assert decode_torrent(data).infohash == hashlib.sha1(info).digest()
+        assert decode_torrent(data).infohash != _reencoded_infohash(data)
+
+    @pytest.mark.parametrize("data", [
+        b"",
+        b"d4:info",
+        b"d4:infod4:name",
+        b"d4:infod4:name10:shorte",
+        b"li1",
+        b"i12",
+        b"i1x2e",
+        b"x",
+        b"l5xabcde",
+        b"di1e1:ae",
+    ])
+    def test_truncated_or_invalid(data: bytes) -> None:
+        with pytest.raises(BencodeError):
+            decode(data)
+
+    @pytest.mark.parametrize("data", [b"le", b"d8:announce0:e", b"d4:infoi1ee"])
+    def test_not_a_torrent(data: bytes) -> None:
+        with pytest.raises(BencodeError):
+            decode_torrent(data)
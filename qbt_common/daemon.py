@@ -0,0 +1,569 @@
+"""Warm engine daemon serving searches and downloads over a Unix socket.
+
+qBittorrent starts a new ``nova2.py``/``nova2dl.py`` process for every search
+and download, so engines with expensive setup (RuTracker signs in from
+``__init__``, gazellegames looks up its passkey, snowfl scrapes a token,
+torrent9/cpasbien fetch their current domain) repeat it every time. The
+daemon keeps one instance per engine, with its session and the shared
+transport's connection pools, alive between requests.
+
+Engines opt in at the end of their module::
+
+    try:
+        from qbt_common.daemon import served
+        gazellegames = served(gazellegames)
+    except ImportError:
+        pass
+
+:func:`served` returns a subclass with the same ``name``, ``url`` and
+``supported_categories`` whose ``search``/``download_torrent`` forward to the
+daemon and replay its output, rows through the local ``prettyPrinter`` and
+anything printed (the ``path url`` line of a download) to stdout. Without a
+running daemon the shim creates the real engine and calls it in-process.
+
+Start it from qBittorrent's ``nova3`` directory (engines are loaded from the
+path the shim sends, with their ``nova3`` directory put on ``sys.path``)::
+
+    python -m qbt_common.daemon --idle 3600
+
+The socket is ``$QBT_DAEMON_SOCKET``, or ``qbt-engines.sock`` in
+``$XDG_RUNTIME_DIR``, or else in a ``qbt-engines-<uid>`` directory (mode 0700)
+of the temporary directory, and is created accessible to the current user
+only. The shim copies what the daemon sends to qBittorrent's stdout, so it
+only connects to a socket that belongs to the current user, is closed to
+everyone else and lies in a directory nobody else can swap it in. Requests
+for one engine are served one at a time; different engines run in parallel.
+
+With ``--store`` searches go through a :class:`~qbt_common.store.ResultStore`
+as they do in the runner: a repeated search is answered from the store, and
+refreshed in the daemon after the answer once the engine's ``refresh_after``
+has passed; every search the engine completes is saved.
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import os
+import socket
+import stat
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from . import trace
+from .runner import load_engine, redirect_printer
+from .store import DEFAULT_PATH, ResultStore
+
+CONNECT_TIMEOUT = 2.0
+
+
+def socket_path() -> str:
+    if os.environ.get("QBT_DAEMON_SOCKET"):
+        return os.environ["QBT_DAEMON_SOCKET"]
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "qbt-engines.sock")
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(tempfile.gettempdir(), f"qbt-engines-{uid}", "engines.sock")
+
+
+def _owned(st: os.stat_result) -> bool:
+    return st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+
+def trusted(path: str) -> bool:
+    """Whether ``path`` is a socket only the current user could have put there.
+
+    The socket must belong to the user and be closed to group and others,
+    and its directory must be the user's (or root's) and, when others can
+    write to it, sticky, so nobody else can replace the socket.
+    """
+    if not hasattr(os, "getuid"):
+        return False
+    try:
+        st = os.lstat(path)
+        parent = os.stat(os.path.dirname(os.path.abspath(path)))
+    except OSError:
+        return False
+    if not stat.S_ISSOCK(st.st_mode) or not _owned(st):
+        return False
+    if parent.st_uid not in (0, os.getuid()):
+        return False
+    return not parent.st_mode & 0o022 or bool(parent.st_mode & stat.S_ISVTX)
+
+
+def _private_dir(path: str) -> None:
+    """Create the default socket's directory, for the current user only."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or not _owned(st):
+        raise RuntimeError(f"{directory} is not a private directory of this user")
+
+
+class DaemonError(Exception):
+    """The daemon ran the request and the engine raised."""
+
+
+def _send_line(sock: Any, message: dict) -> None:
+    sock.sendall(json.dumps(message, default=str).encode("utf-8") + b"\n")
+
+
+class _Stdout(io.TextIOBase):
+    """``sys.stdout`` that sends writes of request threads to their client."""
+
+    def __init__(self, default: Any) -> None:
+        self.default = default
+        self.local = threading.local()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        emit = getattr(self.local, "emit", None)
+        if emit is None:
+            return self.default.write(text)
+        emit({"out": text})
+        return len(text)
+
+    def flush(self) -> None:
+        self.default.flush()
+
+
+class _Warm:
+    """One engine kept alive: its class, lazily created instance and lock."""
+
+    def __init__(self, engine: type, name: str = "", store: Optional[ResultStore] = None) -> None:
+        self.engine = engine
+        self.name = name
+        self.store = store
+        self.instance: Any = None
+        self.lock = threading.Lock()
+        self.emit: Optional[Callable[[dict], None]] = None
+        redirect_printer(engine, self._sink)
+
+    def _sink(self, row: dict) -> None:
+        # rows may come from the engine's own worker threads
+        emit = self.emit
+        if emit is not None:
+            emit({"row": dict(row)})
+
+    def call(self, request: dict, emit: Callable[[dict], None]) -> None:
+        if self.store is None or request["op"] != "search":
+            return self._run(request, emit)
+        what, cat = request["what"], request.get("cat", "all")
+        stored = self.store.lookup(self.name, what, cat)
+        if stored is None:
+            self._search(request, emit)
+            return
+        for row in stored.rows:
+            emit({"row": row})
+        if stored.needs_refresh:
+            threading.Thread(target=self._search, args=(request,), daemon=True).start()
+
+    def _search(self, request: dict, emit: Optional[Callable[[dict], None]] = None) -> None:
+        """Run a search and save its rows once the engine returns."""
+        rows: list[dict] = []
+
+        def keep(message: dict) -> None:
+            if "row" in message:
+                rows.append(message["row"])
+            if emit is not None:
+                emit(message)
+
+        self._run(request, keep)
+        assert self.store is not None
+        self.store.save(self.name, request["what"], request.get("cat", "all"), rows)
+
+    def _run(self, request: dict, emit: Callable[[dict], None]) -> None:
+        with self.lock:
+            self.emit = emit
+            try:
+                with trace.span(request["op"], self.engine.__name__):
+                    if self.instance is None:
+                        self.instance = self.engine()
+                    if request["op"] == "search":
+                        self.instance.search(request["what"], request.get("cat", "all"))
+                    else:
+                        self.instance.download_torrent(request["url"])
+            finally:
+                self.emit = None
+
+
+class EngineDaemon:
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        idle_timeout: Optional[float] = None,
+        store: Optional[ResultStore] = None,
+    ) -> None:
+        self.path = path or socket_path()
+        self.idle_timeout = idle_timeout
+        self.store = store
+        self._engines: dict[str, _Warm] = {}
+        self._lock = threading.Lock()
+        self._stdout = _Stdout(sys.stdout)
+
+    def engine(self, path: str) -> _Warm:
+        path = str(Path(path).resolve())
+        with self._lock:
+            warm = self._engines.get(path)
+            if warm is None:
+                nova3 = str(Path(path).parent.parent)
+                if (Path(nova3) / "nova2.py").exists() and nova3 not in sys.path:
+                    sys.path.insert(0, nova3)
+                engine = load_engine(path)
+                warm = self._engines[path] = _Warm(
+                    getattr(engine, "__served__", engine), Path(path).stem, self.store
+                )
+            return warm
+
+    def serve_forever(self) -> None:
+        if self.path == socket_path() and not os.environ.get("QBT_DAEMON_SOCKET"):
+            _private_dir(self.path)
+        if os.path.exists(self.path):
+            if _connect(self.path) is not None:
+                raise RuntimeError(f"A daemon is already listening on {self.path}")
+            os.unlink(self.path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            server.bind(self.path)
+        finally:
+            os.umask(umask)
+        server.listen()
+        server.settimeout(self.idle_timeout)
+        sys.stdout = self._stdout
+        try:
+            while True:
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    if not self._busy():
+                        return
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            sys.stdout = self._stdout.default
+            server.close()
+            os.unlink(self.path)
+
+    def _busy(self) -> bool:
+        return any(warm.lock.locked() for warm in self._engines.values())
+
+    def _handle(self, conn: socket.socket) -> None:
+        send_lock = threading.Lock()
+
+        def emit(message: dict) -> None:
+            with send_lock:
+                _send_line(conn, message)
+
+        with conn, conn.makefile("rb") as reader:
+            try:
+                request = json.loads(reader.readline())
+                if request["op"] != "ping":
+                    self._stdout.local.emit = emit
+                    try:
+                        self.engine(request["engine"]).call(request, emit)
+                    finally:
+                        self._stdout.local.emit = None
+                emit({"done": True})
+            except Exception as ex:
+                try:
+                    emit({"error": f"{type(ex).__name__}: {ex}"})
+                except OSError:
+                    pass  # client went away
+
+
+def _connect(path: str) -> Optional[socket.socket]:
+    if not hasattr(socket, "AF_UNIX") or not trusted(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    sock.settimeout(None)
+    return sock
+
+
+def _printer(engine: type) -> Callable[[dict], None]:
+    module = sys.modules[engine.__module__]
+    if hasattr(module, "prettyPrinter"):
+        return module.prettyPrinter  # type: ignore[no-any-return]
+    return module.novaprinter.prettyPrinter  # type: ignore[no-any-return]
+
+
+def served(engine: type) -> type:
+    """Wrap an engine class so instances forward to the daemon if it runs."""
+    source = os.path.abspath(sys.modules[engine.__module__].__file__ or "")
+
+    class Shim(engine):  # type: ignore[misc,valid-type]
+        __served__ = engine
+
+        def __init__(self) -> None:
+            # the real engine (and its sign-in) is only created without daemon
+            self._local: Any = None
+
+        def search(self, what: str, cat: str = "all") -> None:
+            if not self._forward({"op": "search", "what": what, "cat": cat}):
+                self._engine().search(what, cat)
+
+        def download_torrent(self, info: str) -> None:
+            if not self._forward({"op": "download", "url": info}):
+                self._engine().download_torrent(info)
+
+        def _engine(self) -> Any:
+            if self._local is None:
+                self._local = engine()
+            return self._local
+
+        def _forward(self, request: dict) -> bool:
+            """Run the request in the daemon; ``False`` if none answered."""
+            sock = _connect(socket_path())
+            if sock is None:
+                return False
+            started = False
+            with sock, sock.makefile("rb") as reader:
+                try:
+                    _send_line(sock, dict(request, engine=source))
+                    for line in reader:
+                        message = json.loads(line)
+                        if "row" in message:
+                            _printer(engine)(message["row"])
+                        elif "out" in message:
+                            sys.stdout.write(message["out"])
+                        elif "error" in message:
+                            raise DaemonError(message["error"])
+                        else:
+                            return True
+                        started = True
+                except OSError:
+                    if started:
+                        raise
+                    return False
+            # connection closed without a result
+            if started:
+                raise DaemonError("daemon closed the connection")
+            return False
+
+    for attr in ("__name__", "__qualname__", "__module__", "__doc__"):
+        setattr(Shim, attr, getattr(engine, attr))
+    return Shim
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("engines", nargs="*", help="engine .py files to warm up front")
+    parser.add_argument("--socket", help="socket path (default: %(default)s)",
+                        default=socket_path())
+    parser.add_argument("--idle", type=float,
+                        help="exit after this many idle seconds")
+    parser.add_argument("--nova3", help="qBittorrent nova3 directory")
+    parser.add_argument("-s", "--store", type=Path, nargs="?",
+                        const=DEFAULT_PATH,
+                        help="answer from and save to a result store"
+                             " (default qbt_common/results.sqlite3)")
+    args = parser.parse_args(argv)
+    if args.nova3:
+        sys.path.insert(0, args.nova3)
+    daemon = EngineDaemon(args.socket, args.idle,
+                          ResultStore(args.store) if args.store else None)
+    for path in args.engines:
+        daemon.engine(path)
+    daemon.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+if "pytest" in sys.modules:
+    import importlib.util
+
+    import pytest
+
+    from .store import Freshness
+
+    @pytest.fixture
+    def listening(tmp_path: Path) -> Any:
+        path = str(tmp_path / "engines.sock")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen()
+        os.chmod(path, 0o600)
+        yield path
+        server.close()
+
+    ECHO = """
+from qbt_common.daemon import served
+
+searches = []
+
+
+def prettyPrinter(row):
+    raise AssertionError("rows go through the caller's printer")
+
+
+class echo:
+    url = "https://echo.test"
+    name = "Echo"
+    supported_categories = {"all": "0"}
+
+    def search(self, what, cat="all"):
+        if what == "boom":
+            raise ValueError(what)
+        searches.append(what)
+        prettyPrinter({"name": what, "link": f"{self.url}/{cat}/{len(searches)}"})
+
+    def download_torrent(self, info):
+        print("/tmp/echo.torrent " + info)
+
+
+echo = served(echo)
+"""
+
+    @pytest.fixture
+    def serve(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Any:
+        """Start a daemon on a private socket; return the caller's engine module."""
+        path = tmp_path / "echo.py"
+        path.write_text(ECHO)
+        monkeypatch.setenv("QBT_DAEMON_SOCKET", str(tmp_path / "engines.sock"))
+        threads = []
+
+        def start(store: Optional[ResultStore] = None) -> Any:
+            daemon = EngineDaemon(idle_timeout=0.5, store=store)
+            thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+            thread.start()
+            threads.append(thread)
+            while not os.path.exists(daemon.path):
+                thread.join(0.01)
+            # the caller's own copy, as nova2 imports it
+            spec = importlib.util.spec_from_file_location("echo", path)
+            assert spec is not None and spec.loader is not None
+            module = importlib.util.module_from_spec(spec)
+            monkeypatch.setitem(sys.modules, "echo", module)
+            spec.loader.exec_module(module)
+            module.rows = []
+            module.prettyPrinter = module.rows.append
+            return module
+
+        yield start
+        for thread in threads:
+            thread.join(5)
+            assert not thread.is_alive()
+
+    def test_shim_forwards_to_daemon(serve: Any, capsys: pytest.CaptureFixture) -> None:
+        caller = serve()
+        engine = caller.echo()
+        engine.search("Dune", "all")
+        engine.download_torrent("https://echo.test/dl/1")
+        warm = sys.modules["qbt_engine_echo"]
+        # run by the daemon's copy, printed by the caller
+        assert warm.searches == ["Dune"] and caller.searches == []
+        assert engine._local is None
+        assert caller.rows == [{"name": "Dune", "link": "https://echo.test/all/1"}]
+        assert capsys.readouterr().out == "/tmp/echo.torrent https://echo.test/dl/1\n"
+
+    def test_shim_runs_in_process_without_daemon(
+        tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        path = tmp_path / "echo.py"
+        path.write_text(ECHO)
+        monkeypatch.setenv("QBT_DAEMON_SOCKET", str(tmp_path / "engines.sock"))
+        spec = importlib.util.spec_from_file_location("echo", path)
+        assert spec is not None and spec.loader is not None
+        caller = importlib.util.module_from_spec(spec)
+        monkeypatch.setitem(sys.modules, "echo", caller)
+        spec.loader.exec_module(caller)
+        rows: list[dict] = []
+        caller.prettyPrinter = rows.append
+        caller.echo().search("Dune")
+        assert caller.searches == ["Dune"]
+        assert rows == [{"name": "Dune", "link": "https://echo.test/all/1"}]
+
+    def test_daemon_reports_engine_errors(serve: Any) -> None:
+        caller = serve()
+        with pytest.raises(DaemonError, match="ValueError: boom"):
+            caller.echo().search("boom")
+        assert caller.searches == []
+
+    def test_store_answers_repeated_searches(serve: Any, tmp_path: Path) -> None:
+        store = ResultStore(tmp_path / "results.sqlite3",
+                            {"echo": Freshness(ttl=60, refresh_after=60)})
+        caller = serve(store)
+        caller.echo().search("Dune")
+        caller.echo().search("dune")
+        warm = sys.modules["qbt_engine_echo"]
+        assert warm.searches == ["Dune"]
+        assert [row["link"] for row in caller.rows] == ["https://echo.test/all/1"] * 2
+        assert caller.searches == []
+
+    def test_store_refreshes_after_answering(serve: Any, tmp_path: Path) -> None:
+        store = ResultStore(tmp_path / "results.sqlite3",
+                            {"echo": Freshness(ttl=60, refresh_after=0)})
+        caller = serve(store)
+        caller.echo().search("Dune")
+        caller.echo().search("Dune")
+        warm = sys.modules["qbt_engine_echo"]
+        for _ in range(500):
+            stored = store.lookup("echo", "Dune", "all")
+            if stored and stored.rows[0]["link"].endswith("/2"):
+                break
+            threading.Event().wait(0.01)
+        assert warm.searches == ["Dune", "Dune"]
+        # the second answer came from the store, the refresh only saved
+        assert [row["link"] for row in caller.rows] == ["https://echo.test/all/1"] * 2
+
+    def test_socket_path(monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv("XDG_RUNTIME_DIR", "/run/user/1000")
+        assert socket_path() == "/run/user/1000/qbt-engines.sock"
+        monkeypatch.setenv("QBT_DAEMON_SOCKET", "/srv/q.sock")
+        assert socket_path() == "/srv/q.sock"
+        monkeypatch.delenv("QBT_DAEMON_SOCKET")
+        monkeypatch.delenv("XDG_RUNTIME_DIR")
+        path = Path(socket_path())
+        assert path.parent.name == f"qbt-engines-{os.getuid()}"
+        assert path.parent.parent == Path(tempfile.gettempdir())
+
+    def test_private_dir(tmp_path: Path) -> None:
+        directory = tmp_path / "private"
+        _private_dir(str(directory / "engines.sock"))
+        assert stat.S_IMODE(directory.stat().st_mode) == 0o700
+        directory.chmod(0o755)
+        with pytest.raises(RuntimeError):
+            _private_dir(str(directory / "engines.sock"))
+
+    def test_connects_to_own_socket(listening: str) -> None:
+        assert trusted(listening)
+        sock = _connect(listening)
+        assert sock is not None
+        sock.close()
+
+    def test_refuses_socket_open_to_others(listening: str) -> None:
+        os.chmod(listening, 0o666)
+        assert not trusted(listening)
+        assert _connect(listening) is None
+
+    def test_refuses_socket_in_directory_others_can_write(listening: str) -> None:
+        directory = os.path.dirname(listening)
+        os.chmod(directory, 0o777)
+        try:
+            assert not trusted(listening)
+            os.chmod(directory, 0o1777)
+            assert trusted(listening)
+        finally:
+            os.chmod(directory, 0o700)
+
+    def test_refuses_other_files(tmp_path: Path) -> None:
+        path = tmp_path / "engines.sock"
+        path.write_text("")
+        path.chmod(0o600)
+        assert not trusted(str(path))
+        assert not trusted(str(tmp_path / "missing.sock"))
@@ -0,0 +1,311 @@
+"""Content-Encoding decoding: gzip, deflate, br and zstd, whole or streamed.
+
+Brotli (``brotli`` or ``brotlicffi``) and zstd (``compression.zstd`` on
+Python 3.14+, else ``zstandard``) are used when importable; :data:`ACCEPT_ENCODING`
+advertises exactly what can be decoded here. :class:`StreamDecoder` undoes a
+``Content-Encoding`` chunk by chunk so a parser can start on the first bytes
+of a page, and :class:`Negotiator` tracks per host which codings it actually
+serves correctly, dropping one from that host's ``Accept-Encoding`` after it
+fails to decode.
+
+Engines use :func:`decode_body` in place of their own ``gzip.decompress``
+calls, with a small zlib fallback when this package is not installed::
+
+    try:
+        from qbt_common.decoding import ACCEPT_ENCODING, decode_body
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+        def decode_body(body, encoding, sniff=False):
+            ...
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import zlib
+from typing import Any, Iterable, Iterator, Optional
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    from compression import zstd
+except ImportError:
+    zstd = None
+    try:
+        import zstandard
+    except ImportError:
+        zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class DecodeError(ValueError):
+    """The body is not valid for its Content-Encoding (or it is unknown)."""
+
+
+class _Gzip:
+    def __init__(self) -> None:
+        self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data: bytes) -> bytes:
+        out = self._obj.decompress(data)
+        # servers may concatenate several gzip members
+        while self._obj.eof and self._obj.unused_data:
+            rest = self._obj.unused_data
+            self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            out += self._obj.decompress(rest)
+        return out
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+
+class _Deflate:
+    """zlib-wrapped deflate, or raw deflate as some servers send it."""
+
+    def __init__(self) -> None:
+        self._obj: Any = None
+        self._head = b""
+
+    def decompress(self, data: bytes) -> bytes:
+        if self._obj is None:
+            # zlib only rejects a raw stream once it has both header bytes
+            data = self._head + data
+            if len(data) < 2:
+                self._head = data
+                return b""
+            self._head = b""
+            self._obj = zlib.decompressobj()
+            try:
+                return self._obj.decompress(data)
+            except zlib.error:
+                self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._obj.decompress(data)
+
+    def flush(self) -> bytes:
+        if self._obj is None:
+            # too short for a zlib header
+            self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self._obj.decompress(self._head) + self._obj.flush()
+        return self._obj.flush()
+
+
+class _Brotli:
+    def __init__(self) -> None:
+        self._obj = brotli.Decompressor()
+        # brotli has process(), brotlicffi has decompress()
+        self._step = getattr(self._obj, "process", None) or self._obj.decompress
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._step(data)  # type: ignore[no-any-return]
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class _Zstd:
+    def __init__(self) -> None:
+        if zstd is not None:
+            self._obj = zstd.ZstdDecompressor()
+        else:
+            self._obj = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._obj.decompress(data)  # type: ignore[no-any-return]
+
+    def flush(self) -> bytes:
+        return b""
+
+
+CODECS: dict[str, type] = {"gzip": _Gzip, "x-gzip": _Gzip, "deflate": _Deflate}
+if brotli is not None:
+    CODECS["br"] = _Brotli
+if zstd is not None or zstandard is not None:
+    CODECS["zstd"] = _Zstd
+
+# best compression first; x-gzip is only an alias
+SUPPORTED = [c for c in ("zstd", "br", "gzip", "deflate") if c in CODECS]
+ACCEPT_ENCODING = ", ".join(SUPPORTED)
+
+
+def _codings(encoding: object) -> list[str]:
+    return [
+        c.strip().lower()
+        for c in str(encoding).split(",")
+        if c.strip().lower() not in ("", "identity")
+    ]
+
+
+class StreamDecoder:
+    """Incremental decoder for a ``Content-Encoding`` header value.
+
+    Feed the raw body to :meth:`decompress` in chunks and call :meth:`flush`
+    once at the end. Raises :class:`DecodeError` for unknown codings (from
+    the constructor) and for corrupt data.
+    """
+
+    def __init__(self, encoding: str) -> None:
+        codings = _codings(encoding)
+        unknown = [c for c in codings if c not in CODECS]
+        if unknown:
+            raise DecodeError(f"unsupported content encoding: {', '.join(unknown)}")
+        # codings are listed in the order they were applied
+        self._steps = [CODECS[c]() for c in reversed(codings)]
+
+    def decompress(self, data: bytes) -> bytes:
+        try:
+            for step in self._steps:
+                data = step.decompress(data)
+        except Exception as ex:
+            raise DecodeError(str(ex)) from ex
+        return data
+
+    def flush(self) -> bytes:
+        data = b""
+        try:
+            for step in self._steps:
+                data = step.decompress(data) + step.flush()
+        except Exception as ex:
+            raise DecodeError(str(ex)) from ex
+        return data
+
+
+def sniff_encoding(body: bytes) -> Optional[str]:
+    """Content-Encoding recognised from magic bytes of an unlabelled body."""
+    if body.startswith(GZIP_MAGIC):
+        return "gzip"
+    if body.startswith(ZSTD_MAGIC) and "zstd" in CODECS:
+        return "zstd"
+    return None
+
+
+def decode_body(body: bytes, encoding: Optional[str], sniff: bool = False) -> bytes:
+    """Undo ``Content-Encoding``; unknown or broken encodings are left as is.
+
+    With ``sniff`` an unlabelled body is decoded when its magic bytes say it
+    is compressed (some trackers gzip without saying so).
+    """
+    if not encoding and sniff:
+        encoding = sniff_encoding(body)
+    if not encoding:
+        return body
+    try:
+        decoder = StreamDecoder(encoding)
+        return decoder.decompress(body) + decoder.flush()
+    except DecodeError:
+        return body
+
+
+def iter_decoded(chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[bytes]:
+    """Decode an iterable of raw body chunks as they arrive."""
+    if not encoding:
+        yield from chunks
+        return
+    decoder = StreamDecoder(encoding)
+    for chunk in chunks:
+        data = decoder.decompress(chunk)
+        if data:
+            yield data
+    data = decoder.flush()
+    if data:
+        yield data
+
+
+class Negotiator:
+    """Per-host ``Accept-Encoding``: what we decode, minus what broke there."""
+
+    def __init__(self) -> None:
+        self._broken: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def accept(self, host: str, requested: Optional[str] = None) -> str:
+        """Header value for ``host``, narrowing ``requested`` if given."""
+        with self._lock:
+            broken = self._broken.get(host, ())
+        if requested is None:
+            offered = SUPPORTED
+        else:
+            # keep the caller's order and q-values, drop what we can't decode
+            offered = [
+                token.strip()
+                for token in requested.split(",")
+                if token.split(";")[0].strip().lower() in CODECS
+            ]
+        offered = [c for c in offered if c.split(";")[0].strip().lower() not in broken]
+        return ", ".join(offered) or "identity"
+
+    def failed(self, host: str, encoding: str) -> None:
+        with self._lock:
+            self._broken.setdefault(host, set()).update(
+                "gzip" if c == "x-gzip" else c for c in _codings(encoding)
+            )
+
+
+if "pytest" in sys.modules:
+    import gzip
+
+    import pytest
+
+    TEXT = "Привет, qBittorrent! ".encode("utf-8") * 200
+
+    def _raw_deflate(data: bytes) -> bytes:
+        obj = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        return obj.compress(data) + obj.flush()
+
+    @pytest.mark.parametrize("encoding, body", [
+        ("gzip", gzip.compress(TEXT)),
+        ("x-gzip", gzip.compress(TEXT)),
+        ("deflate", zlib.compress(TEXT)),
+        ("deflate", _raw_deflate(TEXT)),
+        ("gzip, deflate", zlib.compress(gzip.compress(TEXT))),
+        ("identity", TEXT),
+        (None, TEXT),
+    ])
+    def test_decode_body(encoding: Optional[str], body: bytes) -> None:
+        assert decode_body(body, encoding) == TEXT
+
+    def test_concatenated_gzip_members() -> None:
+        assert decode_body(gzip.compress(TEXT) + gzip.compress(b"tail"), "gzip") == TEXT + b"tail"
+
+    def test_broken_or_unknown_bodies_are_left_as_is() -> None:
+        assert decode_body(b"<html>not gzip</html>", "gzip") == b"<html>not gzip</html>"
+        assert decode_body(b"data", "compress") == b"data"
+        with pytest.raises(DecodeError):
+            StreamDecoder("compress")
+
+    def test_sniffing_unlabelled_gzip() -> None:
+        body = gzip.compress(TEXT)
+        assert decode_body(body, None) == body
+        assert decode_body(body, None, sniff=True) == TEXT
+        assert decode_body(TEXT, None, sniff=True) == TEXT
+
+    def test_streamed_in_small_chunks() -> None:
+        body = gzip.compress(TEXT)
+        chunks = [body[i:i + 7] for i in range(0, len(body), 7)]
+        assert b"".join(iter_decoded(chunks, "gzip")) == TEXT
+        with pytest.raises(DecodeError):
+            list(iter_decoded([b"\x1f\x8bnot really gzip"], "gzip"))
+
+    @pytest.mark.parametrize("body", [zlib.compress(TEXT), _raw_deflate(TEXT)])
+    def test_deflate_split_after_the_first_byte(body: bytes) -> None:
+        assert b"".join(iter_decoded([body[:1], body[1:2], body[2:]], "deflate")) == TEXT
+        assert b"".join(iter_decoded([body[:1], body[1:]], "deflate")) == TEXT
+
+    def test_accept_encoding_drops_what_broke() -> None:
+        negotiator = Negotiator()
+        assert negotiator.accept("a.test") == ACCEPT_ENCODING
+        assert negotiator.accept("a.test", "gzip;q=1.0, compress, deflate") == "gzip;q=1.0, deflate"
+        negotiator.failed("a.test", "x-gzip")
+        assert "gzip" not in negotiator.accept("a.test")
+        assert negotiator.accept("b.test") == ACCEPT_ENCODING
+        negotiator.failed("a.test", "deflate")
+        assert negotiator.accept("a.test", "gzip, deflate") == "identity"
@@ -0,0 +1,168 @@
+"""Cross-engine result deduplication by BitTorrent infohash.
+
+Many engines list the same torrent: magnets built from the infohash
+(thepiratebay, bt4gprx, btdig, solidtorrents, the Nyaa family) or download
+URLs that embed it (dmhy's ``dl.dmhy.org/<date>/<hash>.torrent``).
+:func:`infohash` pulls the v1 infohash out of a row as 20 raw bytes, and
+:class:`Deduper` keeps one merged record per hash: the best seeds and leech
+figures seen and the list of engines that returned it. Rows without a
+recognisable hash are passed through untouched; rows with one are held back
+until the search is over, since a later duplicate may still improve them.
+"""
+
+from __future__ import annotations
+
+import re
+import sys
+from base64 import b32decode
+from binascii import Error as BinasciiError
+from typing import Iterable, Iterator, Optional
+
+MAGNET_BTIH = re.compile(
+    r"xt=urn:btih:([0-9a-f]{40}|[a-z2-7]{32})(?![0-9a-z])", re.IGNORECASE
+)
+# download / description URLs known to carry the hex infohash
+URL_PATTERNS = [
+    re.compile(p, re.IGNORECASE)
+    for p in (
+        r"/([0-9a-f]{40})\.torrent\b",  # dmhy, itorrents and other caches
+        r"://(?:www\.)?btdig\.com/([0-9a-f]{40})\b",
+        r"/magnet/([0-9a-f]{40})\b",  # bt4g
+        r"/torrent/download/([0-9a-f]{40})\b",  # yts
+    )
+]
+
+
+def infohash(row: dict) -> Optional[bytes]:
+    """The row's infohash as 20 bytes, or ``None`` if it has none we know."""
+    link = str(row.get("link") or "")
+    match = MAGNET_BTIH.search(link)
+    if match:
+        value = match.group(1)
+        try:
+            if len(value) == 32:
+                return b32decode(value.upper())
+            return bytes.fromhex(value)
+        except (BinasciiError, ValueError):
+            return None
+    for url in (link, str(row.get("desc_link") or "")):
+        for pattern in URL_PATTERNS:
+            match = pattern.search(url)
+            if match:
+                return bytes.fromhex(match.group(1))
+    return None
+
+
+def _count(value: object) -> int:
+    try:
+        return int(value)  # type: ignore[call-overload,no-any-return]
+    except (TypeError, ValueError):
+        return -1
+
+
+class Deduper:
+    """Merge rows of the same torrent as they stream in.
+
+    :meth:`add` returns the row the first time a torrent is seen (with a
+    ``sources`` list added) and ``None`` for its duplicates, which instead
+    raise that record's ``seeds``/``leech`` to the best figure and append to
+    its ``sources``. Records are updated in place, so a row returned by
+    :meth:`add` only has its final figures once the search is over;
+    :meth:`filter` waits for that before yielding it.
+    """
+
+    def __init__(self) -> None:
+        self._seen: dict[bytes, dict] = {}
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return digest in self._seen
+
+    def add(self, source: str, row: dict) -> Optional[dict]:
+        digest = infohash(row)
+        if digest is None or self._merge(digest, source, row):
+            return row
+        return None
+
+    def _merge(self, digest: bytes, source: str, row: dict) -> bool:
+        """Record ``row`` under its hash; ``False`` if it was a duplicate."""
+        record = self._seen.get(digest)
+        if record is None:
+            row["sources"] = [source]
+            self._seen[digest] = row
+            return True
+        self.duplicates += 1
+        for key in ("seeds", "leech"):
+            if _count(row.get(key)) > _count(record.get(key)):
+                record[key] = row[key]
+        if source not in record["sources"]:
+            record["sources"].append(source)
+        return False
+
+    def filter(self, rows: Iterable[tuple[str, dict]]) -> Iterator[tuple[str, dict]]:
+        """Pass ``(source, row)`` pairs through, merging duplicates.
+
+        Rows without an infohash are yielded as they come. The others are
+        yielded once ``rows`` is exhausted (every engine finished or the
+        deadline passed), one per torrent in the order first seen, with the
+        best seeds/leech of all its duplicates.
+        """
+        held: list[tuple[str, dict]] = []
+        for source, row in rows:
+            digest = infohash(row)
+            if digest is None:
+                yield source, row
+            elif self._merge(digest, source, row):
+                held.append((source, row))
+        yield from held
+
+
+if "pytest" in sys.modules:
+    from base64 import b32encode
+
+    HASH = "0123456789abcdef0123456789abcdef01234567"
+
+    def _row(link: str, seeds: object = -1, leech: object = -1) -> dict:
+        return {"link": link, "name": link, "seeds": seeds, "leech": leech}
+
+    def test_infohash_from_magnets_and_urls() -> None:
+        digest = bytes.fromhex(HASH)
+        base32 = b32encode(digest).decode().lower()
+        assert infohash(_row(f"magnet:?xt=urn:btih:{HASH.upper()}&dn=x")) == digest
+        assert infohash(_row(f"magnet:?xt=urn:btih:{base32}")) == digest
+        assert infohash(_row(f"https://dl.dmhy.org/2024/01/01/{HASH}.torrent")) == digest
+        assert infohash({"link": "https://x.test/dl?id=1",
+                         "desc_link": f"https://btdig.com/{HASH}/name"}) == digest
+        assert infohash(_row(f"magnet:?xt=urn:btih:{HASH}ff")) is None
+        assert infohash(_row("https://x.test/download.php?id=1")) is None
+
+    def test_add_merges_best_figures() -> None:
+        deduper = Deduper()
+        first = deduper.add("a", _row(f"magnet:?xt=urn:btih:{HASH}", 5, "n/a"))
+        assert first is not None
+        assert deduper.add("b", _row(f"magnet:?xt=urn:btih:{HASH.upper()}", "12", 3)) is None
+        assert deduper.add("a", _row(f"magnet:?xt=urn:btih:{HASH}", 7, 1)) is None
+        assert (first["seeds"], first["leech"], first["sources"]) == ("12", 3, ["a", "b"])
+        assert deduper.duplicates == 2 and len(deduper) == 1
+
+    def test_filter_holds_hashed_rows_until_the_end() -> None:
+        consumed: list[str] = []
+
+        def rows() -> Iterator[tuple[str, dict]]:
+            for source, row in [
+                ("a", _row(f"magnet:?xt=urn:btih:{HASH}", 1)),
+                ("a", _row("https://x.test/1")),
+                ("b", _row(f"magnet:?xt=urn:btih:{HASH}", 9, 4)),
+            ]:
+                consumed.append(row["link"])
+                yield source, row
+
+        merged = Deduper().filter(rows())
+        assert next(merged)[1]["link"] == "https://x.test/1"
+        assert len(consumed) == 2
+        rest = list(merged)
+        assert len(consumed) == 3
+        assert [(s, r["seeds"], r["leech"], r["sources"]) for s, r in rest] == [("a", 9, 4, ["a", "b"])]
@@ -0,0 +1,571 @@
+"""Shared core of the imDMG engine family.
+
+kinozal, rutor, nnmclub, tapochek and rutracker_imdmg were one engine copied
+five times: a json :class:`Config` next to the plugin, proxy and SOCKS setup,
+``_request`` with a retry on timeout, error rows and paging. That now lives
+here once, and each engine module keeps its URLs, its regexes and what really
+differs: how it signs in and how a regex match becomes a row::
+
+    try:
+        from qbt_common.imdmg import Config as BaseConfig
+        from qbt_common.imdmg import Engine, EngineError
+    except ImportError:
+        ...  # a minimal Engine, see below
+
+    @dataclass
+    class Config(BaseConfig):
+        username: str = "USERNAME"
+        password: str = "PASSWORD"
+
+    class Kinozal(Engine):
+        name = "Kinozal"
+        url = "https://kinozal.tv/"
+        config_class, icon = Config, ICON
+        re_torrents, re_results = RE_TORRENTS, RE_RESULTS
+        session_cookie = "uid"
+
+        def login(self) -> None: ...
+
+        def row(self, tor: re.Match) -> dict: ...
+
+Compared with the copies it replaces:
+
+- every engine class has one keep-alive :mod:`~qbt_common.transport` opener,
+  shared by its pages, downloads and (in the daemon) later searches;
+- failed requests are retried with exponential backoff on timeouts, dropped
+  connections and 5xx, not just once on a timeout (the transport already
+  waits out 429/503 on its own);
+- the log file, the json config, the proxy and the cookies are set up on
+  first use rather than on import, and cookies are read from disk once per
+  process and saved owner-only;
+- pages go through a single loop (regex, row, print) whose patterns are
+  compiled once when the engine module loads, with the extra pages fetched by
+  :func:`qbt_common.pages.fetch_pages`; a page is converted as a batch, and
+  each distinct date string is parsed once per search (:class:`DateMemo`).
+
+Rows are printed with the engine module's own ``prettyPrinter``, which the
+runner and the daemon swap per engine. So that each engine still installs as
+a single file, it carries a minimal :class:`Engine` of its own for when this
+package is missing: the same hooks, one request at a time, no retries.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from http.cookiejar import LoadError, MozillaCookieJar
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Iterable,
+    Optional,
+    Pattern,
+    Union,
+)
+from urllib.error import HTTPError
+from urllib.parse import quote, unquote, urlparse
+from urllib.request import HTTPCookieProcessor, ProxyHandler
+
+from .bencode import BencodeError, decode_torrent
+from .decoding import decode_body
+from .pages import fetch_pages
+from .trace import span, traced
+from .transport import build_opener
+
+TIMEOUT = 5
+# attempts after the first, waiting BACKOFF, 2 * BACKOFF, ... in between
+RETRIES = 2
+BACKOFF = 0.5
+RETRY_CODES = (500, 502, 503, 504)
+
+logger = logging.getLogger(__name__)
+
+
+class EngineError(Exception): ...
+
+
+@dataclass
+class Config:
+    """Settings every engine has; engines subclass it with their own."""
+
+    proxy: bool = False
+    # dynamic_proxy: bool = True
+    proxies: dict[str, str] = field(
+        default_factory=lambda: {"http": "", "https": ""}
+    )
+    ua: str = (
+        "Mozilla/5.0 (X11; Linux i686; rv:38.0) Gecko/20100101 Firefox/38.0 "
+    )
+    # pages fetched at once, and how many after the first (0: all of them)
+    workers: int = 4
+    page_budget: int = 0
+
+    def load(self, path: Path, icon: str) -> "Config":
+        """Read ``path``, writing it (and the icon) back when it is missing
+        or lacks settings."""
+        try:
+            if not self._validate_json(json.loads(path.read_text())):
+                raise ValueError("Incorrect json scheme.")
+        except Exception as e:
+            logger.error(e)
+            path.write_text(self.to_str())
+            try:
+                path.with_suffix(".ico").write_bytes(base64.b64decode(icon))
+            except ValueError as ex:
+                logger.error(f"Icon not written: {ex}")
+        return self
+
+    def to_str(self) -> str:
+        return json.dumps(self.to_dict(), indent=4, sort_keys=False)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {self._to_camel(k): v for k, v in self.__dict__.items()}
+
+    def _validate_json(
+        self, obj: dict[str, Union[str, bool, dict[str, str]]]
+    ) -> bool:
+        is_valid = True
+        for k, v in self.__dict__.items():
+            _val = obj.get(self._to_camel(k))
+            if _val is None or not isinstance(_val, type(v)):
+                is_valid = False
+                continue
+            if isinstance(_val, dict):
+                for dk, dv in v.items():
+                    if not isinstance(_val.get(dk), type(dv)):
+                        _val[dk] = dv
+                        is_valid = False
+            setattr(self, k, _val)
+        return is_valid
+
+    @staticmethod
+    def _to_camel(s: str) -> str:
+        return "".join(
+            x.title() if i else x for i, x in enumerate(s.split("_"))
+        )
+
+
+def _retryable(err: OSError) -> bool:
+    if isinstance(err, HTTPError):
+        return err.code in RETRY_CODES
+    reason = getattr(err, "reason", err)
+    # "no host given" and the like are strings, network failures OSErrors
+    return isinstance(reason, OSError) or "timed out" in str(reason)
+
+
+class DateMemo(dict):
+    """A search's date strings mapped to timestamps, each parsed once (a
+    page's rows share a handful of dates); relative dates ("today") resolve
+    against the time the search started."""
+
+    def __init__(self, parse: Callable[[str, float], int]) -> None:
+        super().__init__()
+        self.parse, self.now = parse, time.time()
+
+    def __missing__(self, date_str: str) -> int:
+        self[date_str] = stamp = self.parse(date_str, self.now)
+        return stamp
+
+
+class Engine:
+    """A tracker search engine; subclasses fill in the class attributes."""
+
+    name: ClassVar[str]
+    url: ClassVar[str]
+    # downloads are served from here too, see _request
+    url_dl: ClassVar[str] = ""
+    supported_categories: ClassVar[dict[str, Any]] = {"all": "-1"}
+    config_class: ClassVar[type[Config]] = Config
+    # base64 encoded image, written next to the json config
+    icon: ClassVar[str] = ""
+    re_torrents: ClassVar[Pattern[str]]
+    re_results: ClassVar[Pattern[str]]
+    # search URL % (url, query, category), page URL % (search URL, page)
+    patterns: ClassVar[tuple[str, ...]] = ("%stracker.php?nm=%s&c=%s", "%s&start=%s")
+    page_size: ClassVar[int] = 50
+    # pages are addressed by their first row (start=50), not number (page=1)
+    page_offsets: ClassVar[bool] = True
+    encoding: ClassVar[str] = "utf-8"
+    # the cookie of a signed-in session, None for engines without accounts
+    session_cookie: ClassVar[Optional[str]] = None
+    headers: ClassVar[dict[str, str]] = {}
+
+    # per engine class, set up by _init
+    config: ClassVar[Config]
+    session: ClassVar[Any]
+    mcj: ClassVar[MozillaCookieJar]
+    logger: ClassVar[logging.Logger]
+    file_j: ClassVar[Path]
+    file_c: ClassVar[Path]
+    file_l: ClassVar[Path]
+    _ready: ClassVar[bool]
+    _signed_in: ClassVar[bool]
+    _lock: ClassVar[threading.Lock]
+    dates: DateMemo
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        file = Path(sys.modules[cls.__module__].__file__ or cls.__module__)
+        cls.file_j, cls.file_c, cls.file_l = [
+            file.parent.absolute() / (file.stem + ext)
+            for ext in (".json", ".cookie", ".log")
+        ]
+        cls.logger = logging.getLogger(cls.__module__)
+        cls.mcj = MozillaCookieJar()
+        cls.session = None
+        cls._ready = cls._signed_in = False
+        cls._lock = threading.Lock()
+
+    def search(self, what: str, cat: str = "all") -> None:
+        self._catch_errors(self._search, what, cat)
+
+    def download_torrent(self, url: str) -> None:
+        self._catch_errors(self._download_torrent, url)
+
+    def login(self) -> None:
+        """Sign in and :meth:`save_cookies`, or raise :class:`EngineError`."""
+        raise NotImplementedError
+
+    def has_session(self) -> bool:
+        return self.session_cookie in [cookie.name for cookie in self.mcj]
+
+    def save_cookies(self) -> None:
+        # the session is as good as the password: private before it is written
+        os.close(os.open(self.file_c, os.O_WRONLY | os.O_CREAT, 0o600))
+        os.chmod(self.file_c, 0o600)
+        self.mcj.save(str(self.file_c), ignore_discard=True, ignore_expires=True)
+        type(self)._signed_in = True
+        self.logger.info("We successfully authorized")
+
+    def check_session(self, page: str, query: str) -> str:
+        """The first result page, after signing in again if it shows the
+        session was lost."""
+        return page
+
+    def search_url(self, what: str, cat: str) -> str:
+        return self.patterns[0] % (
+            self.url,
+            quote(unquote(what)),
+            self.supported_categories[cat],
+        )
+
+    def rng(self, total: int) -> range:
+        pages = -(-total // self.page_size)
+        if self.page_offsets:
+            return range(self.page_size, pages * self.page_size, self.page_size)
+        return range(1, pages)
+
+    def page_urls(self, query: str, total: int) -> list[str]:
+        return [self.patterns[1] % (query, x) for x in self.rng(total)]
+
+    def count(self, page: str) -> int:
+        """Results the search found, from its first page."""
+        match = self.re_results.search(page)
+        if match is None:
+            self.logger.debug(f"Unexpected page content:\n {page}")
+            raise EngineError("Unexpected page content")
+        return int(match[1] or 0)
+
+    def row(self, tor: Any) -> Optional[dict[str, Any]]:
+        """The prettyPrinter row for a ``re_torrents`` match (None skips it)."""
+        raise NotImplementedError
+
+    def rows(self, tors: Iterable[Any]) -> list[dict[str, Any]]:
+        return [row for row in map(self.row, tors) if row is not None]
+
+    def pub_date(self, date_str: str) -> int:
+        """Timestamp for a row's date string."""
+        return self.dates[date_str]
+
+    def parse_date(self, date_str: str, now: float) -> int:
+        return int(date_str)
+
+    @traced("page")
+    def searching(self, query: str, first: bool = False) -> int:
+        page = self._request(query).decode(self.encoding, "ignore")
+        torrents_found = -1
+        if first:
+            page = self.check_session(page, query)
+            # firstly, we check if there is a result
+            torrents_found = self.count(page)
+            if torrents_found == 0:
+                return 0
+        self.draw(page)
+
+        return torrents_found
+
+    @traced("parse")
+    def draw(self, html: str) -> None:
+        # convert the whole page before printing any of it
+        for row in self.rows(self.re_torrents.finditer(html)):
+            self.print_row(row)
+
+    def print_row(self, row: dict[str, Any]) -> None:
+        with span("print"):
+            sys.modules[type(self).__module__].prettyPrinter(row)
+
+    def _catch_errors(self, handler: Callable[..., None], *args: str) -> None:
+        try:
+            self._init()
+            handler(*args)
+        except EngineError as ex:
+            self.logger.exception(ex)
+            self.pretty_error(args[0] if args else "", str(ex))
+        except Exception as ex:
+            self.pretty_error(
+                args[0] if args else "", "Unexpected error, please check logs"
+            )
+            self.logger.exception(ex)
+
+    def _init(self) -> None:
+        cls = type(self)
+        with cls._lock:
+            if not cls._ready:
+                cls._setup()
+                cls._ready = True
+        if self.session_cookie is not None and not cls._signed_in:
+            self._load_cookies()
+
+    @classmethod
+    def _setup(cls) -> None:
+        # qBittorrent imports the engine just to list it, so this waits for
+        # the first search or download
+        logging.basicConfig(
+            filemode="w",
+            filename=cls.file_l,
+            format="%(asctime)s %(name)-12s %(levelname)-8s %(message)s",
+            datefmt="%m-%d %H:%M",
+            level=logging.DEBUG,
+        )
+        cls.config = config = cls.config_class().load(cls.file_j, cls.icon)
+        cls.session = build_opener(HTTPCookieProcessor(cls.mcj))
+        # add proxy handler if needed
+        if config.proxy:
+            if not any(config.proxies.values()):
+                raise EngineError("Proxy enabled, but not set!")
+            # socks5 support
+            for proxy_str in config.proxies.values():
+                if not proxy_str.lower().startswith("socks"):
+                    continue
+                import socks
+
+                url = urlparse(proxy_str)
+                socks.set_default_proxy(  # type: ignore[attr-defined]
+                    socks.PROXY_TYPE_SOCKS5,
+                    url.hostname,
+                    url.port,
+                    True,
+                    url.username,
+                    url.password,
+                )
+                socket.socket = socks.socksocket  # type: ignore
+                break
+            else:
+                cls.session.add_handler(ProxyHandler(config.proxies))
+            cls.logger.debug("Proxy is set!")
+
+        # change user-agent
+        cls.session.addheaders = [("User-Agent", config.ua), *cls.headers.items()]
+
+    def _load_cookies(self) -> None:
+        try:
+            self.mcj.load(str(self.file_c), ignore_discard=True)
+            if self.has_session():
+                type(self)._signed_in = True
+                return self.logger.info("Local cookies is loaded")
+            self.logger.info("Local cookies expired or bad, try to login")
+            self.logger.debug(f"That we have: {[cookie for cookie in self.mcj]}")
+        except FileNotFoundError:
+            self.logger.info("Local cookies not exists, try to login")
+        except LoadError as ex:
+            self.logger.info(f"Local cookies are unreadable ({ex}), try to login")
+        self.login()
+
+    def _search(self, what: str, cat: str = "all") -> None:
+        query = self.search_url(what, cat)
+        self.dates = DateMemo(self.parse_date)
+
+        # make first request (maybe it enough)
+        t0, total = time.time(), self.searching(query, True)
+        # fetch the rest, a few pages at a time
+        if total > self.page_size:
+            fetch_pages(
+                self.searching,
+                self.page_urls(query, total),
+                self.url,
+                self.config.workers,
+                self.config.page_budget or None,
+                timeout=30,
+            )
+
+        self.logger.debug(f"--- {time.time() - t0} seconds ---")
+        self.logger.info(f"Found torrents: {total}")
+
+    def _download_torrent(self, url: str) -> None:
+        response = self._request(url)
+        # a sign-in or error page instead of the torrent
+        try:
+            decode_torrent(response)
+        except BencodeError as ex:
+            raise EngineError(f"{url} is not a torrent file ({ex})") from ex
+
+        # Create a torrent file
+        with NamedTemporaryFile(suffix=".torrent", delete=False) as fd:
+            fd.write(response)
+
+        # return file path
+        self.logger.debug(fd.name + " " + url)
+        print(fd.name + " " + url)
+
+    def _request(self, url: str, data: Optional[bytes] = None) -> bytes:
+        for attempt in range(RETRIES + 1):
+            try:
+                with self.session.open(url, data, TIMEOUT) as r:
+                    # checking that tracker isn't blocked
+                    if r.geturl().startswith((self.url, self.url_dl)):
+                        # some trackers gzip without saying so
+                        return decode_body(r.read(), None, sniff=True)
+                    raise EngineError(f"{url} is blocked. Try another proxy.")
+            except OSError as err:  # URLError, HTTPError, socket errors
+                error = str(getattr(err, "reason", err))
+                if attempt < RETRIES and _retryable(err):
+                    delay = BACKOFF * 2**attempt
+                    self.logger.debug(f"Request failed ({error}), repeating in {delay}s...")
+                    time.sleep(delay)
+                    continue
+                reason = f"{url} is not response! Maybe it is blocked."
+                if "timed out" in error:
+                    reason = "Request timed out"
+                if "no host given" in error:
+                    reason = "Proxy is bad, try another!"
+                elif isinstance(err, HTTPError):
+                    reason = f"Request to {url} failed with status: {err.code}"
+
+                raise EngineError(reason)
+        raise AssertionError("unreachable")
+
+    def pretty_error(self, what: str, error: str) -> None:
+        self.print_row(
+            {
+                "engine_url": self.url,
+                "desc_link": f"file://{self.file_l}",
+                "name": f"[{unquote(what)}][Error]: {error}",
+                "link": self.url + "error",
+                "size": "1 TB",  # lol
+                "seeds": 100,
+                "leech": 100,
+                "pub_date": int(time.time()),
+            }
+        )
+
+
+if "pytest" in sys.modules:
+    import importlib.util
+
+    import pytest
+
+    from .replay import FixtureStore, StandIn, fixture_key, replaying
+
+    ROW = (
+        '<tr class="gai"><td>0%d&nbsp;Мар&nbsp;24</td><td>'
+        '<a href="magnet:?xt=urn:btih:%s">M</a>'
+        '<a href="/torrent/4%d/ubuntu">Ubuntu 2%d.04</a></td>'
+        '<td align="right">5.7&nbsp;GB</td><td align="center">'
+        '<span class="green">9</span> <span class="red">%d</span></td></tr>'
+    )
+    PAGE = "<b>Поиск</b> Результатов поиска 2 <table>%s%s</table>" % (
+        ROW % (3, "ab" * 20, 2, 4, 1),
+        ROW % (4, "cd" * 20, 3, 2, 0),
+    )
+
+    @pytest.fixture(params=[True, False], ids=["core", "single-file"])
+    def rutor(request: Any, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Any:
+        """public_sites/rutor.py loaded from a copy, on this module or (as
+        a single-file install) on its own minimal Engine."""
+        pytest.importorskip("novaprinter")
+        if not request.param:
+            monkeypatch.setitem(sys.modules, "qbt_common.imdmg", None)
+        path = tmp_path / "rutor.py"
+        path.write_bytes((Path(__file__).parents[1] / "public_sites" / "rutor.py").read_bytes())
+        spec = importlib.util.spec_from_file_location("qbt_imdmg_rutor", path)
+        assert spec is not None and spec.loader is not None
+        module = importlib.util.module_from_spec(spec)
+        monkeypatch.setitem(sys.modules, spec.name, module)
+        spec.loader.exec_module(module)
+        assert issubclass(module.Rutor, Engine) is request.param
+        module.rows = []
+        module.prettyPrinter = module.rows.append
+        return module
+
+    def serve(tmp_path: Path, host: str, target: str, body: bytes) -> StandIn:
+        store = FixtureStore(tmp_path / "fixtures")
+        store.save(fixture_key("GET", host, target, None), f"https://{host}{target}",
+                   200, "OK", [("Content-Type", "text/html; charset=utf-8")], body)
+        return StandIn(store)
+
+    def test_rows_are_printed_by_the_engine_module(rutor: Any, tmp_path: Path) -> None:
+        with serve(tmp_path, "rutor.info", "/search/0/0/000/0/ubuntu", PAGE.encode()) as site, \
+                replaying(site):
+            rutor.rutor().search("ubuntu")
+        assert rutor.rows == [
+            {
+                "link": "https://d.rutor.info/download/42",
+                "name": "Ubuntu 24.04",
+                "size": "5.7 GB",
+                "seeds": 9,
+                "leech": 1,
+                "engine_url": "https://rutor.info/",
+                "desc_link": "https://rutor.info/torrent/42/ubuntu",
+                "pub_date": int(time.mktime((2024, 3, 3, 0, 0, 0, 0, 0, -1))),
+            },
+            {
+                "link": "https://d.rutor.info/download/43",
+                "name": "Ubuntu 22.04",
+                "size": "5.7 GB",
+                "seeds": 9,
+                "leech": 0,
+                "engine_url": "https://rutor.info/",
+                "desc_link": "https://rutor.info/torrent/43/ubuntu",
+                "pub_date": int(time.mktime((2024, 3, 4, 0, 0, 0, 0, 0, -1))),
+            },
+        ]
+        assert (tmp_path / "rutor.json").exists()
+
+    def test_download_rejects_a_page_served_as_torrent(
+        rutor: Any, tmp_path: Path, capsys: pytest.CaptureFixture
+    ) -> None:
+        with serve(tmp_path, "d.rutor.info", "/download/42", b"<html>Sign in</html>") as site, \
+                replaying(site):
+            rutor.rutor().download_torrent("https://d.rutor.info/download/42")
+        assert capsys.readouterr().out == ""
+        [row] = rutor.rows
+        assert "/download/42 is not a torrent file" in row["name"]
+
+    def test_download_saves_the_torrent(
+        rutor: Any, tmp_path: Path, capsys: pytest.CaptureFixture
+    ) -> None:
+        torrent = b"d4:infod4:name6:ubuntuee"
+        with serve(tmp_path, "d.rutor.info", "/download/42", torrent) as site, replaying(site):
+            rutor.rutor().download_torrent("https://d.rutor.info/download/42")
+        path, url = capsys.readouterr().out.split()
+        assert url == "https://d.rutor.info/download/42" and rutor.rows == []
+        assert Path(path).read_bytes() == torrent
+        os.unlink(path)
+
+    def test_cookies_are_saved_owner_only(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        class Cookies(Engine):
+            name, url = "Cookies", "https://cookies.test/"
+
+        monkeypatch.setattr(Cookies, "file_c", tmp_path / "cookies.cookie")
+        Cookies().save_cookies()
+        assert Cookies._signed_in and Cookies.file_c.stat().st_mode & 0o777 == 0o600
@@ -0,0 +1,112 @@
+"""Import-time report for engines.
+
+qBittorrent imports every enabled engine just to list its capabilities, so
+whatever an engine does at import is paid on every search. This runs each
+engine's import in a fresh interpreter under ``python -X importtime`` and
+reports its own time (the module body: tables, config files, logging setup)
+next to the cumulative time including everything it imports, plus the
+heaviest of those dependencies::
+
+    python -m qbt_common.importtime --nova3 ~/.local/share/qBittorrent/nova3 \\
+        public_sites/*.py private_sites/*.py
+
+``--budget`` (milliseconds, cumulative) makes the exit status non-zero when
+an engine exceeds it, so the report can gate changes.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+# "import time:       self [us] |  cumulative | imported package"
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)\s*$")
+
+
+@dataclass
+class ImportReport:
+    engine: str
+    self_us: int = 0
+    cumulative_us: int = 0
+    # (module, cumulative us) of modules imported by the engine, heaviest first
+    heaviest: list[tuple[str, int]] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+def measure(path: Path, nova3: Optional[str] = None, top: int = 3) -> ImportReport:
+    """Import one engine file in a subprocess and parse ``-X importtime``."""
+    path = Path(path).resolve()
+    env = dict(os.environ)
+    package_root = str(Path(__file__).resolve().parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, (str(path.parent), nova3, package_root, env.get("PYTHONPATH")))
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {path.stem}"],
+        capture_output=True, text=True, env=env, cwd=nova3 or None,
+    )
+    report = ImportReport(path.stem)
+    if proc.returncode:
+        report.error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"
+        return report
+    # nested imports are listed before their importer, one indent level deeper
+    children: list[tuple[str, int, int]] = []
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative, indent, module = (
+            int(match[1]), int(match[2]), len(match[3]), match[4]
+        )
+        if module == path.stem and indent == 1:
+            report.self_us, report.cumulative_us = self_us, cumulative
+            report.heaviest = sorted(
+                ((m, c) for m, c, i in children if i == 3),
+                key=lambda item: -item[1],
+            )[:top]
+            break
+        if indent == 1:
+            children = []  # an unrelated top-level import finished
+        else:
+            children.append((module, cumulative, indent))
+    return report
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("engines", nargs="+", type=Path, help="engine .py files")
+    parser.add_argument("--nova3", help="qBittorrent nova3 directory")
+    parser.add_argument("--budget", type=float,
+                        help="fail when an engine's cumulative import exceeds this, ms")
+    parser.add_argument("--sort", choices=("name", "self", "cumulative"),
+                        default="cumulative")
+    args = parser.parse_args(argv)
+
+    reports = [measure(path, args.nova3) for path in args.engines]
+    if args.sort != "name":
+        key = "self_us" if args.sort == "self" else "cumulative_us"
+        reports.sort(key=lambda r: -getattr(r, key))
+    print(f"{'engine':<22} {'self ms':>8} {'cumul ms':>9}  heaviest imports")
+    over = 0
+    for r in reports:
+        if r.error:
+            print(f"{r.engine:<22} {'-':>8} {'-':>9}  {r.error}")
+            over += 1
+            continue
+        heavy = ", ".join(f"{m} {c / 1000:.1f}" for m, c in r.heaviest)
+        flag = ""
+        if args.budget is not None and r.cumulative_us / 1000 > args.budget:
+            flag, over = "  OVER BUDGET", over + 1
+        print(f"{r.engine:<22} {r.self_us / 1000:>8.1f} {r.cumulative_us / 1000:>9.1f}"
+              f"  {heavy}{flag}")
+    return 1 if over and args.budget is not None else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
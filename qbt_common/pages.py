@@ -0,0 +1,176 @@
+"""Bounded, priority-ordered fetching of result pages.
+
+The imDMG engines (kinozal, rutor, nnmclub, tapochek, rutracker_imdmg) read
+the result count from the first page and then fetched every other page at
+once, one thread per page: a generic query meant dozens of threads hitting
+one tracker together. :func:`fetch_pages` runs the pages on a few workers,
+lowest priority value (by default the earliest page) first, with at most
+``workers`` requests in flight per tracker across every search in the
+process, and an optional ``budget`` of pages::
+
+    try:
+        from qbt_common.pages import fetch_pages
+    except ImportError:
+        def fetch_pages(fetch, urls, tracker, workers=4, budget=None, timeout=None):
+            return [fetch(url) for url in urls[:budget]]
+
+    fetch_pages(self.searching, qrs, self.url, config.workers,
+                config.page_budget or None, timeout=30)
+"""
+
+from __future__ import annotations
+
+import contextvars
+import heapq
+import itertools
+import logging
+import sys
+import threading
+import time
+from typing import Any, Callable, Optional, Sequence
+from urllib.parse import urlsplit
+
+DEFAULT_WORKERS = 4
+
+logger = logging.getLogger(__name__)
+
+_trackers: dict[str, threading.BoundedSemaphore] = {}
+_trackers_lock = threading.Lock()
+
+
+def tracker_slots(tracker: str, limit: int = DEFAULT_WORKERS) -> threading.BoundedSemaphore:
+    """The process-wide cap on requests in flight to ``tracker`` (a URL or
+    host); the limit given first for a tracker is the one kept."""
+    host = urlsplit(tracker).hostname or tracker
+    with _trackers_lock:
+        slots = _trackers.get(host)
+        if slots is None:
+            slots = _trackers[host] = threading.BoundedSemaphore(max(limit, 1))
+        return slots
+
+
+def fetch_pages(
+    fetch: Callable[[str], Any],
+    urls: Sequence[str],
+    tracker: str,
+    workers: int = DEFAULT_WORKERS,
+    budget: Optional[int] = None,
+    timeout: Optional[float] = None,
+    priorities: Optional[Sequence[float]] = None,
+) -> list[Any]:
+    """Call ``fetch(url)`` for each URL on at most ``workers`` threads.
+
+    Only the ``budget`` most urgent pages are fetched, and pages not started
+    within ``timeout`` seconds are skipped. Returns what each call returned,
+    in ``urls`` order: its exception if it raised, ``None`` if skipped.
+    """
+    order = list(priorities) if priorities is not None else range(len(urls))
+    heap = sorted(zip(order, itertools.count(), urls))
+    if budget is not None:
+        heap = heap[:max(budget, 0)]
+    results: list[Any] = [None] * len(urls)
+    if not heap:
+        return results
+    slots = tracker_slots(tracker, workers)
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    lock = threading.Lock()
+
+    def worker() -> None:
+        while True:
+            with lock:
+                if not heap or (deadline is not None and time.monotonic() >= deadline):
+                    return
+                _, index, url = heapq.heappop(heap)
+            with slots:
+                try:
+                    results[index] = fetch(url)
+                except Exception as ex:
+                    logger.debug("Page %s failed: %s", url, ex)
+                    results[index] = ex
+
+    # each worker runs in a copy of the caller's context, for trace spans
+    threads = [
+        threading.Thread(target=contextvars.copy_context().run, args=(worker,), daemon=True)
+        for _ in range(min(max(workers, 1), len(heap)))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if heap:
+        logger.warning(
+            "%d of %d pages of %s skipped, not started within %ss",
+            len(heap), len(urls), urlsplit(tracker).hostname or tracker, timeout,
+        )
+    return results
+
+
+if "pytest" in sys.modules:
+    import pytest
+
+    class Probe:
+        """A fetch that records order and peak concurrency."""
+
+        def __init__(self, delay: float = 0.02) -> None:
+            self.delay = delay
+            self.seen: list[str] = []
+            self.active = self.peak = 0
+            self.lock = threading.Lock()
+
+        def __call__(self, url: str) -> str:
+            with self.lock:
+                self.seen.append(url)
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+            time.sleep(self.delay)
+            with self.lock:
+                self.active -= 1
+            if url.endswith("boom"):
+                raise ValueError(url)
+            return url.upper()
+
+    def test_results_in_url_order() -> None:
+        urls = [f"https://order.test/page/{i}" for i in range(10)] + ["https://order.test/boom"]
+        results = fetch_pages(Probe(0), urls, "https://order.test/", workers=3)
+        assert results[:10] == [url.upper() for url in urls[:10]]
+        assert isinstance(results[10], ValueError)
+
+    def test_slots_are_shared_per_tracker() -> None:
+        assert tracker_slots("https://slots.test/a", 2) is tracker_slots("slots.test", 6)
+        probe = Probe()
+        urls = [f"https://slots.test/page/{i}" for i in range(8)]
+        searches = [
+            threading.Thread(target=fetch_pages, args=(probe, urls, "https://slots.test/", 4))
+            for _ in range(3)
+        ]
+        for search in searches:
+            search.start()
+        for search in searches:
+            search.join()
+        assert len(probe.seen) == 24
+        assert probe.peak == 2
+
+    def test_budget_keeps_the_most_urgent_pages() -> None:
+        probe = Probe(0)
+        urls = [f"https://budget.test/page/{i}" for i in range(6)]
+        results = fetch_pages(probe, urls, "budget.test", workers=1, budget=2,
+                              priorities=[5, 4, 3, 2, 1, 0])
+        assert probe.seen == [urls[5], urls[4]]
+        assert results == [None] * 4 + [urls[4].upper(), urls[5].upper()]
+        assert fetch_pages(probe, urls, "budget.test", budget=0) == [None] * 6
+
+    @pytest.mark.parametrize("timeout", [0, 0.05])
+    def test_pages_not_started_in_time_are_skipped(
+        timeout: float, caplog: pytest.LogCaptureFixture
+    ) -> None:
+        probe = Probe(0.03)
+        urls = [f"https://timeout{timeout}.test/page/{i}" for i in range(20)]
+        with caplog.at_level(logging.WARNING, logger=__name__):
+            results = fetch_pages(probe, urls, urls[0], workers=1, timeout=timeout)
+        assert 0 <= len(probe.seen) < len(urls)
+        assert results[:len(probe.seen)] == [url.upper() for url in probe.seen]
+        assert results[len(probe.seen):] == [None] * (len(urls) - len(probe.seen))
+        skipped = len(urls) - len(probe.seen)
+        assert caplog.messages == [
+            f"{skipped} of 20 pages of timeout{timeout}.test skipped, not started within {timeout}s"
+        ]
@@ -0,0 +1,285 @@
+"""Adaptive per-host rate limiting.
+
+Engines used to pace themselves with fixed ``time.sleep`` calls between pages.
+Here each host gets a token bucket (steady ``rate`` with room for a ``burst``)
+plus a cap on requests in flight, so pages can go out in parallel up to the
+site's budget. A 429 or 503 halves the host's rate and concurrency and
+honours ``Retry-After``; successful responses slowly win the budget back.
+
+The shared transport passes every request through :func:`default_limiter`.
+Engines replace the sleeps between pages with :func:`pace` or
+:func:`paced_pages`, keeping the sleep as the fallback when this package is
+not installed::
+
+    try:
+        from qbt_common.ratelimit import default_limiter, pace
+        # no faster than the half second it used to sleep
+        default_limiter().configure("example.org", rate=2.0, burst=1, concurrency=2)
+    except ImportError:
+        def pace(url):
+            time.sleep(0.5)
+
+Hosts without a budget of their own get the default :class:`SiteBudget`,
+which is meant for sites that never asked to be paced.
+
+Waits that are not about the site's budget (a retry while the site prepares
+a download, say) stay plain sleeps.
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+from urllib.parse import urlsplit
+
+from .trace import ContextExecutor
+
+T = TypeVar("T")
+
+THROTTLE_CODES = (429, 503)
+MAX_BACKOFF = 60.0
+
+
+@dataclass
+class SiteBudget:
+    rate: float = 8.0  # requests per second once the burst is spent
+    burst: int = 8
+    concurrency: int = 4
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a ``Retry-After`` header (delta or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class HostLimiter:
+    """Token bucket and in-flight cap for a single host."""
+
+    def __init__(self, budget: SiteBudget) -> None:
+        self.budget = budget
+        self.rate = budget.rate
+        self.concurrency = budget.concurrency
+        self._tokens = float(budget.burst)
+        self._stamp = time.monotonic()
+        self._in_flight = 0
+        self._waiting = 0
+        self._blocked_until = 0.0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = self._blocked_until - now
+                    if wait <= 0 and self._in_flight < self.concurrency:
+                        if self._tokens >= 1:
+                            self._tokens -= 1
+                            self._in_flight += 1
+                            return
+                        wait = (1 - self._tokens) / self.rate
+                    self._cond.wait(wait if wait > 0 else None)
+            finally:
+                self._waiting -= 1
+
+    def release(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def pace(self) -> None:
+        """Wait until a new request would be admitted, plus one rate interval.
+
+        Used between spawning page fetches: it waits out back-off and a full
+        set of requests in flight, and the interval keeps a spawn loop from
+        racing ahead of the threads it started.
+        """
+        with self._cond:
+            while True:
+                wait = self._blocked_until - time.monotonic()
+                if (wait <= 0
+                        and self._in_flight + self._waiting < self.concurrency):
+                    break
+                self._cond.wait(wait if wait > 0 else None)
+            interval = 1 / self.rate
+        time.sleep(interval)
+
+    def feedback(self, status: int, retry_after: Optional[float] = None) -> None:
+        with self._cond:
+            if status in THROTTLE_CODES:
+                self._successes = 0
+                self.rate = max(self.rate / 2, 0.2)
+                self.concurrency = max(self.concurrency // 2, 1)
+                backoff = min(retry_after if retry_after is not None else 1.0,
+                              MAX_BACKOFF)
+                self._blocked_until = max(self._blocked_until,
+                                          time.monotonic() + backoff)
+                self._tokens = min(self._tokens, 0.0)
+            elif status < 400:
+                self._successes += 1
+                self.rate = min(self.rate + 0.5, self.budget.rate)
+                if (self.concurrency < self.budget.concurrency
+                        and self._successes % 10 == 0):
+                    self.concurrency += 1
+            self._cond.notify_all()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self._tokens + (now - self._stamp) * self.rate,
+                           float(self.budget.burst))
+        self._stamp = now
+
+
+class RateLimiter:
+    """Hands out a :class:`HostLimiter` per host, sized by its budget."""
+
+    def __init__(self, default: Optional[SiteBudget] = None) -> None:
+        self.default = default or SiteBudget()
+        self.budgets: dict[str, SiteBudget] = {}
+        self._hosts: dict[str, HostLimiter] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, host: str, **budget: float) -> None:
+        """Set a host's budget, e.g. ``configure("btdig.com", concurrency=2)``."""
+        with self._lock:
+            self.budgets[host] = SiteBudget(**budget)  # type: ignore[arg-type]
+            self._hosts.pop(host, None)
+
+    def host(self, url: str) -> HostLimiter:
+        host = urlsplit(url).hostname or url
+        with self._lock:
+            limiter = self._hosts.get(host)
+            if limiter is None:
+                budget = self.budgets.get(host)
+                if budget is None and host.startswith("www."):
+                    budget = self.budgets.get(host[4:])
+                limiter = self._hosts[host] = HostLimiter(budget or self.default)
+            return limiter
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[HostLimiter]:
+        limiter = self.host(url)
+        limiter.acquire()
+        try:
+            yield limiter
+        finally:
+            limiter.release()
+
+
+_default = RateLimiter()
+
+
+def default_limiter() -> RateLimiter:
+    return _default
+
+
+def pace(url: str) -> None:
+    """Stand-in for a fixed sleep between requests to ``url``'s host.
+
+    Waits only as long as the host's budget requires: out of back-off, below
+    its in-flight cap, one rate interval apart.
+    """
+    _default.host(url).pace()
+
+
+def paced_pages(fetch: Callable[[str], T], urls: Iterable[str]) -> Iterator[T]:
+    """Fetch ``urls`` concurrently within their host's budget, in order.
+
+    Replaces ``for url in urls: fetch(url); time.sleep(delay)`` loops. A page
+    that raises is yielded as its exception instead of stopping the others.
+    """
+    urls = list(urls)
+    if not urls:
+        return
+    workers = max(_default.host(urls[0]).budget.concurrency, 1)
+
+    def call(url: str) -> T:
+        try:
+            return fetch(url)
+        except Exception as ex:
+            return ex  # type: ignore[return-value]
+
+    with ContextExecutor(min(workers, len(urls))) as executor:
+        yield from executor.map(call, urls)
+
+
+if "pytest" in sys.modules:
+    from email.utils import formatdate
+
+    def _timed(call: Callable[[], object]) -> float:
+        started = time.monotonic()
+        call()
+        return time.monotonic() - started
+
+    def test_parse_retry_after() -> None:
+        assert parse_retry_after("5") == 5.0
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("soon") is None
+        assert 8 < parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+
+    def test_burst_then_steady_rate() -> None:
+        limiter = HostLimiter(SiteBudget(rate=20, burst=2, concurrency=8))
+
+        def requests(n: int) -> None:
+            for _ in range(n):
+                limiter.acquire()
+                limiter.release()
+
+        assert _timed(lambda: requests(2)) < 0.05
+        # the burst is spent: four more at 20/s
+        assert 0.15 < _timed(lambda: requests(4)) < 0.5
+
+    def test_in_flight_cap() -> None:
+        limiter = HostLimiter(SiteBudget(rate=100, burst=10, concurrency=2))
+        limiter.acquire()
+        limiter.acquire()
+        threading.Timer(0.2, limiter.release).start()
+        assert _timed(limiter.acquire) >= 0.15
+
+    def test_throttling_backs_off_and_recovers() -> None:
+        limiter = HostLimiter(SiteBudget(rate=8, burst=8, concurrency=4))
+        limiter.feedback(429, retry_after=0.3)
+        assert (limiter.rate, limiter.concurrency) == (4, 2)
+        assert _timed(limiter.acquire) >= 0.25
+        limiter.release()
+        for _ in range(20):
+            limiter.feedback(200)
+        assert (limiter.rate, limiter.concurrency) == (8, 4)
+
+    def test_pace_waits_out_back_off() -> None:
+        limiter = RateLimiter(SiteBudget(rate=50)).host("https://paced.test/")
+        limiter.feedback(503, retry_after=0.2)
+        assert _timed(limiter.pace) >= 0.2
+
+    def test_configure_matches_www() -> None:
+        limiter = RateLimiter()
+        limiter.configure("site.test", rate=1, burst=1, concurrency=1)
+        assert limiter.host("https://www.site.test/a").budget.concurrency == 1
+        assert limiter.host("https://other.test/").budget == SiteBudget()
+
+    def test_paced_pages_keeps_order_and_failures() -> None:
+        def fetch(url: str) -> str:
+            if url.endswith("2"):
+                raise OSError(url)
+            time.sleep(0.05 if url.endswith("1") else 0)
+            return url
+
+        urls = [f"https://pages.test/{i}" for i in range(4)]
+        pages = list(paced_pages(fetch, urls))
+        assert pages[:2] == urls[:2] and pages[3] == urls[3]
+        assert isinstance(pages[2], OSError)
@@ -0,0 +1,255 @@
+"""Record real HTTP traffic once, replay it from a local stand-in server.
+
+Both modes work below every engine's HTTP code by swapping the connection
+classes in ``http.client``; ``urllib.request``, ``helpers.retrieve_url`` and
+the shared transport all look them up there at connect time.
+
+* :func:`recording` stores each response (status, headers and the raw,
+  still-encoded body) in a :class:`FixtureStore` while passing it through.
+* :class:`StandIn` serves a store over plain HTTP with configurable latency
+  and bandwidth, and :func:`replaying` points every connection at it while
+  keeping the original ``Host`` header, URL and TLS-less socket semantics,
+  so engines that check ``geturl()`` or cookies behave as they do live.
+
+Responses are keyed by method, host, path with query, and a digest of the
+request body; request bodies themselves (login forms) are never written.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import http.client
+import io
+import json
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Iterator, Optional, Union
+
+
+def fixture_key(method: str, host: str, target: str, body: Optional[bytes]) -> str:
+    host = host.rsplit(":", 1)[0] if host.count(":") == 1 else host
+    digest = hashlib.sha1(body or b"").hexdigest()
+    raw = "\n".join((method.upper(), host.lower(), target, digest))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class FixtureStore:
+    """A directory of recorded responses, ``<key>.json`` plus ``<key>.body``."""
+
+    def __init__(self, root: Union[str, Path]) -> None:
+        self.root = Path(root)
+
+    def save(
+        self,
+        key: str,
+        url: str,
+        status: int,
+        reason: str,
+        headers: list[tuple[str, str]],
+        body: bytes,
+    ) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        meta = {"url": url, "status": status, "reason": reason, "headers": headers}
+        (self.root / f"{key}.body").write_bytes(body)
+        (self.root / f"{key}.json").write_text(json.dumps(meta, indent=1))
+
+    def load(self, key: str) -> Optional[tuple[dict[str, Any], bytes]]:
+        try:
+            meta = json.loads((self.root / f"{key}.json").read_text())
+            return meta, (self.root / f"{key}.body").read_bytes()
+        except FileNotFoundError:
+            return None
+
+
+class _FakeSocket:
+    def __init__(self, data: bytes) -> None:
+        self._data = data
+
+    def makefile(self, *args: object, **kwargs: object) -> io.BytesIO:
+        return io.BytesIO(self._data)
+
+
+def _raw_response(
+    status: int, reason: str, headers: list[tuple[str, str]], body: bytes
+) -> bytes:
+    lines = [f"HTTP/1.1 {status} {reason}"]
+    for name, value in headers:
+        if name.lower() not in ("transfer-encoding", "content-length"):
+            lines.append(f"{name}: {value}")
+    lines.append(f"Content-Length: {len(body)}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+def _recording_class(
+    base: type, store: FixtureStore, scheme: str
+) -> type:
+    class RecordingConnection(base):  # type: ignore[misc,valid-type]
+        def request(self, method, url, body=None, headers={}, **kwargs):  # noqa: B006
+            self._replay_request = (method, url, body)
+            return super().request(method, url, body, headers, **kwargs)
+
+        def getresponse(self) -> http.client.HTTPResponse:
+            resp = super().getresponse()
+            method, target, body = self._replay_request
+            host = getattr(self, "_tunnel_host", None) or self.host
+            if isinstance(body, str):
+                body = body.encode()
+            # read() undoes chunked framing only, the body stays
+            # content-encoded and is re-framed with a plain Content-Length
+            resp_body = resp.read()
+            headers = resp.msg.items()
+            store.save(
+                fixture_key(method, host, target, body if isinstance(body, bytes) else None),
+                f"{scheme}://{host}{target}",
+                resp.status,
+                resp.reason,
+                headers,
+                resp_body,
+            )
+            fake = http.client.HTTPResponse(
+                _FakeSocket(_raw_response(resp.status, resp.reason, headers, resp_body)),  # type: ignore[arg-type]
+                method=method,
+            )
+            fake.begin()
+            return fake
+
+    return RecordingConnection
+
+
+@contextmanager
+def recording(store: FixtureStore) -> Iterator[FixtureStore]:
+    """Record every response fetched inside the block into ``store``."""
+    http_cls, https_cls = http.client.HTTPConnection, http.client.HTTPSConnection
+    http.client.HTTPConnection = _recording_class(http_cls, store, "http")  # type: ignore[misc]
+    http.client.HTTPSConnection = _recording_class(https_cls, store, "https")  # type: ignore[misc]
+    try:
+        yield store
+    finally:
+        http.client.HTTPConnection = http_cls  # type: ignore[misc]
+        http.client.HTTPSConnection = https_cls  # type: ignore[misc]
+
+
+class StandIn:
+    """Local HTTP server answering from a :class:`FixtureStore`.
+
+    ``latency`` (seconds) is waited before each response, ``bandwidth``
+    (bytes per second, 0 for unlimited) throttles the body.
+    """
+
+    def __init__(
+        self, store: FixtureStore, latency: float = 0.0, bandwidth: int = 0
+    ) -> None:
+        self.store = store
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.served = 0
+        self.misses: list[str] = []
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self._server.server_address[:2]  # type: ignore[return-value]
+
+    def start(self) -> "StandIn":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StandIn":
+        return self.start()
+
+    def __exit__(self, *exc: object) -> None:
+        self.stop()
+
+    def _handler(self) -> type:
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: object) -> None:
+                pass
+
+            def _serve(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else None
+                host = self.headers.get("Host", "")
+                found = stand_in.store.load(
+                    fixture_key(self.command, host, self.path, body)
+                )
+                if stand_in.latency:
+                    time.sleep(stand_in.latency)
+                if found is None:
+                    with stand_in._lock:
+                        stand_in.misses.append(f"{self.command} {host}{self.path}")
+                    self.send_response(404, "No fixture")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                meta, payload = found
+                self.send_response(meta["status"], meta["reason"])
+                for name, value in meta["headers"]:
+                    if name.lower() not in ("transfer-encoding", "content-length", "connection"):
+                        self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                stand_in._write(self.wfile, payload)
+                with stand_in._lock:
+                    stand_in.served += 1
+                    stand_in.bytes_sent += len(payload)
+
+            do_GET = do_POST = do_HEAD = do_PUT = _serve
+
+        return Handler
+
+    def _write(self, wfile: Any, payload: bytes) -> None:
+        if not self.bandwidth:
+            wfile.write(payload)
+            return
+        chunk = max(self.bandwidth // 20, 1024)
+        for start in range(0, len(payload), chunk):
+            part = payload[start:start + chunk]
+            wfile.write(part)
+            time.sleep(len(part) / self.bandwidth)
+
+
+def _replay_class(base_port: int, address: tuple[str, int]) -> type:
+    class ReplayConnection(http.client.HTTPConnection):
+        default_port = base_port
+
+        def __init__(self, host: str, port: Optional[int] = None, timeout: Any = socket._GLOBAL_DEFAULT_TIMEOUT,  # type: ignore[attr-defined]
+                     source_address: Any = None, blocksize: int = 8192, **kwargs: Any) -> None:
+            # TLS arguments (context, check_hostname) do not apply to the stand-in
+            super().__init__(host, port, timeout, source_address, blocksize)
+
+        def set_tunnel(self, host: str, port: Optional[int] = None, headers: Any = None) -> None:
+            # replaying talks to the stand-in directly, proxies are bypassed
+            self.host, self.port = self._get_hostport(host, port)
+
+        def connect(self) -> None:
+            self.sock = socket.create_connection(address, self.timeout)
+
+    return ReplayConnection
+
+
+@contextmanager
+def replaying(stand_in: StandIn) -> Iterator[StandIn]:
+    """Send every connection made inside the block to ``stand_in``."""
+    http_cls, https_cls = http.client.HTTPConnection, http.client.HTTPSConnection
+    http.client.HTTPConnection = _replay_class(80, stand_in.address)  # type: ignore[misc]
+    http.client.HTTPSConnection = _replay_class(443, stand_in.address)  # type: ignore[misc]
+    try:
+        yield stand_in
+    finally:
+        http.client.HTTPConnection = http_cls  # type: ignore[misc]
+        http.client.HTTPSConnection = https_cls  # type: ignore[misc]
@@ -0,0 +1,481 @@
+"""Federated search: run several engines in one process under one deadline.
+
+Every engine module stays unchanged. :func:`load_engine` imports it from its
+file, and :class:`Runner` swaps the module's ``prettyPrinter`` for a sink that
+tags each row with the engine it came from and pushes it onto one queue.
+Each engine's ``search`` runs on a daemon thread of its own, at most
+``max_workers`` of them at a time, and rows are yielded as they arrive. An
+engine still running when its own budget or the global deadline expires is
+reported as cut off and ignored from then on; Python can't stop its thread,
+so it is left to finish or hang on its own while its place goes to the next
+engine.
+
+With a :class:`~qbt_common.store.ResultStore` an engine whose last complete
+search is within its TTL answers from the store instead; once that answer is
+older than the engine's ``refresh_after`` the engine also searches in the
+background and the store is updated when it finishes.
+
+``dedupe`` merges the same torrent returned by several engines into one row
+(keyed by infohash, see :mod:`qbt_common.dedupe`). With ``QBT_TRACE`` set
+each search and printed row is recorded as a span, see :mod:`qbt_common.trace`.
+
+Command line (the query is quoted the way ``nova2.py`` does it)::
+
+    python -m qbt_common.runner -d 20 -b 10 -q ubuntu \\
+        public_sites/btdig.py public_sites/nyaasi.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import queue
+import sys
+import threading
+import time
+import types
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Mapping, Optional, Union
+from urllib.parse import quote
+
+from . import trace
+from .dedupe import Deduper
+from .store import DEFAULT_PATH, ResultStore
+
+try:
+    import novaprinter
+except ImportError:
+    novaprinter = None  # type: ignore[assignment]
+
+# engine report states
+PENDING, RUNNING, DONE, ERROR, CUT_OFF, SKIPPED, CACHED = (
+    "pending",
+    "running",
+    "done",
+    "error",
+    "cut off",
+    "not started",
+    "cached",
+)
+
+# queued by a job that starts with a budget, so the collecting loop
+# recomputes its wait
+_STARTED: dict = {}
+
+
+def load_engine(path: Union[str, Path]) -> type:
+    """Import an engine file and return its class (named after the file)."""
+    path = Path(path)
+    spec = importlib.util.spec_from_file_location(f"qbt_engine_{path.stem}", path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Can't load engine from {path}")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return getattr(module, path.stem)
+
+
+def engine_name(engine: type) -> str:
+    """The name users know an engine by: its file's stem (``rutracker``),
+    not its class name (``RuTracker``). Budgets, reports and the result
+    store are keyed by it."""
+    path = getattr(sys.modules.get(engine.__module__), "__file__", None)
+    return Path(path).stem if path else engine.__name__
+
+
+def redirect_printer(engine: type, sink: Callable[[dict], None]) -> None:
+    """Send the rows an engine prints through ``prettyPrinter`` to ``sink``.
+
+    Handles both ``from novaprinter import prettyPrinter`` and
+    ``import novaprinter`` styles; other modules keep the real printer.
+    """
+    module = sys.modules[engine.__module__]
+    if hasattr(module, "prettyPrinter"):
+        module.prettyPrinter = sink  # type: ignore[attr-defined]
+    if isinstance(getattr(module, "novaprinter", None), types.ModuleType):
+        shim = types.ModuleType("novaprinter")
+        shim.__dict__.update(vars(module.novaprinter))
+        shim.prettyPrinter = sink  # type: ignore[attr-defined]
+        module.novaprinter = shim  # type: ignore[attr-defined]
+
+
+@dataclass
+class EngineReport:
+    name: str
+    state: str = PENDING
+    results: int = 0
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    error: Optional[str] = None
+    cached: int = 0  # rows answered from the result store
+
+    @property
+    def elapsed(self) -> Optional[float]:
+        if self.started is None:
+            return None
+        return (self.finished or time.monotonic()) - self.started
+
+
+class _Job:
+    def __init__(self, engine: type, budget: Optional[float]) -> None:
+        self.engine = engine
+        self.name = engine_name(engine)
+        self.budget = budget
+        self.deadline = float("inf")
+        self.report = EngineReport(self.name)
+        self.rows: list[dict] = []
+        # refreshing a stored answer: rows go to the store only
+        self.background = False
+        self._slot: Optional[threading.Semaphore] = None
+        self._slot_lock = threading.Lock()
+
+    def hold(self, slot: threading.Semaphore) -> None:
+        with self._slot_lock:
+            self._slot = slot
+
+    def release(self) -> None:
+        """Give the job's place back, once: when it finishes or is cut off."""
+        with self._slot_lock:
+            slot, self._slot = self._slot, None
+        if slot is not None:
+            slot.release()
+
+
+class Runner:
+    """Run ``search`` of many engines concurrently and merge their rows.
+
+    ``deadline`` bounds the whole search in seconds; ``budgets`` bounds each
+    engine, either one number for all or a mapping of engine name (see
+    :func:`engine_name`) to seconds (missing names fall back to
+    ``default_budget``). At most ``max_workers``
+    engines run at the same time. ``store`` answers repeated searches from
+    disk, see :mod:`qbt_common.store`. With ``dedupe`` each torrent is
+    yielded once, under the first engine to return it; the engines returning
+    it later are added to its ``sources`` and its seeds/leech raised to the
+    best figure. Torrents with an infohash are therefore only yielded when
+    the search is over, and :attr:`deduper` holds the merged records.
+    """
+
+    def __init__(
+        self,
+        engines: Iterable[Union[type, str, Path]],
+        deadline: float = 30.0,
+        budgets: Union[None, float, Mapping[str, float]] = None,
+        default_budget: Optional[float] = None,
+        max_workers: int = 8,
+        store: Optional[ResultStore] = None,
+        dedupe: bool = False,
+    ) -> None:
+        self.engines = [
+            e if isinstance(e, type) else load_engine(e) for e in engines
+        ]
+        self.deadline = deadline
+        self.budgets = budgets
+        self.default_budget = default_budget
+        self.max_workers = max_workers
+        self.store = store
+        self.dedupe = dedupe
+        self.deduper: Optional[Deduper] = None
+        self.reports: dict[str, EngineReport] = {}
+        self._workers: list[threading.Thread] = []
+
+    def budget_for(self, name: str) -> Optional[float]:
+        if isinstance(self.budgets, Mapping):
+            return self.budgets.get(name, self.default_budget)
+        return self.default_budget if self.budgets is None else self.budgets
+
+    def run(self, what: str, cat: str = "all") -> Iterator[tuple[str, dict]]:
+        """Yield ``(engine name, row)`` pairs until every engine is finished,
+        cut off, or the global deadline passes."""
+        rows = self._run(what, cat)
+        if self.dedupe:
+            self.deduper = Deduper()
+            rows = self.deduper.filter(rows)
+        return rows
+
+    def _run(self, what: str, cat: str) -> Iterator[tuple[str, dict]]:
+        started = time.monotonic()
+        deadline = started + self.deadline
+        rows: "queue.Queue[tuple[_Job, Optional[dict]]]" = queue.Queue()
+        jobs: "queue.Queue[_Job]" = queue.Queue()
+        active, refresh, answered = [], [], []
+        for engine in self.engines:
+            job = _Job(engine, self.budget_for(engine_name(engine)))
+            self.reports[job.name] = job.report
+            stored = self.store and self.store.lookup(job.name, what, cat)
+            if stored:
+                job.report.cached = job.report.results = len(stored.rows)
+                answered.extend((job.name, row) for row in stored.rows)
+                if not stored.needs_refresh:
+                    job.report.state = CACHED
+                    continue
+                job.background = True
+                refresh.append(job)
+            else:
+                active.append(job)
+            self._install_sink(job, rows)
+        # live searches take the workers first, refreshes queue behind them
+        for job in active + refresh:
+            jobs.put(job)
+
+        # a thread per job, so an engine stuck past its budget holds a
+        # thread but not one of the max_workers places
+        slots = threading.Semaphore(max(self.max_workers, 1))
+        self._workers = [
+            threading.Thread(
+                target=self._worker,
+                args=(jobs, slots, rows, what, cat, deadline),
+                daemon=True,
+            )
+            for _ in range(jobs.qsize())
+        ]
+        for thread in self._workers:
+            thread.start()
+        yield from answered
+
+        while active:
+            now = time.monotonic()
+            for job in list(active):
+                if now >= min(job.deadline, deadline):
+                    self._cut_off(job, now)
+                    active.remove(job)
+            if not active:
+                break
+            timeout = min([deadline] + [j.deadline for j in active]) - now
+            try:
+                job, row = rows.get(timeout=max(timeout, 0))
+            except queue.Empty:
+                continue
+            if job not in active or row is _STARTED:
+                continue
+            if row is None:
+                active.remove(job)
+            else:
+                job.report.results += 1
+                yield job.name, row
+
+    @staticmethod
+    def _cut_off(job: _Job, now: float) -> None:
+        report = job.report
+        if report.state == PENDING:
+            report.state = SKIPPED
+        elif report.state == RUNNING:
+            report.state, report.finished = CUT_OFF, now
+        job.release()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for background refreshes; ``False`` if some still run."""
+        end = time.monotonic() + (timeout if timeout is not None else float("inf"))
+        for thread in self._workers:
+            thread.join(max(end - time.monotonic(), 0) if timeout is not None else None)
+        return not any(thread.is_alive() for thread in self._workers)
+
+    def _install_sink(self, job: _Job, rows: "queue.Queue") -> None:
+        def sink(row: dict) -> None:
+            row = dict(row)
+            if self.store is not None:
+                job.rows.append(dict(row))
+            if not job.background:
+                rows.put((job, row))
+
+        redirect_printer(job.engine, sink)
+
+    def _worker(
+        self,
+        jobs: "queue.Queue[_Job]",
+        slots: threading.Semaphore,
+        rows: "queue.Queue",
+        what: str,
+        cat: str,
+        deadline: float,
+    ) -> None:
+        slots.acquire()
+        # jobs leave the queue in order, whichever thread got the place
+        job = jobs.get_nowait()
+        job.hold(slots)
+        report = job.report
+        now = time.monotonic()
+        if report.state != PENDING or (now >= deadline and not job.background):
+            report.state = SKIPPED
+            job.release()
+            rows.put((job, None))
+            return
+        report.state, report.started = RUNNING, now
+        if job.budget is not None:
+            job.deadline = now + job.budget
+            rows.put((job, _STARTED))
+        try:
+            with trace.span("search", job.name, what=what, cat=cat,
+                            background=job.background):
+                job.engine().search(what, cat)
+        except Exception as ex:
+            report.error = f"{type(ex).__name__}: {ex}"
+        if report.state == RUNNING:
+            report.state = ERROR if report.error else DONE
+            report.finished = time.monotonic()
+        job.release()
+        if report.state == DONE and self.store is not None:
+            # only complete searches replace what the store holds
+            self.store.save(job.name, what, cat, job.rows)
+        job.rows = []
+        rows.put((job, None))
+
+
+def _print_row(row: dict) -> None:
+    if novaprinter is not None:
+        novaprinter.prettyPrinter(row)
+        return
+    print(
+        "|".join(
+            str(row.get(k, -1))
+            for k in (
+                "link", "name", "size", "seeds", "leech",
+                "engine_url", "desc_link", "pub_date",
+            )
+        )
+    )
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("engines", nargs="+", help="engine .py files")
+    parser.add_argument("-q", "--query", required=True)
+    parser.add_argument("-c", "--category", default="all")
+    parser.add_argument("-d", "--deadline", type=float, default=30.0,
+                        help="global wall-clock deadline, seconds")
+    parser.add_argument("-b", "--budget", type=float,
+                        help="per-engine budget, seconds")
+    parser.add_argument("-w", "--workers", type=int, default=8,
+                        help="engines running at the same time")
+    parser.add_argument("-s", "--store", type=Path, nargs="?",
+                        const=DEFAULT_PATH,
+                        help="answer from and save to a result store"
+                             " (default qbt_common/results.sqlite3)")
+    parser.add_argument("-u", "--dedupe", action="store_true",
+                        help="print each torrent once across engines")
+    args = parser.parse_args(argv)
+
+    started = time.monotonic()
+    runner = Runner(args.engines, args.deadline, args.budget,
+                    max_workers=args.workers,
+                    store=ResultStore(args.store) if args.store else None,
+                    dedupe=args.dedupe)
+    for name, row in runner.run(quote(args.query), args.category):
+        with trace.span("print", name):
+            _print_row(row)
+    sys.stdout.flush()
+    # let background refreshes land in the store before the process exits
+    runner.wait(max(args.deadline - (time.monotonic() - started), 0))
+    for report in runner.reports.values():
+        if report.state not in (DONE, CACHED):
+            print(f"{report.name}: {report.state}"
+                  + (f" ({report.error})" if report.error else ""),
+                  file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+if "pytest" in sys.modules:
+    import pytest
+
+    ENGINE = '''
+import time
+
+
+def prettyPrinter(row):
+    print(row)
+
+
+class {name}:
+    def search(self, what, cat="all"):
+        time.sleep({sleep})
+        for i in range({rows}):
+            prettyPrinter({{"link": "{name}/%d" % i, "name": what, "seeds": i}})
+'''
+
+    @pytest.fixture
+    def make_engine(tmp_path: Path) -> Callable[..., Path]:
+        def make(name: str, sleep: float = 0, rows: int = 1) -> Path:
+            path = tmp_path / f"{name}.py"
+            path.write_text(ENGINE.format(name=name, sleep=sleep, rows=rows))
+            return path
+        return make
+
+    def test_rows_are_tagged_with_their_engine(make_engine: Callable[..., Path]) -> None:
+        runner = Runner([make_engine("one", rows=2), make_engine("two")], deadline=5)
+        rows = sorted((name, row["link"]) for name, row in runner.run("q"))
+        assert rows == [("one", "one/0"), ("one", "one/1"), ("two", "two/0")]
+        assert {r.state for r in runner.reports.values()} == {DONE}
+
+    def test_engine_past_its_budget_is_cut_off(make_engine: Callable[..., Path]) -> None:
+        # one place only: "fast" can't start until "slow" gives it up
+        runner = Runner([make_engine("slow", sleep=10), make_engine("fast")],
+                        deadline=5, budgets={"slow": 0.3}, max_workers=1)
+        started = time.monotonic()
+        rows = [(name, row["link"]) for name, row in runner.run("q")]
+        assert time.monotonic() - started < 2
+        assert rows == [("fast", "fast/0")]
+        assert runner.reports["slow"].state == CUT_OFF
+        assert runner.reports["fast"].state == DONE
+
+    def test_engines_are_named_after_their_file(make_engine: Callable[..., Path], tmp_path: Path) -> None:
+        path = make_engine("RuTracker")
+        path = path.rename(path.with_name("rutracker.py"))
+        path.write_text(path.read_text() + "\nrutracker = RuTracker\n")
+        store = ResultStore(tmp_path / "results.sqlite3")
+        runner = Runner([path], deadline=5, store=store)
+        assert [name for name, _ in runner.run("q")] == ["rutracker"]
+        assert list(runner.reports) == ["rutracker"]
+        cached = store.lookup("rutracker", "q", "all")
+        assert cached is not None and cached.policy == store.policy("rutracker")
+        assert cached.policy.ttl < store.default.ttl
+
+    def test_dedupe_prints_the_merged_row(tmp_path: Path) -> None:
+        magnet = "magnet:?xt=urn:btih:" + "ab" * 20
+        for name, seeds in (("low", 1), ("high", 30)):
+            (tmp_path / f"{name}.py").write_text(
+                f"def prettyPrinter(row):\n    pass\n\n\nclass {name}:\n"
+                f"    def search(self, what, cat='all'):\n"
+                f"        prettyPrinter({{'link': {magnet!r}, 'name': what, 'seeds': {seeds}}})\n"
+            )
+        runner = Runner([tmp_path / "low.py", tmp_path / "high.py"], deadline=5, dedupe=True)
+        rows = [row for _, row in runner.run("q")]
+        assert [(r["seeds"], sorted(r["sources"])) for r in rows] == [(30, ["high", "low"])]
+
+    RUTOR_PAGE = (
+        "<b>Поиск</b> Результатов поиска 1 <table>"
+        '<tr class="gai"><td>03&nbsp;Мар&nbsp;24</td><td>'
+        '<a href="magnet:?xt=urn:btih:%s">M</a>'
+        '<a href="/torrent/42/ubuntu">Ubuntu 24.04</a></td>'
+        '<td align="right">5.7&nbsp;GB</td><td align="center">'
+        '<span class="green">9</span> <span class="red">1</span></td></tr></table>'
+    ) % ("ab" * 20)
+
+    def test_imdmg_engine_rows_are_captured(tmp_path: Path) -> None:
+        # the imDMG engines print from their own module like every other one
+        pytest.importorskip("novaprinter")
+        pytest.importorskip("socks")
+        from .replay import FixtureStore, StandIn, fixture_key, replaying
+
+        engine = tmp_path / "rutor.py"
+        engine.write_bytes((Path(__file__).parents[1] / "public_sites" / "rutor.py").read_bytes())
+        store = FixtureStore(tmp_path / "fixtures")
+        target = "/search/0/0/000/0/ubuntu"
+        store.save(fixture_key("GET", "rutor.info", target, None), "https://rutor.info" + target,
+                   200, "OK", [("Content-Type", "text/html; charset=utf-8")], RUTOR_PAGE.encode())
+        with StandIn(store) as stand_in, replaying(stand_in):
+            runner = Runner([engine], deadline=10)
+            rows = [(name, row["name"], row["link"]) for name, row in runner.run("ubuntu")]
+        assert rows == [("rutor", "Ubuntu 24.04", "https://d.rutor.info/download/42")]
+        assert runner.reports["rutor"].state == DONE
+
+    def test_global_deadline_skips_engines_not_started(make_engine: Callable[..., Path]) -> None:
+        runner = Runner([make_engine("slow", sleep=10), make_engine("late")],
+                        deadline=0.3, max_workers=1)
+        assert list(runner.run("q")) == []
+        assert runner.reports["slow"].state == CUT_OFF
+        assert runner.reports["late"].state == SKIPPED
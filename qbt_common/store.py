@@ -0,0 +1,244 @@
+"""Persistent result store for instant repeat queries.
+
+Every row an engine emits through the runner (``-s``), or through the daemon
+started with ``--store``, is kept in SQLite (WAL mode, so readers never wait
+on the writer) together with its engine, normalised query, category and
+fetch time. A repeated search is answered from the store at once
+and, depending on the engine's :class:`Freshness`, refreshed live in the
+background.
+
+Freshness is configured per engine, named by its file's stem (``rutracker``
+for ``rutracker.py``, whatever its class is called). Built-in defaults keep
+private trackers, whose seed counts go stale quickly, on a much shorter
+leash than public catalogues; ``freshness.json`` next to the database
+overrides them::
+
+    {
+        "default": {"ttl": 21600, "refresh_after": 900},
+        "rutracker": {"ttl": 1800, "refresh_after": 120}
+    }
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Mapping, Optional, Union
+from urllib.parse import unquote
+
+DEFAULT_PATH = Path(__file__).with_name("results.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    engine TEXT NOT NULL,
+    query TEXT NOT NULL,
+    cat TEXT NOT NULL,
+    fetched REAL NOT NULL,
+    PRIMARY KEY (engine, query, cat)
+);
+CREATE TABLE IF NOT EXISTS results (
+    engine TEXT NOT NULL,
+    query TEXT NOT NULL,
+    cat TEXT NOT NULL,
+    link TEXT NOT NULL,
+    fetched REAL NOT NULL,
+    row TEXT NOT NULL,
+    PRIMARY KEY (engine, query, cat, link)
+);
+"""
+
+
+@dataclass
+class Freshness:
+    ttl: float = 6 * 3600  # answer from the store while younger than this
+    refresh_after: float = 15 * 60  # ...and refresh in background once older
+
+
+DEFAULT_FRESHNESS = Freshness()
+PRIVATE_FRESHNESS = Freshness(ttl=30 * 60, refresh_after=2 * 60)
+DEFAULT_POLICIES = {
+    name: PRIVATE_FRESHNESS
+    for name in (
+        "bakabt", "danishbytes", "gazellegames", "iptorrents", "kinozal",
+        "lostfilm", "ncore", "nnmclub", "pornolab", "redacted_ch",
+        "rutracker", "sharewood", "speedapp", "tapochek", "toloka_to",
+        "torrentleech", "unionfansub", "yggapi", "yggtorrent",
+    )
+}
+
+
+def normalize_query(what: str) -> str:
+    return " ".join(unquote(what).lower().split())
+
+
+@dataclass
+class CachedSearch:
+    rows: list[dict]
+    age: float
+    policy: Freshness
+
+    @property
+    def needs_refresh(self) -> bool:
+        return self.age > self.policy.refresh_after
+
+
+class ResultStore:
+    def __init__(
+        self,
+        path: Union[str, Path] = DEFAULT_PATH,
+        policies: Optional[Mapping[str, Freshness]] = None,
+    ) -> None:
+        self.path = Path(path)
+        self.policies = dict(DEFAULT_POLICIES)
+        self.default = DEFAULT_FRESHNESS
+        self._load_policies(self.path.with_name("freshness.json"))
+        self.policies.update(policies or {})
+        self._local = threading.local()
+        with self._db() as db:
+            db.executescript(SCHEMA)
+
+    def policy(self, engine: str) -> Freshness:
+        return self.policies.get(engine, self.default)
+
+    def lookup(self, engine: str, what: str, cat: str) -> Optional[CachedSearch]:
+        """Rows of the last complete search, if still within the engine's TTL."""
+        query, policy = normalize_query(what), self.policy(engine)
+        db = self._db()
+        found = db.execute(
+            "SELECT fetched FROM searches WHERE engine=? AND query=? AND cat=?",
+            (engine, query, cat),
+        ).fetchone()
+        if found is None:
+            return None
+        age = time.time() - found[0]
+        if age > policy.ttl:
+            return None
+        rows = [
+            json.loads(row)
+            for row, in db.execute(
+                "SELECT row FROM results WHERE engine=? AND query=? AND cat=?",
+                (engine, query, cat),
+            )
+        ]
+        return CachedSearch(rows, age, policy)
+
+    def save(self, engine: str, what: str, cat: str, rows: Iterable[dict]) -> None:
+        """Replace the stored results of one engine's search."""
+        query, now = normalize_query(what), time.time()
+        with self._db() as db:
+            db.execute(
+                "DELETE FROM results WHERE engine=? AND query=? AND cat=?",
+                (engine, query, cat),
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (engine, query, cat, str(row.get("link")), now,
+                     json.dumps(row, ensure_ascii=False))
+                    for row in rows
+                ),
+            )
+            db.execute(
+                "INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?)",
+                (engine, query, cat, now),
+            )
+
+    def purge(self) -> None:
+        """Drop searches older than their engine's TTL."""
+        now = time.time()
+        with self._db() as db:
+            for engine, query, cat, fetched in db.execute(
+                "SELECT engine, query, cat, fetched FROM searches"
+            ).fetchall():
+                if now - fetched > self.policy(engine).ttl:
+                    db.execute(
+                        "DELETE FROM results WHERE engine=? AND query=? AND cat=?",
+                        (engine, query, cat),
+                    )
+                    db.execute(
+                        "DELETE FROM searches WHERE engine=? AND query=? AND cat=?",
+                        (engine, query, cat),
+                    )
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _load_policies(self, path: Path) -> None:
+        try:
+            config = json.loads(path.read_text())
+        except FileNotFoundError:
+            return
+        for name, values in config.items():
+            if name == "default":
+                self.default = Freshness(**values)
+            else:
+                self.policies[name] = Freshness(**values)
+
+
+if "pytest" in sys.modules:
+    import pytest
+
+    ROWS = [{"link": "magnet:?xt=1", "name": "one"}, {"link": "magnet:?xt=2", "name": "two"}]
+
+    @pytest.fixture
+    def store(tmp_path: Path) -> ResultStore:
+        return ResultStore(tmp_path / "results.sqlite3", {"fast": Freshness(ttl=10, refresh_after=1)})
+
+    def test_policies(store: ResultStore) -> None:
+        assert store.policy("rutracker") == PRIVATE_FRESHNESS
+        assert store.policy("nyaasi") == DEFAULT_FRESHNESS
+        assert store.policy("fast").ttl == 10
+
+    def test_freshness_json_overrides_defaults(tmp_path: Path) -> None:
+        (tmp_path / "freshness.json").write_text(json.dumps({
+            "default": {"ttl": 60, "refresh_after": 5},
+            "rutracker": {"ttl": 30, "refresh_after": 3},
+        }))
+        store = ResultStore(tmp_path / "results.sqlite3")
+        assert store.policy("nyaasi") == Freshness(60, 5)
+        assert store.policy("rutracker") == Freshness(30, 3)
+
+    def test_lookup_normalises_the_query(store: ResultStore) -> None:
+        store.save("fast", "Ubuntu%20%20Server", "all", ROWS)
+        cached = store.lookup("fast", "ubuntu server", "all")
+        assert cached is not None and cached.rows == ROWS
+        assert not cached.needs_refresh
+        assert store.lookup("fast", "ubuntu server", "software") is None
+        assert store.lookup("other", "ubuntu server", "all") is None
+
+    def test_save_replaces_the_previous_rows(store: ResultStore) -> None:
+        store.save("fast", "q", "all", ROWS)
+        store.save("fast", "q", "all", ROWS[:1])
+        assert store.lookup("fast", "q", "all").rows == ROWS[:1]
+
+    def test_refresh_then_expiry(store: ResultStore, monkeypatch: pytest.MonkeyPatch) -> None:
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now)
+        store.save("fast", "q", "all", ROWS)
+        monkeypatch.setattr(time, "time", lambda: now + 5)
+        cached = store.lookup("fast", "q", "all")
+        assert cached is not None and cached.needs_refresh
+        monkeypatch.setattr(time, "time", lambda: now + 11)
+        assert store.lookup("fast", "q", "all") is None
+        store.purge()
+        monkeypatch.setattr(time, "time", lambda: now)
+        assert store.lookup("fast", "q", "all") is None
+
+    def test_wal_readers_on_other_threads(store: ResultStore) -> None:
+        assert store._db().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        store.save("fast", "q", "all", ROWS)
+        found: list = []
+        thread = threading.Thread(target=lambda: found.append(store.lookup("fast", "q", "all")))
+        thread.start()
+        thread.join()
+        assert found[0].rows == ROWS
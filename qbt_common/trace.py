@@ -0,0 +1,430 @@
+"""Opt-in tracing of searches as structured spans.
+
+Set ``QBT_TRACE`` to a file and the runner and daemon record a span for
+every engine search, the transport one for every HTTP request (``fetch``,
+with ``dns``/``connect``/``tls``/``ttfb``/``body`` seconds, status and byte
+counts), and instrumented engines their pages, parsing and printing. Each
+span carries the engine it ran for::
+
+    QBT_TRACE=/tmp/search.json python -m qbt_common.runner -q ubuntu public_sites/*.py
+
+A path ending in ``.json`` is written as a Chrome trace (``chrome://tracing``,
+https://ui.perfetto.dev), anything else as JSON lines, one span per line.
+``%p`` in the path is replaced by the process id, for qBittorrent's one
+process per search. ``python -m qbt_common.trace FILE`` summarises a trace:
+per engine and span name, the time spent in the span itself, not counting
+spans nested in it, so a slow search shows whether it waited on the network,
+parsed or printed.
+
+Without ``QBT_TRACE`` :func:`span` returns a shared no-op and functions
+wrapped by :func:`traced` only check that tracing is off. Tasks keep their
+span's context across this package's own threads (:class:`ContextExecutor`,
+the page workers); spans opened in an engine's own executor have no parent
+and take their engine from the only search running, if there is one. Engines
+mark their own steps with a fallback for when this package is missing::
+
+    try:
+        from qbt_common.trace import traced
+    except ImportError:
+        def traced(name, **attrs):
+            return lambda func: func
+
+    @traced("parse")
+    def draw(self, html): ...
+
+    prettyPrinter = traced("print")(prettyPrinter)
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextvars
+import functools
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# fetch attributes that are durations, summed by the summary
+PHASES = ("wait", "dns", "connect", "tls", "ttfb", "body")
+
+_ids = itertools.count(1)
+_current: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar(
+    "qbt_trace_span", default=None
+)
+_writer: Optional["_Writer"] = None
+# engines with a search in progress, to name spans from threads that did
+# not inherit the search's context
+_active: dict[str, int] = defaultdict(int)
+_active_lock = threading.Lock()
+
+
+def _only_engine() -> Optional[str]:
+    with _active_lock:
+        running = [name for name, count in _active.items() if count]
+    return running[0] if len(running) == 1 else None
+
+
+class Span:
+    """One timed step; use as a context manager or :meth:`end` it."""
+
+    __slots__ = ("name", "engine", "attrs", "id", "parent", "thread",
+                 "start", "_t0", "_token")
+
+    def __init__(self, name: str, engine: Optional[str], attrs: dict) -> None:
+        parent = _current.get()
+        self.name = name
+        self.engine = engine or (parent.engine if parent else None) or _only_engine()
+        self.attrs = attrs
+        self.id = next(_ids)
+        self.parent = parent.id if parent else None
+        self.thread = threading.get_ident()
+        self.start = time.time()
+        self._t0: Optional[float] = time.perf_counter()
+        self._token: Any = None
+
+    def __bool__(self) -> bool:
+        return True
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def end(self, **attrs: Any) -> None:
+        """Record the span; later calls are ignored."""
+        if self._t0 is None:
+            return
+        duration = time.perf_counter() - self._t0
+        self._t0 = None
+        self.attrs.update(attrs)
+        writer = _writer
+        if writer is not None:
+            writer.write(self, duration)
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        if self.name == "search" and self.engine:
+            with _active_lock:
+                _active[self.engine] += 1
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        _current.reset(self._token)
+        if self.name == "search" and self.engine:
+            with _active_lock:
+                _active[self.engine] -= 1
+        if exc_type is not None:
+            self.attrs.setdefault("error", f"{exc_type.__name__}: {exc}")
+        self.end()
+
+
+class _NullSpan:
+    """What :func:`span` returns while tracing is off."""
+
+    __slots__ = ()
+
+    def __bool__(self) -> bool:
+        return False
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def end(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Writer:
+    def __init__(self, path: str) -> None:
+        self.path = path.replace("%p", str(os.getpid()))
+        self.chrome = self.path.endswith(".json")
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a", encoding="utf-8")
+        if self.chrome and self._file.tell() == 0:
+            # the closing bracket is optional in the trace event format
+            self._file.write("[\n")
+
+    def write(self, span: Span, duration: float) -> None:
+        attrs = {
+            k: round(v, 6) if isinstance(v, float) else v
+            for k, v in span.attrs.items()
+        }
+        if self.chrome:
+            record = {
+                "name": span.name,
+                "cat": span.engine or "",
+                "ph": "X",
+                "ts": round(span.start * 1e6),
+                "dur": round(duration * 1e6),
+                "pid": self.pid,
+                "tid": span.thread,
+                "args": dict(attrs, engine=span.engine),
+            }
+        else:
+            record = {
+                "name": span.name,
+                "engine": span.engine,
+                "start": round(span.start, 6),
+                "dur": round(duration, 6),
+                "id": span.id,
+                "parent": span.parent,
+                "pid": self.pid,
+                "thread": span.thread,
+                **attrs,
+            }
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + (",\n" if self.chrome else "\n"))
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def enabled() -> bool:
+    return _writer is not None
+
+
+def configure(path: Optional[str]) -> None:
+    """Start writing spans to ``path`` (``None`` stops tracing)."""
+    global _writer
+    old, _writer = _writer, (_Writer(path) if path else None)
+    if old is not None:
+        old.close()
+
+
+class ContextExecutor(ThreadPoolExecutor):
+    """A ``ThreadPoolExecutor`` running each task in its submitter's context.
+
+    Spans opened in a plain executor's threads lose their parent and engine;
+    the executors this package creates use this one instead.
+    """
+
+    def submit(self, fn: Callable, *args: Any, **kwargs: Any) -> Any:  # type: ignore[override]
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def span(name: str, engine: Optional[str] = None, **attrs: Any) -> Any:
+    """A span covering a ``with`` block, nested in the current one."""
+    if _writer is None:
+        return NULL_SPAN
+    return Span(name, engine, attrs)
+
+
+def start(name: str, engine: Optional[str] = None, **attrs: Any) -> Any:
+    """A span ended explicitly with ``end()``; spans do not nest in it."""
+    return span(name, engine, **attrs)
+
+
+def traced(name: str, **attrs: Any) -> Callable[[F], F]:
+    """Decorator recording a span per call (a no-op while tracing is off)."""
+
+    def decorate(func: F) -> F:
+        # checked per call: tracing may be configured after the import
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if _writer is None:
+                return func(*args, **kwargs)
+            with Span(name, None, dict(attrs)):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+def load(path: str) -> list[dict]:
+    """Spans of a JSON lines or Chrome trace file, in a common shape."""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        text = text.strip().rstrip(",")
+        events = json.loads(text if text.endswith("]") else text + "]")
+        return [
+            {
+                "name": e["name"],
+                "start": e["ts"] / 1e6,
+                "dur": e["dur"] / 1e6,
+                "pid": e.get("pid"),
+                "thread": e.get("tid"),
+                **e.get("args", {}),
+            }
+            for e in events
+            if e.get("ph") == "X"
+        ]
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def summarize(spans: list[dict]) -> dict[str, dict[str, dict[str, float]]]:
+    """``{engine: {name: {count, total, self, <fetch phases>, bytes}}}``.
+
+    A span's self time is its duration minus that of the spans nested in it
+    on the same thread.
+    """
+    spans = sorted(spans, key=lambda s: (s.get("pid"), s.get("thread"), s["start"], -s["dur"]))
+    own = [s["dur"] for s in spans]
+    stack: list[int] = []
+    for i, s in enumerate(spans):
+        while stack and (
+            (spans[stack[-1]].get("pid"), spans[stack[-1]].get("thread"))
+            != (s.get("pid"), s.get("thread"))
+            or spans[stack[-1]]["start"] + spans[stack[-1]]["dur"] <= s["start"]
+        ):
+            stack.pop()
+        if stack:
+            own[stack[-1]] -= s["dur"]
+        stack.append(i)
+
+    table: dict[str, dict[str, dict[str, float]]] = defaultdict(
+        lambda: defaultdict(lambda: defaultdict(float))
+    )
+    for s, self_time in zip(spans, own):
+        row = table[s.get("engine") or "?"][s["name"]]
+        row["count"] += 1
+        row["total"] += s["dur"]
+        row["self"] += max(self_time, 0.0)
+        for key in PHASES + ("bytes",):
+            if isinstance(s.get(key), (int, float)):
+                row[key] += s[key]
+    return table
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Summarise a QBT_TRACE file.")
+    parser.add_argument("trace", help="JSON lines or Chrome trace file")
+    args = parser.parse_args(argv)
+
+    for engine, names in sorted(summarize(load(args.trace)).items()):
+        print(engine)
+        for name, row in sorted(names.items(), key=lambda item: -item[1]["self"]):
+            line = (f"  {name:<10} {int(row['count']):>5}x  total {row['total']:8.3f}s"
+                    f"  self {row['self']:8.3f}s")
+            phases = [f"{key} {row[key]:.3f}" for key in PHASES if row.get(key)]
+            if phases:
+                line += "  (" + ", ".join(phases) + ")"
+            if row.get("bytes"):
+                line += f"  {int(row['bytes'])} B"
+            print(line)
+    return 0
+
+
+configure(os.environ.get("QBT_TRACE"))
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+if "pytest" in sys.modules:
+    from pathlib import Path
+
+    import pytest
+
+    @pytest.fixture
+    def trace_file(tmp_path: Path) -> Any:
+        def start_tracing(name: str = "trace.jsonl") -> Path:
+            path = tmp_path / name
+            configure(str(path))
+            return path
+
+        saved = _writer
+        yield start_tracing
+        configure(None)
+        globals()["_writer"] = saved
+
+    @pytest.mark.parametrize("name", ["trace.jsonl", "trace.json"])
+    def test_spans_are_written_and_loaded(trace_file: Callable[[str], Path], name: str) -> None:
+        path = trace_file(name)
+        with span("search", engine="demo", query="q"):
+            with span("fetch", url="https://a.test/", bytes=512, ttfb=0.25) as fetch:
+                fetch.set(status=200)
+            page = start("page")
+            page.end(rows=3)
+            page.end(rows=4)
+        configure(None)
+        if name.endswith(".json"):
+            assert path.read_text().startswith("[\n")
+        spans = {s["name"]: s for s in load(str(path))}
+        assert set(spans) == {"search", "fetch", "page"}
+        assert {s["engine"] for s in spans.values()} == {"demo"}
+        assert spans["fetch"]["status"] == 200 and spans["fetch"]["bytes"] == 512
+        assert spans["page"]["rows"] == 3
+        assert spans["search"]["query"] == "q"
+        assert spans["search"]["dur"] >= spans["fetch"]["dur"]
+
+    def test_summary_counts_self_time_per_thread() -> None:
+        spans = [
+            {"name": "search", "engine": "a", "start": 0.0, "dur": 1.0, "pid": 1, "thread": 1},
+            {"name": "fetch", "engine": "a", "start": 0.2, "dur": 0.3, "pid": 1, "thread": 1,
+             "ttfb": 0.1, "body": 0.2, "bytes": 100},
+            {"name": "fetch", "engine": "a", "start": 0.6, "dur": 0.2, "pid": 1, "thread": 1,
+             "ttfb": 0.05, "bytes": 50},
+            # overlaps the search, but on another thread
+            {"name": "fetch", "engine": "a", "start": 0.1, "dur": 0.5, "pid": 1, "thread": 2},
+            {"name": "parse", "start": 0.0, "dur": 0.1, "pid": 2, "thread": 1},
+        ]
+        table = summarize(spans)
+        assert table["a"]["search"]["self"] == pytest.approx(0.5)
+        fetch = table["a"]["fetch"]
+        assert fetch["count"] == 3 and fetch["total"] == pytest.approx(1.0)
+        assert fetch["self"] == pytest.approx(1.0)
+        assert fetch["ttfb"] == pytest.approx(0.15) and fetch["body"] == pytest.approx(0.2)
+        assert fetch["bytes"] == 150
+        assert table["?"]["parse"]["count"] == 1
+
+    def test_traced_follows_tracing_turned_on_later(trace_file: Callable[[str], Path]) -> None:
+        @traced("step", kind="demo")
+        def step(x: int) -> int:
+            return x + 1
+
+        assert step(1) == 2
+        path = trace_file("trace.jsonl")
+        assert step(2) == 3
+        configure(None)
+        assert step(3) == 4
+        assert [(s["name"], s["kind"]) for s in load(str(path))] == [("step", "demo")]
+
+    def test_context_reaches_package_executors_only(trace_file: Callable[[str], Path]) -> None:
+        path = trace_file("trace.jsonl")
+
+        def page(pool: str) -> None:
+            with span("page", pool=pool):
+                pass
+
+        with span("search", engine="demo") as search:
+            with ContextExecutor(2) as executor:
+                executor.submit(page, "package").result()
+            with ThreadPoolExecutor(2) as executor:
+                executor.submit(page, "engine").result()
+        configure(None)
+        pages = {s["pool"]: s for s in load(str(path)) if s["name"] == "page"}
+        assert pages["package"]["parent"] == search.id
+        assert pages["engine"]["parent"] is None
+        # named after the only search running
+        assert pages["engine"]["engine"] == "demo"
+
+    def test_main_prints_a_summary(tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+        path = tmp_path / "trace.jsonl"
+        path.write_text(
+            json.dumps({"name": "fetch", "engine": "demo", "start": 0, "dur": 0.5,
+                        "pid": 1, "thread": 1, "ttfb": 0.2, "bytes": 2048}) + "\n"
+        )
+        assert main([str(path)]) == 0
+        out = capsys.readouterr().out.splitlines()
+        assert out[0] == "demo"
+        assert out[1].split()[:2] == ["fetch", "1x"]
+        assert "(ttfb 0.200)" in out[1] and out[1].endswith("2048 B")